@@ -6,9 +6,12 @@ import time
 # MQTT 配置
 mqtt_broker = "broker.emqx.io"  # MQTT broker
 mqtt_port = 1883
+mqtt_max_inflight = 100  # 同時等待 PUBACK 的訊息數
+mqtt_publish_timeout = 10  # 等待 broker 確認的秒數
 
 # API 配置
-api_url = "http://127.0.0.1:5000/record"
+anomaly_api_url = "http://127.0.0.1:5000/record/anomalies"
+log_api_url = "http://127.0.0.1:5000/record/logs"
 
 # 處理異常紀錄
 
@@ -58,10 +61,11 @@ def check_attendance_anomalies(start_time, end_time):
         "time_start": start_time,
         "time_end": end_time
     }
-    response = requests.get(f"{api_url}", json=payload)
+    # 每位員工最早上班 / 最晚下班時間已在資料庫端彙總好
+    response = requests.post(anomaly_api_url, json=payload)
     if response.status_code == 200:
         data = response.json()
-        anomalies = data.get('data', [])  # 打卡紀錄
+        summary = data.get('data', [])  # 有打卡的員工
         user_list = data.get('accounts', [])  # 所有employee和對應的boss
     else:
         print(f"Failed to fetch data: {response.text}")
@@ -69,51 +73,66 @@ def check_attendance_anomalies(start_time, end_time):
 
     user_to_boss = user_list
     result = {}
-    # 整理一下，留下最早的上班紀錄和最晚的下班記錄
-    for record in anomalies:
-        user_id = record['user_id']
-        r_type = record['type']
-        r_time = record['time']
-
-        if user_id not in result:
-            result[user_id] = {'i': None, 'o': None}
-
-        if r_type == 'i':
-            if result[user_id]['i'] is None or r_time < result[user_id]['i']:
-                result[user_id]['i'] = r_time
-        elif r_type == 'o':
-            if result[user_id]['o'] is None or r_time > result[user_id]['o']:
-                result[user_id]['o'] = r_time
+    # 留下最早的上班紀錄和最晚的下班記錄
+    for record in summary:
+        result[record['user_id']] = {
+            'i': record['first_in'],
+            'o': record['last_out']
+        }
     return result, user_to_boss
 
 
 def send_warning(warning, user_to_boss):
-    client = mqtt.Client()
+    if not warning:
+        return
+    # employee -> boss，不用每筆警告都掃一次 user_to_boss
+    boss_of = {u['employee']: u['boss'] for u in user_to_boss}
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.max_inflight_messages_set(mqtt_max_inflight)
     client.connect(mqtt_broker, mqtt_port)
+    client.loop_start()  # 背景 thread 處理 QoS 1 的 PUBACK，publish 不用一筆一筆等
+
+    published = []
+    logs = []
+    timestamp = time.time()
     for user in warning:
         user_id = user['user_id']
-        # find the boss id
-        for u in user_to_boss:
-            if u['employee'] == user_id:
-                boss_id = u['boss']
-                break
+        boss_id = boss_of.get(user_id)
         reason = user['type']
         # 每個員工都有自己獨立的topic，員工只需要訂閱自己的topic即可，老闆需要訂閱所有人的topic : warning/boss_id/#
-        client.publish(f"warning/{boss_id}/{user_id}", reason, retain=True)
-        print(f"已發送{user_id}的警告--{reason}")
-        timestamp = time.time()
-        payload = {
+        info = client.publish(
+            f"warning/{boss_id}/{user_id}", reason, qos=1, retain=True)
+        published.append((user_id, reason, info))
+        logs.append({
             "user_id": user_id,
-            "type": user['type'],
+            "type": reason,
             "time": timestamp,
             "duration": user['duration']
-        }
-        response = requests.post(api_url, json=payload)  # 把異常紀錄存到DB裡面
-        if response.status_code == 201:
-            print(f"已記錄 {user_id} {user['type']} 的異常紀錄")
+        })
+
+    # 一次把所有異常紀錄存到DB裡面
+    response = requests.post(log_api_url, json={"logs": logs})
+    if response.status_code == 201:
+        print(f"已記錄 {len(logs)} 筆異常紀錄")
+    else:
+        print(f"Fail : {response.text}")
+
+    # 等待 broker 確認 (QoS 1)
+    failed = 0
+    for user_id, reason, info in published:
+        try:
+            info.wait_for_publish(timeout=mqtt_publish_timeout)
+        except (ValueError, RuntimeError) as e:
+            print(f"{user_id}的警告發送失敗: {e}")
+        if info.is_published():
+            print(f"已發送{user_id}的警告--{reason}")
         else:
-            print(f"Fail : {response.text}")
+            failed += 1
+    if failed:
+        print(f"{failed} 筆警告未收到 broker 確認")
 
+    client.loop_stop()
     client.disconnect()
 
 
@@ -1,14 +1,31 @@
 # all the APIs
 # merged by: 113791012
 import json
-from flask import Flask, request, jsonify
+import logging
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import psycopg2
 import psycopg2.extras
 import time
 import hashlib
+import threading
 from functools import wraps
+from itertools import islice
 import requests
+from db_pool import create_pool
+from token_cache import TokenCache, TokenInvalidationFeed
+from replication import ReplicationQueue, op, values_op
+from failover import FailoverController
+from statements import STATEMENTS
+from metrics import METRICS, SharedMetrics
+from attendance import (day_of, query_attendance_rows, rollup_insert_query,
+                        validate_batch_records)
+from partitions import PartitionMaintainer
+from archive import ArchiveReader
+from org_hierarchy import BUMP_VERSION_QUERY, MAX_DEPTH as MAX_REPORTING_DEPTH, OrgHierarchy
+from structured_logging import REQUEST_ID, new_request_id, setup_logging
+from pagination import (STREAM_FETCH_SIZE, build_record_query, encode_cursor,
+                        is_paged_request, merge_archived, parse_page_args)
 
 
 FLAG = False  # set to True if you want to use the backup database
@@ -33,67 +50,193 @@ CONFIG = {
     'dbUser': 'yugabyte',
     'dbPassword': 'yugabyte',
     'sslMode': '',
-    'sslRootCert': ''
+    'sslRootCert': '',
+    # connection pool settings (shared by the main and backup pools)
+    'poolMinSize': 2,
+    'poolMaxSize': 20,
+    'poolTimeout': 5,                # seconds to wait for a free connection
+    'poolMaxIdle': 300,              # close connections idle longer than this
+    'poolHealthCheckInterval': 30,   # SELECT 1 before reusing an older idle connection
+    # access token validation cache
+    'tokenCacheSize': 10000,
+    'tokenCacheTTL': 300,            # seconds before a cached token is re-checked in the DB
+    # other workers / servers rotate tokens too: their changes are polled from Author,
+    # and the cache is bypassed when the poll has not succeeded for this many seconds
+    'tokenInvalidationInterval': 1,
+    'tokenCacheMaxStaleness': 5,
+    # asynchronous replication to the backup cluster
+    'replicationLog': 'access_control_system/replication.wal',
+    'replicationBatchSize': 100,
+    'replicationFsync': True,
+    # circuit breaker / health probes for main <-> backup failover
+    'probeInterval': 5,              # seconds between health probes of each cluster
+    'probeTimeout': 3,
+    'failureThreshold': 3,           # consecutive failures before the circuit opens
+    'circuitResetTimeout': 30,       # seconds before an open circuit lets a trial request through
+    # JSON-lines logging, written by a background thread
+    'logLevel': 'INFO',              # DEBUG also logs every successful connection / token check
+    'logFile': '',                   # e.g. 'access_control_system/api.log', '' = stdout only
+    # monthly Record / Log partitions (partitions.py), kept ahead by one worker
+    'partitionCheckInterval': 3600,  # seconds between partition maintenance runs
+    'partitionMonthsAhead': 3,
+    'partitionRetentionMonths': {'Record': 0, 'Log': 0},  # months kept, 0 = keep forever
+    'partitionRetentionAction': 'detach',                 # 'detach' or 'drop'
+    # in-memory boss -> subordinates index (org_hierarchy.py)
+    'orgPollInterval': 2,            # seconds between OrgVersion checks (changes by other workers)
+    'orgReloadInterval': 60,         # full reload anyway (changes made outside api.py)
+    'orgReportingDepth': 1,          # levels a boss can see: 1 = direct reports, 0 = whole chain
+    # pre-forked workers (serve.py) publish their counters here so /metrics shows all of them
+    'metricsDir': 'access_control_system/metrics',
 }
 
-# get the database connection
+setup_logging(CONFIG['logLevel'], CONFIG['logFile'])
+log = logging.getLogger('access_control.api')
+
+TOKEN_EXPIRATION = 3600  # 1 hour expiration time
+
+MAIN_POOL = BACKUP_POOL = REPLICATION = TOKEN_CACHE = TOKEN_FEED = FAILOVER = PARTITIONS = ORG = None
+SHARED_METRICS = None
+_WORKER_READY = False
+_WORKER_LOCK = threading.Lock()
+
+# months moved to Parquet by archive.py, read back for old time ranges
+ARCHIVE = ArchiveReader()
+
+
+def replication_log_path(worker_slot=None):
+    # every pre-forked worker needs its own write-ahead log, slot 0 keeps the plain name
+    if not worker_slot:
+        return CONFIG['replicationLog']
+    return f"{CONFIG['replicationLog']}.{worker_slot}"
+
+
+def init_worker(worker_slot=None):
+    """
+    建立這個 process 自己的連線池、複寫佇列、token cache 與 failover controller
+    serve.py 的每個 worker 在 fork 之後呼叫 (連線與 replication log 不能跨 process 共用)；
+    其他情況 (api.py / waitress) 由第一個 request 呼叫 (ensure_worker)，import 時不會建立任何東西
+    """
+    global MAIN_POOL, BACKUP_POOL, REPLICATION, TOKEN_CACHE, TOKEN_FEED, FAILOVER, PARTITIONS, ORG
+    global SHARED_METRICS, _WORKER_READY
+
+    # connection pools, shared by all request threads
+    MAIN_POOL = create_pool('main', CONFIG)
+    BACKUP_POOL = create_pool('backup', CONFIG, host=BACKUPHOST, port=BACKUPPORT)
+
+    # writes mirrored to the backup cluster are queued and applied by a background worker
+    REPLICATION = ReplicationQueue(
+        BACKUP_POOL, replication_log_path(worker_slot),
+        batch_size=CONFIG['replicationBatchSize'], fsync=CONFIG['replicationFsync'])
+
+    # (user_id, access_token) -> created_at, so steady-state authorization needs no DB round trip
+    TOKEN_CACHE = TokenCache(
+        max_size=CONFIG['tokenCacheSize'], ttl=CONFIG['tokenCacheTTL'],
+        max_staleness=CONFIG['tokenCacheMaxStaleness'])
+    # drops tokens rotated by other processes; the cache is only used while this keeps up
+    TOKEN_FEED = TokenInvalidationFeed(TOKEN_CACHE, interval=CONFIG['tokenInvalidationInterval'])
+
+    # time every query of a request (DB time vs. app time on /metrics)
+    MAIN_POOL.cursor_wrapper = METRICS.timed_cursor
+    BACKUP_POOL.cursor_wrapper = METRICS.timed_cursor
+
+    # route requests to the healthy cluster without paying a connect timeout per request
+    FAILOVER = FailoverController(
+        {'main': MAIN_POOL, 'backup': BACKUP_POOL},
+        probe_interval=CONFIG['probeInterval'], probe_timeout=CONFIG['probeTimeout'],
+        failure_threshold=CONFIG['failureThreshold'], reset_timeout=CONFIG['circuitResetTimeout'])
+
+    # boss -> subordinates, so boss authorization and subordinate checks need no query
+    ORG = OrgHierarchy(
+        {'main': MAIN_POOL, 'backup': BACKUP_POOL},
+        reload_interval=CONFIG['orgReloadInterval'], depth=CONFIG['orgReportingDepth'],
+        poll_interval=CONFIG['orgPollInterval'])
+
+    # future partitions / retention: DDL from one process is enough, other workers skip it
+    PARTITIONS = None
+    if not worker_slot:
+        PARTITIONS = PartitionMaintainer(
+            {'main': MAIN_POOL, 'backup': BACKUP_POOL},
+            interval=CONFIG['partitionCheckInterval'],
+            months_ahead=CONFIG['partitionMonthsAhead'],
+            retention=CONFIG['partitionRetentionMonths'],
+            action=CONFIG['partitionRetentionAction'])
+
+    # a single process renders its own metrics, pre-forked workers share theirs
+    SHARED_METRICS = None
+    if worker_slot is not None:
+        SHARED_METRICS = SharedMetrics(METRICS, CONFIG['metricsDir'], worker_slot)
+    _WORKER_READY = True
+
+
+def ensure_worker():
+    # not done at import: under gunicorn preload_app the master imports this module,
+    # and anything opened here would be inherited by every forked worker
+    if _WORKER_READY:
+        return
+    with _WORKER_LOCK:
+        if not _WORKER_READY:
+            init_worker()
+
+# get the database connection (from the pool, close() gives it back)
+# raises CircuitOpenError at once while the main cluster is down, so callers fall back immediately
 
 
 def get_db_connection():
-    return psycopg2.connect(
-        host=CONFIG['host'],
-        port=CONFIG['port'],
-        database=CONFIG['dbName'],
-        user=CONFIG['dbUser'],
-        password=CONFIG['dbPassword'],
-        sslrootcert=CONFIG['sslRootCert'])
+    with METRICS.acquire_timer('main'):
+        return FAILOVER.getconn('main')
 
-# get the backup database connection
+# background readers: main if it is up, otherwise backup (no warning per call)
+
+
+def get_any_db_connection():
+    try:
+        return FAILOVER.getconn('main')
+    except Exception:
+        return FAILOVER.getconn('backup')
+
+# get the backup database connection (from the pool, close() gives it back)
 
 
 def get_backup_db_connection():
-    print("Using Backup YugabyteDB")
-    return psycopg2.connect(
-        host=BACKUPHOST,
-        port=BACKUPPORT,
-        database=CONFIG['dbName'],
-        user=CONFIG['dbUser'],
-        password=CONFIG['dbPassword'],
-        sslrootcert=CONFIG['sslRootCert'])
+    log.warning("Using Backup YugabyteDB")
+    with METRICS.acquire_timer('backup'):
+        return FAILOVER.getconn('backup')
 
 
 def authorization(access_token, user_id):  # authirization main function
+    # check the token cache first
+    token_time = TOKEN_CACHE.get(user_id, access_token)
+    if token_time is not None:
+        if time.time() - token_time > TOKEN_EXPIRATION:
+            return "Expired"
+        return "Valid"
+
     # Connect to the database
     try:
         conn = get_db_connection()
 
     except Exception as e:
-        print("Exception while connecting to Main YugabyteDB")
-        print(e)
+        log.warning("Exception while connecting to Main YugabyteDB: %s", e)
         try:
             conn = get_backup_db_connection()
         except Exception as e:
-            print("Exception while connecting to Backup YugabyteDB")
-            print(e)
+            log.warning("Exception while connecting to Backup YugabyteDB: %s", e)
             return None
 
-    print(">>>> Successfully connected to YugabyteDB!")
+    log.debug("Successfully connected to YugabyteDB")
 
     # Create a cursor object using the connection
     cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
     # Execute a query to check if the access token is valid for the given user ID
-    query = """
-        SELECT * FROM Author WHERE access_token = %s AND user_id = %s
-    """
-    cursor.execute(query, (access_token, user_id))
+    STATEMENTS.execute(cursor, 'author_by_access_token', (access_token, user_id))
 
     # Fetch the result of the query
     result = cursor.fetchone()
 
     # check if the result is none
     if result is None:
-        print("Access token is invalid.")
+        log.info("Access token is invalid.", extra={'user_id': user_id})
         # Close the cursor and connection
         cursor.close()
         conn.close()
@@ -105,9 +248,12 @@ def authorization(access_token, user_id):  # authirization main function
     # get the time from the result
     token_time = result[3]  # the time is in the forth column
 
+    # remember the token so the next call does not hit the database
+    TOKEN_CACHE.put(user_id, access_token, token_time)
+
     # check if the token is expired
-    if current_time - token_time > 3600:  # 1 hour expiration time
-        print("Access token is expired.")
+    if current_time - token_time > TOKEN_EXPIRATION:
+        log.info("Access token is expired.", extra={'user_id': user_id})
         # Close the cursor and connection
         cursor.close()
         conn.close()
@@ -116,7 +262,7 @@ def authorization(access_token, user_id):  # authirization main function
     # Close the cursor and connection
     cursor.close()
     conn.close()
-    print("Access token is valid.")
+    log.debug("Access token is valid.")
     return "Valid"
 
 
@@ -124,20 +270,17 @@ def update_token(refresh_token, user_id):  # update the token function
     # Connect to the database
     try:
         conn = get_db_connection()
-        print(">>>> Successfully connected to YugabyteDB!")
+        log.debug("Successfully connected to YugabyteDB")
         # Create a cursor object using the connection
         cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
         # check if the refresh token is valid for the given user ID
-        query = """
-            SELECT * FROM Author WHERE refresh_token = %s AND user_id = %s
-        """
-        cursor.execute(query, (refresh_token, user_id))
+        STATEMENTS.execute(cursor, 'author_by_refresh_token', (refresh_token, user_id))
 
         # Fetch the result of the query
         result = cursor.fetchone()
         # check if the result is none
         if result is None:
-            print("Refresh token is invalid.")
+            log.info("Refresh token is invalid.", extra={'user_id': user_id})
             # Close the cursor and connection
             cursor.close()
             conn.close()
@@ -153,46 +296,36 @@ def update_token(refresh_token, user_id):  # update the token function
         update_query = """
             UPDATE Author SET access_token = %s, refresh_token = %s, created_at = %s WHERE user_id = %s
         """
-        # update in the backup database
-        try:
-            backup_conn = get_backup_db_connection()
-            backup_cursor = backup_conn.cursor(
-                cursor_factory=psycopg2.extras.DictCursor)
-            backup_cursor.execute(update_query, (new_access_token,
-                                                 new_refresh_token, time.time(), user_id))
-            backup_conn.commit()
-            backup_cursor.close()
-            backup_conn.close()
-            print("Backup successfully.")
-        except Exception as e:
-            print("Exception while updating in Backup YugabyteDB")
-            print(e)
+        created_at = time.time()
 
         cursor.execute(update_query, (new_access_token,
-                                      new_refresh_token, time.time(), user_id))
+                                      new_refresh_token, created_at, user_id))
         conn.commit()
+        # update in the backup database (asynchronously)
+        REPLICATION.enqueue([op(update_query, (new_access_token,
+                                               new_refresh_token, created_at, user_id))])
+        # the old access token is gone, cache the new one (write-through)
+        TOKEN_CACHE.invalidate_user(user_id)
+        TOKEN_CACHE.put(user_id, new_access_token, created_at)
         # Close the cursor and connection
         cursor.close()
         conn.close()
-        print("Access token and refresh token updated successfully.")
+        log.info("Access token and refresh token updated successfully.", extra={'user_id': user_id})
         return {"new_access_token": new_access_token, "new_refresh_token": new_refresh_token}
 
     except Exception as e:
         conn = get_backup_db_connection()
-        print(">>>> Successfully connected to YugabyteDB!")
+        log.debug("Successfully connected to YugabyteDB")
         # Create a cursor object using the connection
         cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
         # check if the refresh token is valid for the given user ID
-        query = """
-            SELECT * FROM Author WHERE refresh_token = %s AND user_id = %s
-        """
-        cursor.execute(query, (refresh_token, user_id))
+        STATEMENTS.execute(cursor, 'author_by_refresh_token', (refresh_token, user_id))
 
         # Fetch the result of the query
         result = cursor.fetchone()
         # check if the result is none
         if result is None:
-            print("Refresh token is invalid.")
+            log.info("Refresh token is invalid.", extra={'user_id': user_id})
             # Close the cursor and connection
             cursor.close()
             conn.close()
@@ -208,15 +341,18 @@ def update_token(refresh_token, user_id):  # update the token function
         update_query = """
             UPDATE Author SET access_token = %s, refresh_token = %s, created_at = %s WHERE user_id = %s
         """
-        # update in the backup database
+        created_at = time.time()
 
         cursor.execute(update_query, (new_access_token,
-                                      new_refresh_token, time.time(), user_id))
+                                      new_refresh_token, created_at, user_id))
         conn.commit()
+        # the old access token is gone, cache the new one (write-through)
+        TOKEN_CACHE.invalidate_user(user_id)
+        TOKEN_CACHE.put(user_id, new_access_token, created_at)
         # Close the cursor and connection
         cursor.close()
         conn.close()
-        print("Access token and refresh token updated successfully.")
+        log.info("Access token and refresh token updated successfully.", extra={'user_id': user_id})
         return {"new_access_token": new_access_token, "new_refresh_token": new_refresh_token}
 
 
@@ -229,6 +365,46 @@ CORS(app, resources={r"/*": {
 }}, supports_credentials=True)
 
 
+@app.before_request
+def start_background_workers():
+    # started lazily, so the debug reloader's parent process never runs a worker
+    ensure_worker()
+    REPLICATION.start()
+    FAILOVER.start()
+    TOKEN_FEED.start(get_any_db_connection)
+    ORG.start()
+    if PARTITIONS is not None:
+        PARTITIONS.start()
+
+
+@app.before_request
+def assign_request_id():
+    # keep the caller's id so one action can be followed across services
+    REQUEST_ID.set(request.headers.get('X-Request-ID') or new_request_id())
+
+
+@app.before_request
+def start_request_timer():
+    METRICS.start_request()
+
+
+@app.after_request
+def record_request_metrics(response):
+    timers = METRICS.end_request()
+    if timers is not None:
+        total, db_time, acquire_time = timers
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        METRICS.observe('http_request_duration_seconds', total, method=request.method,
+                        route=route, status=response.status_code)
+        METRICS.observe('http_request_db_seconds', db_time, route=route)
+        METRICS.observe('http_request_app_seconds',
+                        max(total - db_time - acquire_time, 0.0), route=route)
+    if SHARED_METRICS is not None:
+        SHARED_METRICS.publish()
+    response.headers['X-Request-ID'] = REQUEST_ID.get() or ''
+    return response
+
+
 # finish backup database
 
 
@@ -261,7 +437,7 @@ def run_authorization():
         else:
             return jsonify({"result": "Valid"}), 200
     except Exception as e:
-        print(f"認證過程中發生錯誤: {e}")
+        log.exception("認證過程中發生錯誤: %s", e)
         return jsonify({"result": "Error", "message": str(e)}), 500
 
 
@@ -283,6 +459,107 @@ def run_update_token():
 # finish backup database
 
 
+def record_dict(row):
+    return {'user_id': row[0], 'type': row[1], 'time': row[2]}
+
+
+def fetch_record_page(conn, ts, te, user_id, after, limit, include_accounts, archived=()):
+    """查一頁打卡紀錄 (含已封存的月份 archived)，next_cursor 為 None 表示沒有下一頁"""
+    query, params = build_record_query(ts, te, user_id, after, limit)
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        rows = list(islice(merge_archived(cur.fetchall(), archived, after), limit + 1))
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        result = {
+            'status': 'success',
+            'data': [record_dict(r) for r in rows],
+            'next_cursor': encode_cursor(rows[-1]) if has_more else None
+        }
+        # 第一頁才附上所有 account
+        if include_accounts and after is None:
+            cur.execute('SELECT account,boss_id FROM employeeaccount')
+            result['accounts'] = [{"employee": r[0], "boss": r[1]}
+                                  for r in cur.fetchall()]
+    return result
+
+
+def stream_records(ts, te, user_id, after, archived=()):
+    """
+    NDJSON (一行一筆) 串流回傳打卡紀錄，已封存的月份 (archived) 依序穿插
+    使用 server-side named cursor，每次只從資料庫取 STREAM_FETCH_SIZE 筆，記憶體用量固定
+    """
+    query, params = build_record_query(ts, te, user_id, after)
+    try:
+        conn = get_db_connection()
+    except Exception as e:
+        log.warning("Exception while connecting to Main YugabyteDB: %s", e)
+        conn = get_backup_db_connection()
+
+    def generate():
+        try:
+            with conn.cursor(name='record_stream') as cur:
+                cur.itersize = STREAM_FETCH_SIZE
+                cur.execute(query, params)
+                # iterating a named cursor fetches itersize rows per round trip
+                merged = merge_archived(cur, archived, after)
+                while True:
+                    rows = list(islice(merged, STREAM_FETCH_SIZE))
+                    if not rows:
+                        break
+                    yield ''.join(json.dumps(record_dict(r)) + '\n' for r in rows)
+        except Exception as e:
+            log.exception("串流查詢失敗: %s", e)
+            yield json.dumps({'error': str(e)}) + '\n'
+        finally:
+            conn.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def paged_records_response(data, ts, te, user_id=None, include_accounts=False):
+    """
+    分頁 (limit + cursor) 或串流 (stream: true) 查詢打卡紀錄
+    分頁使用 keyset (time, user_id, type)，不論第幾頁都是一次 index seek
+    """
+    try:
+        limit, after, stream = parse_page_args(data)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    # months moved to Parquet by archive.py are merged into the keyset order
+    try:
+        archived = ARCHIVE.records('Record', ts, te, user_id=user_id)
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': f'封存資料讀取失敗: {str(e)}'}), 500
+
+    if stream:
+        try:
+            return stream_records(ts, te, user_id, after, archived)
+        except Exception as e:
+            return jsonify({'status': 'error', 'message': f'查詢失敗: {str(e)}'}), 500
+
+    try:
+        conn = get_db_connection()
+        try:
+            return jsonify(fetch_record_page(conn, ts, te, user_id, after, limit,
+                                             include_accounts, archived)), 200
+        finally:
+            conn.close()
+    except Exception as e:
+        log.warning("Exception while querying from Main YugabyteDB: %s", e)
+        try:
+            backup_conn = get_backup_db_connection()
+            try:
+                return jsonify(fetch_record_page(backup_conn, ts, te, user_id, after, limit,
+                                                 include_accounts, archived)), 200
+            finally:
+                backup_conn.close()
+        except Exception as backup_error:
+            return jsonify({'status': 'error',
+                            'message': f'查詢失敗: {str(e)}, 備份查詢也失敗: {str(backup_error)}'}), 500
+
+
 @app.route('/record', methods=['GET', 'POST'])
 def record_handler():
     if request.method == 'GET':
@@ -297,16 +574,17 @@ def record_handler():
         if not isinstance(ts, (int, float)) or not isinstance(te, (int, float)):
             return jsonify({'error': 'time_start 與 time_end 必須為數字'}), 400
 
+        # 分頁 / 串流模式
+        if is_paged_request(data):
+            return paged_records_response(data, ts, te, include_accounts=True)
+
         try:
             conn = get_db_connection()
             cur = conn.cursor()
 
             # 原本 Record 表的查詢
             # sorting by time
-            cur.execute(
-                'SELECT user_id, type, time FROM Record WHERE time >= %s AND time <= %s ORDER BY time DESC',
-                (ts, te)  # time_start, time_end
-            )
+            STATEMENTS.execute(cur, 'record_range', (ts, te))
             rows = cur.fetchall()
             record_data = [
                 {'user_id': r[0], 'type': r[1], 'time': r[2]}
@@ -327,16 +605,12 @@ def record_handler():
             })
         except Exception as e:
             # using backup database
-            print("Exception while inserting into Main YugabyteDB")
-            print(e)
+            log.warning("Exception while inserting into Main YugabyteDB: %s", e)
             try:
                 backup_conn = get_backup_db_connection()
                 backup_cur = backup_conn.cursor()
                 # sorting by time
-                backup_cur.execute(
-                    'SELECT user_id, type, time FROM Record WHERE time >= %s AND time <= %s ORDER BY time DESC',
-                    (ts, te)  # time_start, time_end
-                )
+                STATEMENTS.execute(backup_cur, 'record_range', (ts, te))
                 rows = backup_cur.fetchall()
                 record_data = [
                     {'user_id': r[0], 'type': r[1], 'time': r[2]}
@@ -357,8 +631,7 @@ def record_handler():
                     'accounts': accounts
                 })
             except Exception as e:
-                print("Exception while inserting into Backup YugabyteDB")
-                print(e)
+                log.warning("Exception while inserting into Backup YugabyteDB: %s", e)
                 return jsonify({'error': str(e)}), 500
 
     else:  # POST
@@ -379,27 +652,17 @@ def record_handler():
                 'INSERT INTO Log (user_id, type, time, duration) VALUES (%s, %s, %s, %s)',
                 (uid, typ, tm, dur)
             )
-            # backup database
-            try:
-                backup_conn = get_backup_db_connection()
-                backup_cur = backup_conn.cursor()
-                backup_cur.execute(
-                    'INSERT INTO Log (user_id, type, time, duration) VALUES (%s, %s, %s, %s)',
-                    (uid, typ, tm, dur)
-                )
-                backup_conn.commit()
-                backup_conn.close()
-                print("Backup successfully.")
-            except Exception as e:
-                print("Exception while inserting into Backup YugabyteDB")
-                print(e)
             conn.commit()
             conn.close()
+            # backup database (asynchronously)
+            REPLICATION.enqueue([op(
+                'INSERT INTO Log (user_id, type, time, duration) VALUES (%s, %s, %s, %s)',
+                (uid, typ, tm, dur)
+            )])
             return jsonify({'status': 'success'}), 201
         except Exception as e:
             # using backup database
-            print("Exception while inserting into Main YugabyteDB")
-            print(e)
+            log.warning("Exception while inserting into Main YugabyteDB: %s", e)
             try:
                 backup_conn = get_backup_db_connection()
                 backup_cur = backup_conn.cursor()
@@ -409,23 +672,141 @@ def record_handler():
                 )
                 backup_conn.commit()
                 backup_conn.close()
-                print("Write in Backup Database successfully.")
+                log.info("Write in Backup Database successfully.")
                 return jsonify({'status': 'success'}), 201
             except Exception as e:
-                print("Exception while inserting into Backup YugabyteDB")
-                print(e)
+                log.warning("Exception while inserting into Backup YugabyteDB: %s", e)
                 return jsonify({'error': str(e)}), 500
 
 # finish backup database
 
 
+LOG_BATCH_INSERT_QUERY = """
+    INSERT INTO Log (user_id, type, time, duration)
+    VALUES %s
+    ON CONFLICT DO NOTHING
+"""
+
+
+def insert_batch_logs(conn, rows):
+    # one multi-row INSERT for the whole batch
+    with conn.cursor() as cursor:
+        psycopg2.extras.execute_values(
+            cursor, LOG_BATCH_INSERT_QUERY, rows, page_size=len(rows))
+    conn.commit()
+
+
+@app.route('/record/logs', methods=['POST'])
+def record_logs_batch():
+    """
+    批次寫入異常紀錄 (給 access_control_system.py)
+    需要提供 logs: [{user_id, type, time, duration}, ...]
+    """
+    data = request.get_json(silent=True) or {}
+    logs = data.get('logs')
+    if not isinstance(logs, list):
+        return jsonify({'error': '請提供 logs 陣列'}), 400
+    if not logs:
+        return jsonify({'status': 'success', 'inserted': 0}), 201
+
+    rows = []
+    for entry in logs:
+        if not isinstance(entry, dict):
+            return jsonify({'error': '請提供 user_id, type, time, duration'}), 400
+        uid = entry.get('user_id')
+        typ = entry.get('type')
+        tm = entry.get('time')
+        dur = entry.get('duration')
+        if uid is None or typ is None or tm is None or dur is None:
+            return jsonify({'error': '請提供 user_id, type, time, duration'}), 400
+        rows.append((uid, typ, tm, dur))
+
+    try:
+        conn = get_db_connection()
+        try:
+            insert_batch_logs(conn, rows)
+        finally:
+            conn.close()
+        # backup database (asynchronously)
+        REPLICATION.enqueue([values_op(LOG_BATCH_INSERT_QUERY, rows)])
+        return jsonify({'status': 'success', 'inserted': len(rows)}), 201
+    except Exception as e:
+        # using backup database
+        log.warning("Exception while inserting into Main YugabyteDB: %s", e)
+        try:
+            backup_conn = get_backup_db_connection()
+            try:
+                insert_batch_logs(backup_conn, rows)
+            finally:
+                backup_conn.close()
+            log.info("Write in Backup Database successfully.")
+            return jsonify({'status': 'success', 'inserted': len(rows)}), 201
+        except Exception as e:
+            log.warning("Exception while inserting into Backup YugabyteDB: %s", e)
+            return jsonify({'error': str(e)}), 500
+
+
+def query_attendance_summary(cursor, ts, te):
+    """
+    每位員工在時間區間內最早的上班 (i) 與最晚的下班 (o) 時間
+    完整的日期讀 DailyAttendance，每人每天一筆；沒有打卡的員工 punch_count 為 0
+    """
+    summary = [
+        {'user_id': r[0], 'boss': r[1], 'first_in': r[2],
+         'last_out': r[3], 'punch_count': r[4]}
+        for r in query_attendance_rows(cursor, ts, te)
+    ]
+    return {
+        'status': 'success',
+        'data': [u for u in summary if u['punch_count'] > 0],
+        'absent': [{'employee': u['user_id'], 'boss': u['boss']}
+                   for u in summary if u['punch_count'] == 0],
+        'accounts': [{'employee': u['user_id'], 'boss': u['boss']}
+                     for u in summary]
+    }
+
+
+@app.route('/record/anomalies', methods=['POST'])
+def attendance_anomalies():
+    """
+    出勤異常檢查用的彙總資料 (給 access_control_system.py)
+    需要提供 time_start, time_end
+    """
+    data = request.get_json(silent=True) or {}
+    ts = data.get('time_start')
+    te = data.get('time_end')
+    if not isinstance(ts, (int, float)) or not isinstance(te, (int, float)):
+        return jsonify({'error': 'time_start 與 time_end 必須為數字'}), 400
+
+    try:
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cur:
+                return jsonify(query_attendance_summary(cur, ts, te)), 200
+        finally:
+            conn.close()
+    except Exception as e:
+        # using backup database
+        log.warning("Exception while querying from Main YugabyteDB: %s", e)
+        try:
+            backup_conn = get_backup_db_connection()
+            try:
+                with backup_conn.cursor() as backup_cur:
+                    return jsonify(query_attendance_summary(backup_cur, ts, te)), 200
+            finally:
+                backup_conn.close()
+        except Exception as e:
+            log.warning("Exception while querying from Backup YugabyteDB: %s", e)
+            return jsonify({'error': str(e)}), 500
+
+
 @app.route('/salary/logs', methods=['POST'])  # 查詢日誌
 def get_salary_logs():
     # get query parameters from request
     data = request.get_json()
     start_time = data.get('start_time')
     end_time = data.get('end_time')
-    print(start_time, end_time)
+    log.debug("time range %s - %s", start_time, end_time)
     # find the data in log table between start_time and end_time
     if start_time and end_time:
         # if start_time and end_time are not float, return 400
@@ -455,8 +836,7 @@ def get_salary_logs():
         return jsonify(logs), 200
     except Exception as e:
         # using backup database
-        print("Exception while querying from Main YugabyteDB")
-        print(e)
+        log.warning("Exception while querying from Main YugabyteDB: %s", e)
         try:
             backup_conn = get_backup_db_connection()
             backup_cur = backup_conn.cursor()
@@ -470,8 +850,7 @@ def get_salary_logs():
             ]
             return jsonify(logs), 200
         except Exception as e:
-            print("Exception while querying from Backup YugabyteDB")
-            print(e)
+            log.warning("Exception while querying from Backup YugabyteDB: %s", e)
             return jsonify({"error": "Database error"}), 500
 
 # finish backup database
@@ -509,19 +888,10 @@ def update_salary():
                 'UPDATE salary SET salary = %s WHERE user_id = %s', (salary, user_id,))
             conn.commit()
             conn.close()
-            print("Salary updated successfully in Main YugabyteDB.")
-            # backup database
-            try:
-                backup_conn = get_backup_db_connection()
-                backup_cur = backup_conn.cursor()
-                backup_cur.execute(
-                    'UPDATE salary SET salary = %s WHERE user_id = %s', (salary, user_id,))
-                backup_conn.commit()
-                backup_conn.close()
-                print("Backup successfully.")
-            except Exception as e:
-                print("Exception while updating in Backup YugabyteDB")
-                print(e)
+            log.info("Salary updated successfully in Main YugabyteDB.")
+            # backup database (asynchronously)
+            REPLICATION.enqueue([op(
+                'UPDATE salary SET salary = %s WHERE user_id = %s', (salary, user_id,))])
         else:
             # insert new record
             conn = get_db_connection()
@@ -530,26 +900,16 @@ def update_salary():
                 'INSERT INTO salary (user_id, salary) VALUES (%s, %s)', (user_id, salary,))
             conn.commit()
             conn.close()
-            # backup database
-            try:
-                backup_conn = get_backup_db_connection()
-                backup_cur = backup_conn.cursor()
-                backup_cur.execute(
-                    'INSERT INTO salary (user_id, salary) VALUES (%s, %s)', (user_id, salary,))
-                backup_conn.commit()
-                backup_conn.close()
-                print("Backup successfully.")
-            except Exception as e:
-                print("Exception while updating in Backup YugabyteDB")
-                print(e)
+            # backup database (asynchronously)
+            REPLICATION.enqueue([op(
+                'INSERT INTO salary (user_id, salary) VALUES (%s, %s)', (user_id, salary,))])
 
-        print("Salary updated successfully in Main YugabyteDB.")
+        log.info("Salary updated successfully in Main YugabyteDB.")
         return jsonify({"message": "Salary updated successfully"}), 200
 
     except Exception as e:
         # using backup database
-        print("Exception while updating in Main YugabyteDB")
-        print(e)
+        log.warning("Exception while updating in Main YugabyteDB: %s", e)
         try:
             backup_conn = get_backup_db_connection()
             backup_cur = backup_conn.cursor()
@@ -565,24 +925,164 @@ def update_salary():
                     'UPDATE salary SET salary = %s WHERE user_id = %s', (salary, user_id,))
                 backup_conn.commit()
                 backup_conn.close()
-                print("Using Backup successfully.")
+                log.info("Using Backup successfully.")
             else:
                 # insert new record
                 curss.execute(
                     'INSERT INTO salary (user_id, salary) VALUES (%s, %s)', (user_id, salary,))
                 backup_conn.commit()
                 backup_conn.close()
-                print("Using Backup successfully.")
+                log.info("Using Backup successfully.")
             return jsonify({"message": "Salary updated successfully"}), 200
 
         except Exception as e:
-            print("Exception while updating in Backup YugabyteDB")
-            print(e)
+            log.warning("Exception while updating in Backup YugabyteDB: %s", e)
             return jsonify({"error": "Database error"}), 500
 
 
 # finish backup database
 
+# 薪資調整規則 (與 salary.py 原本的逐筆計算相同)
+#   late:     每分鐘扣 10
+#   absent:   扣 300
+#   overtime: 每分鐘加 10 * 1.5
+PAYROLL_ADJUSTMENT_QUERY = """
+    UPDATE Salary s
+    SET salary = s.salary + a.adjustment
+    FROM (
+        SELECT user_id,
+               SUM(CASE type
+                       WHEN 'late' THEN -10 * duration / 60
+                       WHEN 'absent' THEN -300
+                       WHEN 'overtime' THEN 10 * 1.5 * duration / 60
+                       ELSE 0
+                   END) AS adjustment
+        FROM Log
+        WHERE time >= %s AND time < %s
+        GROUP BY user_id
+    ) a
+    WHERE s.user_id = a.user_id
+    RETURNING s.user_id, a.adjustment, s.salary
+"""
+
+PAYROLL_RUN_INSERT_QUERY = """
+    INSERT INTO PayrollRun (window_start, window_end, applied_at, users, total_adjustment)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT DO NOTHING
+"""
+
+# other windows sharing part of [start, end): their Log rows were already applied
+PAYROLL_OVERLAP_QUERY = """
+    SELECT window_start, window_end FROM PayrollRun
+    WHERE window_start < %s AND window_end > %s
+      AND NOT (window_start = %s AND window_end = %s)
+    ORDER BY window_start
+"""
+
+
+def apply_payroll(conn, start_time, end_time):
+    """
+    在同一個 transaction 內套用時間區間 [start_time, end_time) 的所有異常紀錄
+    PayrollRun 記錄已處理的區間，同一個區間重複呼叫不會重複扣款；
+    和已處理的區間部分重疊時不套用 (status 為 overlapping)，避免同一筆 Log 扣兩次
+    回傳 (summary, updated rows)；沒有套用時 updated rows 為 None
+    """
+    with conn.cursor() as cursor:
+        # claim the window first, a concurrent or repeated run finds the row and stops
+        cursor.execute(PAYROLL_RUN_INSERT_QUERY + " RETURNING window_start",
+                       (start_time, end_time, time.time(), 0, 0))
+        if cursor.fetchone() is None:
+            conn.rollback()
+            cursor.execute("""
+                SELECT applied_at, users, total_adjustment FROM PayrollRun
+                WHERE window_start = %s AND window_end = %s
+            """, (start_time, end_time))
+            run = cursor.fetchone()
+            return {
+                'status': 'already_applied',
+                'applied_at': run[0] if run else None,
+                'users': run[1] if run else 0,
+                'total_adjustment': run[2] if run else 0
+            }, None
+
+        cursor.execute(PAYROLL_OVERLAP_QUERY, (end_time, start_time, start_time, end_time))
+        overlaps = cursor.fetchall()
+        if overlaps:
+            conn.rollback()
+            return {
+                'status': 'overlapping',
+                'overlaps': [{'start_time': r[0], 'end_time': r[1]} for r in overlaps]
+            }, None
+
+        cursor.execute(PAYROLL_ADJUSTMENT_QUERY, (start_time, end_time))
+        updated = cursor.fetchall()
+        total = sum(r[1] for r in updated)
+        cursor.execute("""
+            UPDATE PayrollRun SET users = %s, total_adjustment = %s
+            WHERE window_start = %s AND window_end = %s
+        """, (len(updated), total, start_time, end_time))
+    conn.commit()
+    return {
+        'status': 'applied',
+        'users': len(updated),
+        'total_adjustment': total,
+        'data': [{'user_id': r[0], 'adjustment': r[1], 'salary': r[2]}
+                 for r in updated]
+    }, updated
+
+
+def payroll_status_code(summary):
+    return 409 if summary['status'] == 'overlapping' else 200
+
+
+@app.route('/salary/payroll', methods=['POST'])  # 批次薪資調整
+def run_payroll():
+    """
+    一次套用時間區間內所有 late / absent / overtime 的薪資調整
+    需要提供 start_time, end_time
+    """
+    data = request.get_json(silent=True) or {}
+    start_time = data.get('start_time')
+    end_time = data.get('end_time')
+    if not isinstance(start_time, (int, float)) or not isinstance(end_time, (int, float)):
+        return jsonify({"error": "Invalid time format"}), 400
+    if start_time >= end_time:
+        return jsonify({"error": "start_time must be before end_time"}), 400
+
+    try:
+        conn = get_db_connection()
+        try:
+            summary, updated = apply_payroll(conn, start_time, end_time)
+        finally:
+            conn.close()
+        if updated is not None:
+            # backup database (asynchronously): copy the resulting salaries, not the deltas
+            ops = [op(PAYROLL_RUN_INSERT_QUERY, (start_time, end_time, time.time(),
+                                                  summary['users'], summary['total_adjustment']))]
+            if updated:
+                ops.append(values_op("""
+                    UPDATE Salary s SET salary = v.salary
+                    FROM (VALUES %s) AS v(user_id, salary)
+                    WHERE s.user_id = v.user_id
+                """, [(r[0], r[2]) for r in updated]))
+            REPLICATION.enqueue(ops)
+        log.info("Payroll %s in Main YugabyteDB.", summary['status'])
+        return jsonify(summary), payroll_status_code(summary)
+    except Exception as e:
+        # using backup database
+        log.warning("Exception while updating in Main YugabyteDB: %s", e)
+        try:
+            backup_conn = get_backup_db_connection()
+            try:
+                summary, _ = apply_payroll(backup_conn, start_time, end_time)
+            finally:
+                backup_conn.close()
+            log.info("Using Backup successfully.")
+            return jsonify(summary), payroll_status_code(summary)
+        except Exception as e:
+            log.warning("Exception while updating in Backup YugabyteDB: %s", e)
+            return jsonify({"error": "Database error"}), 500
+
 
 @app.route('/salary/find', methods=['POST'])  # 查詢薪資
 def get_user_salary():
@@ -602,8 +1102,7 @@ def get_user_salary():
             return jsonify({"error": "User not found"}), 404
     except Exception as e:
         # using backup database
-        print("Exception while querying from Main YugabyteDB")
-        print(e)
+        log.warning("Exception while querying from Main YugabyteDB: %s", e)
         try:
             backup_conn = get_backup_db_connection()
             backup_cur = backup_conn.cursor()
@@ -612,15 +1111,14 @@ def get_user_salary():
             result = backup_cur.fetchone()
 
             if result:
-                print("Using Backup successfully.")
+                log.info("Using Backup successfully.")
                 return jsonify({"user_id": result[0], "salary": result[1]}), 200
             else:
-                print("Using Backup successfully.")
+                log.info("Using Backup successfully.")
                 return jsonify({"error": "User not found"}), 404
 
         except Exception as e:
-            print("Exception while querying from Backup YugabyteDB")
-            print(e)
+            log.warning("Exception while querying from Backup YugabyteDB: %s", e)
             return jsonify({"error": "Database error"}), 500
 
 
@@ -644,6 +1142,10 @@ def verify_boss_access(func):
                 return jsonify({'status': 'error', 'message': '認證已過期'}), 401
             return jsonify({'status': 'error', 'message': '無效的認證'}), 401
 
+        # in-memory org index first; not loaded yet or an unknown account: ask the database
+        if ORG.is_boss(user_id):
+            return func(*args, **kwargs)
+
         # Connect to the database
         try:
             conn = get_db_connection()
@@ -654,11 +1156,11 @@ def verify_boss_access(func):
                 """, (user_id,))
                 if not cursor.fetchone():
                     return jsonify({'status': 'error', 'message': '無權限訪問'}), 403
+                ORG.add_boss(user_id)
 
                 return func(*args, **kwargs)
         except Exception as e:
-            print("Exception while connecting to Main YugabyteDB")
-            print(e)
+            log.warning("Exception while connecting to Main YugabyteDB: %s", e)
             conn = get_backup_db_connection()
             with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
                 # Verify if the user is a boss
@@ -675,15 +1177,44 @@ def verify_boss_access(func):
 
 
 def get_subordinates(boss_id, cursor):
-    """Get all subordinates for a given boss"""
+    """
+    Get all subordinates for a given boss (orgReportingDepth levels)
+    served from the in-memory org index, the database is only queried until it is loaded
+    """
+    subordinates = ORG.subordinates(boss_id)
+    if subordinates is not None:
+        return subordinates
+    depth = CONFIG['orgReportingDepth'] or MAX_REPORTING_DEPTH
     cursor.execute("""
-        SELECT account FROM employeeaccount WHERE boss_id = %s
-    """, (boss_id,))
+        WITH RECURSIVE reports (account, level) AS (
+            SELECT account, 1 FROM employeeaccount WHERE boss_id = %s
+            UNION
+            SELECT e.account, r.level + 1
+            FROM employeeaccount e JOIN reports r ON e.boss_id = r.account
+            WHERE r.level < %s
+        )
+        SELECT account FROM reports GROUP BY account ORDER BY MIN(level), account
+    """, (boss_id, depth))
     return [row[0] for row in cursor.fetchall()]
 
 # finish backup database
 
 
+def with_archived_records(result, user_id, start_time, end_time):
+    """
+    時間範圍包含已封存 (archive.py) 的月份時，把 Parquet 檔裡的紀錄一起回傳
+    還沒從資料庫刪掉的月份兩邊都有，重複的只留一筆；結果依時間由新到舊
+    """
+    archived = ARCHIVE.records('Record', start_time, end_time, user_id=user_id)
+    if not archived:
+        return result
+    seen = {(r['user_id'], r['type'], r['time']) for r in result}
+    result.extend({'user_id': r[0], 'type': r[1], 'time': r[2]}
+                  for r in archived if (r[0], r[1], r[2]) not in seen)
+    result.sort(key=lambda r: r['time'], reverse=True)
+    return result
+
+
 @app.route('/boss/subordinate_record', methods=['POST'])
 @verify_boss_access
 def get_subordinate_record():
@@ -713,11 +1244,7 @@ def get_subordinate_record():
                     return jsonify({'status': 'error', 'message': '請提供時間範圍'}), 400
 
                 # 查詢特定員工的打卡紀錄
-                cursor.execute("""
-                    SELECT user_id, type, time
-                    FROM Record
-                    WHERE user_id = %s AND time >= %s AND time <= %s
-                """, (user_id, start_time, end_time,))
+                STATEMENTS.execute(cursor, 'user_record_range', (user_id, start_time, end_time))
 
                 records = cursor.fetchall()
                 result = []
@@ -729,13 +1256,13 @@ def get_subordinate_record():
                     }
                     result.append(record_info)
 
+                result = with_archived_records(result, user_id, start_time, end_time)
                 return jsonify({"status": "success", "data": result}), 200
 
         except Exception as e:
             return jsonify({'status': 'error', 'message': f'查詢失敗: {str(e)}'}), 500
     except Exception as e:
-        print("Exception while connecting to Main YugabyteDB")
-        print(e)
+        log.warning("Exception while connecting to Main YugabyteDB: %s", e)
         # 使用備用資料庫
         try:
             backup_conn = get_backup_db_connection()
@@ -758,11 +1285,7 @@ def get_subordinate_record():
                     return jsonify({'status': 'error', 'message': '請提供時間範圍'}), 400
 
                 # 查詢特定員工的打卡紀錄
-                backup_cursor.execute("""
-                    SELECT user_id, type, time
-                    FROM Record
-                    WHERE user_id = %s AND time >= %s AND time <= %s
-                """, (user_id, start_time, end_time,))
+                STATEMENTS.execute(backup_cursor, 'user_record_range', (user_id, start_time, end_time))
 
                 records = backup_cursor.fetchall()
                 result = []
@@ -774,18 +1297,108 @@ def get_subordinate_record():
                     }
                     result.append(record_info)
 
-                print("Using Backup Successfully")
+                result = with_archived_records(result, user_id, start_time, end_time)
+                log.info("Using Backup successfully.")
                 return jsonify({"status": "success", "data": result}), 200
 
         except Exception as e:
-            print("Exception while connecting to Backup YugabyteDB")
-            print(e)
+            log.warning("Exception while connecting to Backup YugabyteDB: %s", e)
             return jsonify({'status': 'error', 'message': '資料庫連線失敗'}), 500
 
 
 # finish backup database
 
 
+TEAM_AGGREGATES = ('none', 'daily', 'employee')
+
+
+def query_team_records(cursor, boss_id, ts, te, aggregate='none'):
+    """
+    一個 boss 所有下屬 (get_subordinates) 在 [ts, te] 的資料，employeeaccount 與 Record / DailyAttendance 一次 join
+    none: 每位下屬的打卡紀錄 (含已封存的月份)
+    daily: 每位下屬每天的彙總；employee: 每位下屬整段期間的彙總 (以 UTC+8 的整天計算)
+    沒有資料的下屬也會出現在結果中
+    """
+    team = {}
+    accounts = get_subordinates(boss_id, cursor)
+    if aggregate == 'none':
+        STATEMENTS.execute(cursor, 'team_record_range', (accounts, ts, te))
+        for account, record_type, record_time in cursor.fetchall():
+            records = team.setdefault(account, [])
+            if record_time is not None:
+                records.append({'user_id': account, 'type': record_type, 'time': record_time})
+        # archived months: one read for the whole team, rows still in the database skipped
+        archived = ARCHIVE.records('Record', ts, te)
+        if archived:
+            seen = {(r['user_id'], r['type'], r['time'])
+                    for records in team.values() for r in records}
+            for user_id, record_type, record_time in archived:
+                if user_id in team and (user_id, record_type, record_time) not in seen:
+                    team[user_id].append(
+                        {'user_id': user_id, 'type': record_type, 'time': record_time})
+            for records in team.values():
+                records.sort(key=lambda r: r['time'], reverse=True)
+        return [{'user_id': user_id, 'records': records} for user_id, records in team.items()]
+
+    if aggregate == 'daily':
+        STATEMENTS.execute(cursor, 'team_daily_range', (accounts, day_of(ts), day_of(te)))
+        for account, day, first_in, last_out, worked_seconds, punch_count in cursor.fetchall():
+            days = team.setdefault(account, [])
+            if day is not None:
+                days.append({'day': day.isoformat(), 'first_in': first_in, 'last_out': last_out,
+                             'worked_seconds': worked_seconds, 'punch_count': punch_count})
+        return [{'user_id': user_id, 'days': days} for user_id, days in team.items()]
+
+    STATEMENTS.execute(cursor, 'team_employee_totals', (accounts, day_of(ts), day_of(te)))
+    return [
+        {'user_id': r[0], 'days_present': r[1], 'first_in': r[2], 'last_out': r[3],
+         'worked_seconds': r[4], 'punch_count': r[5]}
+        for r in cursor.fetchall()
+    ]
+
+
+@app.route('/boss/team_records', methods=['POST'])
+@verify_boss_access
+def get_team_records():
+    """
+    BOSS API：一次查詢所有下屬的打卡紀錄或彙總 (取代逐一呼叫 /boss/subordinate_record)
+    需要提供 start_time, end_time；aggregate 可為 none (預設)、daily、employee
+    """
+    boss_id = request.headers.get('X-User-ID')
+    data = request.get_json(silent=True) or {}
+    start_time = data.get('start_time')
+    end_time = data.get('end_time')
+    aggregate = data.get('aggregate') or 'none'
+    if not isinstance(start_time, (int, float)) or not isinstance(end_time, (int, float)):
+        return jsonify({'status': 'error', 'message': '請提供時間範圍'}), 400
+    if aggregate not in TEAM_AGGREGATES:
+        return jsonify({'status': 'error',
+                        'message': f'aggregate 必須為 {", ".join(TEAM_AGGREGATES)}'}), 400
+
+    try:
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                result = query_team_records(cursor, boss_id, start_time, end_time, aggregate)
+            return jsonify({'status': 'success', 'aggregate': aggregate, 'data': result}), 200
+        finally:
+            conn.close()
+    except Exception as e:
+        log.warning("Exception while querying from Main YugabyteDB: %s", e)
+        try:
+            backup_conn = get_backup_db_connection()
+            try:
+                with backup_conn.cursor() as backup_cursor:
+                    result = query_team_records(
+                        backup_cursor, boss_id, start_time, end_time, aggregate)
+                return jsonify({'status': 'success', 'aggregate': aggregate, 'data': result}), 200
+            finally:
+                backup_conn.close()
+        except Exception as e:
+            log.warning("Exception while querying from Backup YugabyteDB: %s", e)
+            return jsonify({'status': 'error', 'message': '資料庫連線失敗'}), 500
+
+
 @app.route('/boss/subordinate_salary', methods=['POST'])
 @verify_boss_access
 def subordinate_salary():
@@ -805,11 +1418,7 @@ def subordinate_salary():
                 return jsonify({'status': 'error', 'message': '無權限查詢該員工或該員工不存在'}), 403
 
             # 查詢特定員工的薪資
-            cursor.execute("""
-                SELECT user_id, salary
-                FROM Salary
-                WHERE user_id = %s
-            """, (user_id, ))
+            STATEMENTS.execute(cursor, 'salary_by_user', (user_id,))
 
             salary_records = cursor.fetchall()
             result = []
@@ -823,8 +1432,7 @@ def subordinate_salary():
             return jsonify({"status": "success", "data": result}), 200
 
     except Exception as e:
-        print("Exception while connecting to Main YugabyteDB")
-        print(e)
+        log.warning("Exception while connecting to Main YugabyteDB: %s", e)
         # 使用備用資料庫
         try:
             backup_conn = get_backup_db_connection()
@@ -841,11 +1449,7 @@ def subordinate_salary():
                     return jsonify({'status': 'error', 'message': '無權限查詢該員工或該員工不存在'}), 403
 
                 # 查詢特定員工的薪資
-                cursor.execute("""
-                    SELECT user_id, salary
-                    FROM Salary
-                    WHERE user_id = %s
-                """, (user_id, ))
+                STATEMENTS.execute(cursor, 'salary_by_user', (user_id,))
 
                 salary_records = cursor.fetchall()
                 result = []
@@ -856,12 +1460,11 @@ def subordinate_salary():
                     }
                     result.append(salary_info)
 
-                print("Using Backup Successfully")
+                log.info("Using Backup successfully.")
                 return jsonify({"status": "success", "data": result}), 200
 
         except Exception as backup_e:
-            print("Exception while connecting to Backup YugabyteDB")
-            print(backup_e)
+            log.warning("Exception while connecting to Backup YugabyteDB: %s", backup_e)
             return jsonify({'status': 'error', 'message': f'查詢失敗: {str(e)}，備份資料庫也失敗: {str(backup_e)}'}), 500
     finally:
         if conn:
@@ -922,6 +1525,8 @@ def employee_register():
                 VALUES (%s, %s, %s)
             """
             cursor.execute(insert_query, (account, password, boss_id))
+            # tell the other workers' org index (org_hierarchy.py)
+            cursor.execute(BUMP_VERSION_QUERY)
             conn.commit()
 
             # 新增員工薪資
@@ -932,41 +1537,23 @@ def employee_register():
             cursor.execute(insert_query, (account, 10000))
             conn.commit()
 
-            # backup database
-            try:
-                backup_conn = get_backup_db_connection()
-                backup_cursor = backup_conn.cursor()
-
-                # 新增用戶
-                insert_query = """
+            # backup database (asynchronously, one transaction)
+            REPLICATION.enqueue([
+                op("""
                     INSERT INTO Author (user_id, access_token, refresh_token, created_at)
                     VALUES (%s, %s, %s, %s)
-                """
-                backup_cursor.execute(insert_query, (account, access_token,
-                                                     refresh_token, created_at))
-                backup_conn.commit()
-
-                # 新增員工帳號
-                insert_query = """
+                """, (account, access_token, refresh_token, created_at)),
+                op("""
                     INSERT INTO employeeaccount (account, password, boss_id)
                     VALUES (%s, %s, %s)
-                """
-                backup_cursor.execute(insert_query,
-                                      (account, password, boss_id))
-                backup_conn.commit()
-
-                # 新增員工薪資
-                insert_query = """
+                """, (account, password, boss_id)),
+                op(BUMP_VERSION_QUERY, ()),
+                op("""
                     INSERT INTO salary (user_id, salary)
                     VALUES (%s, %s)
-                """
-                backup_cursor.execute(insert_query, (account, 10000))
-                backup_conn.commit()
-                backup_conn.close()
-                print("Backup successfully.")
-            except Exception as e:
-                print("Exception while inserting into Backup YugabyteDB")
-                print(e)
+                """, (account, 10000)),
+            ])
+            ORG.add_employee(account, boss_id)
 
             return jsonify({
                 'status': 'success',
@@ -1010,6 +1597,8 @@ def employee_register():
                 VALUES (%s, %s, %s)
             """
             cursor.execute(insert_query, (account, password, boss_id))
+            # tell the other workers' org index (org_hierarchy.py)
+            cursor.execute(BUMP_VERSION_QUERY)
             conn.commit()
 
             # 新增員工薪資
@@ -1019,7 +1608,8 @@ def employee_register():
             """
             cursor.execute(insert_query, (account, 10000))
             conn.commit()
-            print("Using Backup Successfully")
+            ORG.add_employee(account, boss_id)
+            log.info("Using Backup successfully.")
             return jsonify({
                 'status': 'success',
                 'message': '註冊成功',
@@ -1062,6 +1652,11 @@ def verify_employee_token(header):
 # 查詢打卡記錄
 
 
+# one punch, also rolled up into DailyAttendance
+# 重複的打卡 (同 user_id, time, type) 不新增也不報錯，兩個 cluster 的結果一致
+CLOCK_IN_QUERY = rollup_insert_query('(%s, %s, %s)', 'ON CONFLICT DO NOTHING')
+
+
 @app.route('/employee/records', methods=['GET', 'POST'])
 def employee_records():
     """
@@ -1090,17 +1685,15 @@ def employee_records():
         if not user_id or not start_time or not end_time:
             return jsonify({'status': 'error', 'message': '缺少必要參數'}), 400
 
+        # 分頁 / 串流模式
+        if is_paged_request(data):
+            return paged_records_response(data, start_time, end_time, user_id=user_id)
+
         conn = None  # 初始化 conn 變數
         try:
             conn = get_db_connection()
             with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                query = """
-                    SELECT user_id, type, time 
-                    FROM Record 
-                    WHERE user_id = %s AND time BETWEEN %s AND %s
-                    ORDER BY time DESC
-                """
-                cursor.execute(query, (user_id, start_time, end_time,))
+                STATEMENTS.execute(cursor, 'user_record_range', (user_id, start_time, end_time))
                 records = cursor.fetchall()
 
                 result = []
@@ -1111,6 +1704,7 @@ def employee_records():
                         'time': record['time']
                     })
 
+                result = with_archived_records(result, user_id, start_time, end_time)
                 return jsonify({
                     'status': 'success',
                     'message': '查詢成功',
@@ -1120,13 +1714,7 @@ def employee_records():
             try:
                 conn = get_backup_db_connection()
                 with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as backup_cursor:
-                    query = """
-                        SELECT user_id, type, time 
-                        FROM Record 
-                        WHERE user_id = %s AND time BETWEEN %s AND %s
-                        ORDER BY time DESC
-                    """
-                    backup_cursor.execute(query, (user_id, start_time, end_time,))
+                    STATEMENTS.execute(backup_cursor, 'user_record_range', (user_id, start_time, end_time))
                     records = backup_cursor.fetchall()
 
                     result = []
@@ -1137,7 +1725,8 @@ def employee_records():
                             'time': record['time']
                         })
 
-                    print("使用備份資料庫查詢成功")
+                    result = with_archived_records(result, user_id, start_time, end_time)
+                    log.info("使用備份資料庫查詢成功")
                     return jsonify({
                         'status': 'success',
                         'message': '查詢成功 (使用備份資料庫)',
@@ -1177,26 +1766,18 @@ def employee_records():
         try:
             conn = get_db_connection()
             with conn.cursor() as cursor:
-                # 插入打卡記錄到 Record 表
-                insert_query = """
-                    INSERT INTO Record (user_id, type, time)
-                    VALUES (%s, %s, %s)
-                """
+                # 插入打卡記錄到 Record 表 (同時更新 DailyAttendance)
                 cursor.execute(
-                    insert_query, (user_id, record_type, record_time))
+                    CLOCK_IN_QUERY, (user_id, record_type, record_time))
+                inserted = cursor.fetchall()
                 conn.commit()
 
-                # 備份到備份數據庫
-                try:
-                    backup_conn = get_backup_db_connection()
-                    with backup_conn.cursor() as backup_cursor:
-                        backup_cursor.execute(
-                            insert_query, (user_id, record_type, record_time))
-                        backup_conn.commit()
-                    backup_conn.close()
-                    print("備份打卡記錄成功")
-                except Exception as backup_error:
-                    print(f"備份打卡記錄失敗: {backup_error}")
+                # 備份到備份數據庫 (非同步)，重複打卡也送出，補上 backup 可能缺少的那筆
+                REPLICATION.enqueue(
+                    [op(CLOCK_IN_QUERY, (user_id, record_type, record_time))])
+
+                if not inserted:
+                    return jsonify({'status': 'error', 'message': '打卡記錄已存在'}), 409
 
                 return jsonify({
                     'status': 'success',
@@ -1208,15 +1789,15 @@ def employee_records():
             try:
                 backup_conn = get_backup_db_connection()
                 with backup_conn.cursor() as backup_cursor:
-                    insert_query = """
-                        INSERT INTO Record (user_id, type, time)
-                        VALUES (%s, %s, %s)
-                    """
                     backup_cursor.execute(
-                        insert_query, (user_id, record_type, record_time))
+                        CLOCK_IN_QUERY, (user_id, record_type, record_time))
+                    inserted = backup_cursor.fetchall()
                     backup_conn.commit()
                 backup_conn.close()
 
+                if not inserted:
+                    return jsonify({'status': 'error', 'message': '打卡記錄已存在'}), 409
+
                 return jsonify({
                     'status': 'success',
                     'message': '打卡記錄已新增 (使用備份數據庫)',
@@ -1232,6 +1813,109 @@ def employee_records():
                 conn.close()
 
 # finish backup database
+# 批次打卡 (讀卡機離線補傳)
+
+MAX_BATCH_SIZE = 10000
+
+
+# also rolls the new punches up into DailyAttendance
+BATCH_INSERT_QUERY = rollup_insert_query('%s', 'ON CONFLICT DO NOTHING')
+
+
+def insert_batch_records(conn, rows):
+    """
+    單一 multi-row INSERT 寫入所有打卡紀錄，重複的 (user_id, time, type) 會略過
+    回傳實際新增的 (user_id, type, time) 集合
+    """
+    values = [(user_id, record_type, record_time)
+              for _, user_id, record_type, record_time in rows]
+    with conn.cursor() as cursor:
+        inserted = psycopg2.extras.execute_values(
+            cursor, BATCH_INSERT_QUERY,
+            values, page_size=len(values), fetch=True)
+    conn.commit()
+    return {(r[0], r[1], r[2]) for r in inserted}
+
+
+@app.route('/employee/records/batch', methods=['POST'])
+def employee_records_batch():
+    """
+    批次新增打卡記錄
+    需要提供 records: [{user_id, type, time}, ...]
+    員工只能補傳自己的紀錄，主管可以補傳自己與下屬的紀錄
+    回傳每一筆的狀態: inserted / duplicate / invalid / forbidden
+    """
+    header = request.headers
+    token_response = verify_employee_token(header)
+    if token_response[1] != 200:
+        return token_response
+    header_user_id = header.get('X-User-ID')
+
+    data = request.get_json(silent=True) or {}
+    records = data.get('records')
+    if not isinstance(records, list) or not records:
+        return jsonify({'status': 'error', 'message': '缺少必要參數'}), 400
+    if len(records) > MAX_BATCH_SIZE:
+        return jsonify({'status': 'error',
+                        'message': f'一次最多 {MAX_BATCH_SIZE} 筆'}), 413
+
+    allowed_users = {header_user_id}
+    other_users = {r.get('user_id') for r in records
+                   if isinstance(r, dict) and isinstance(r.get('user_id'), str)}
+    other_users.discard(header_user_id)
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        if other_users:
+            with conn.cursor() as cursor:
+                allowed_users.update(get_subordinates(header_user_id, cursor))
+        rows, statuses = validate_batch_records(records, allowed_users)
+        if rows:
+            inserted = insert_batch_records(conn, rows)
+            # 備份到備份數據庫 (非同步)
+            REPLICATION.enqueue([values_op(
+                BATCH_INSERT_QUERY,
+                [(user_id, record_type, record_time)
+                 for _, user_id, record_type, record_time in rows])])
+    except Exception as e:
+        # 嘗試使用備份數據庫
+        try:
+            backup_conn = get_backup_db_connection()
+            if other_users:
+                with backup_conn.cursor() as cursor:
+                    allowed_users.update(
+                        get_subordinates(header_user_id, cursor))
+            rows, statuses = validate_batch_records(records, allowed_users)
+            inserted = insert_batch_records(backup_conn, rows) if rows else set()
+            backup_conn.close()
+        except Exception as backup_error:
+            return jsonify({
+                'status': 'error',
+                'message': f'新增打卡記錄失敗: {str(e)}, 備份操作也失敗: {str(backup_error)}'
+            }), 500
+    finally:
+        if conn:
+            conn.close()
+
+    # 填入寫入結果
+    inserted_count = 0
+    for index, user_id, record_type, record_time in rows:
+        key = (user_id, record_type, record_time)
+        if key in inserted:
+            inserted.discard(key)  # 同一批內的重複資料只算第一筆
+            statuses[index]['status'] = 'inserted'
+            inserted_count += 1
+        else:
+            statuses[index]['status'] = 'duplicate'
+
+    return jsonify({
+        'status': 'success',
+        'message': f'已新增 {inserted_count} 筆打卡記錄',
+        'inserted': inserted_count,
+        'data': statuses
+    }), 201
+
 # 查詢薪資記錄
 
 
@@ -1262,12 +1946,7 @@ def get_employee_salary():
     try:
         conn = get_db_connection()
         with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-            query = """
-                SELECT user_id, salary
-                FROM Salary 
-                WHERE user_id = %s
-            """
-            cursor.execute(query, (user_id, ))
+            STATEMENTS.execute(cursor, 'salary_by_user', (user_id,))
             records = cursor.fetchall()
 
             result = []
@@ -1285,12 +1964,7 @@ def get_employee_salary():
     except Exception as e:
         conn = get_backup_db_connection()
         with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-            query = """
-                SELECT user_id, salary
-                FROM Salary 
-                WHERE user_id = %s
-            """
-            cursor.execute(query, (user_id, ))
+            STATEMENTS.execute(cursor, 'salary_by_user', (user_id,))
             records = cursor.fetchall()
 
             result = []
@@ -1299,7 +1973,7 @@ def get_employee_salary():
                     'user_id': record['user_id'],
                     'salary': record['salary']
                 })
-            print("Using Backup Successfully")
+            log.info("Using Backup successfully.")
             return jsonify({
                 'status': 'success',
                 'message': '查詢成功',
@@ -1376,21 +2050,17 @@ def login():
 
             conn.commit()
 
-            # 備份到備份資料庫
-            try:
-                backup_conn = get_backup_db_connection()
-                with backup_conn.cursor() as backup_cursor:
-                    if token_record:
-                        backup_cursor.execute(
-                            update_query, (new_access_token, new_refresh_token, current_time, account))
-                    else:
-                        backup_cursor.execute(
-                            insert_query, (account, new_access_token, new_refresh_token, current_time))
-                    backup_conn.commit()
-                backup_conn.close()
-                print("備份 token 更新成功")
-            except Exception as backup_error:
-                print(f"備份 token 更新失敗: {backup_error}")
+            # token 已更換，更新 cache
+            TOKEN_CACHE.invalidate_user(account)
+            TOKEN_CACHE.put(account, new_access_token, current_time)
+
+            # 備份到備份資料庫 (非同步)
+            if token_record:
+                REPLICATION.enqueue([op(
+                    update_query, (new_access_token, new_refresh_token, current_time, account))])
+            else:
+                REPLICATION.enqueue([op(
+                    insert_query, (account, new_access_token, new_refresh_token, current_time))])
 
             return jsonify({
                 'status': 'success',
@@ -1405,7 +2075,7 @@ def login():
             }), 200
 
     except Exception as e:
-        print(f"登入過程中發生錯誤: {e}")
+        log.exception("登入過程中發生錯誤: %s", e)
         try:
             backup_conn = get_backup_db_connection()
             with backup_conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
@@ -1454,8 +2124,10 @@ def login():
                         insert_query, (account, new_access_token, new_refresh_token, current_time))
 
                 backup_conn.commit()
+                TOKEN_CACHE.invalidate_user(account)
+                TOKEN_CACHE.put(account, new_access_token, current_time)
                 conn = backup_conn
-                print("使用備份資料庫登入成功")
+                log.info("使用備份資料庫登入成功")
                 return jsonify({
                     'status': 'success',
                     'message': '登入成功',
@@ -1468,7 +2140,7 @@ def login():
                     }
                 }), 200
         except Exception as backup_e:
-            print(f"備份資料庫登入失敗: {backup_e}")
+            log.error("備份資料庫登入失敗: %s", backup_e)
             return jsonify({'status': 'error', 'message': f'登入失敗: {str(e)}，備份資料庫也失敗: {str(backup_e)}'}), 500
         conn.close()
 
@@ -1479,6 +2151,10 @@ def get_boss_subordinates():
     """
     BOSS API：獲取主管的下屬員工列表
     """
+    subordinates = ORG.subordinates(request.headers.get('X-User-ID'))
+    if subordinates is not None:
+        return jsonify({'status': 'success', 'data': subordinates}), 200
+
     try:
         conn = get_db_connection()
         try:
@@ -1486,11 +2162,7 @@ def get_boss_subordinates():
                 boss_id = request.headers.get('X-User-ID')
 
                 # 查詢該主管的所有下屬
-                cursor.execute("""
-                    SELECT account FROM employeeaccount WHERE boss_id = %s
-                """, (boss_id,))
-
-                subordinates = [row[0] for row in cursor.fetchall()]
+                subordinates = get_subordinates(boss_id, cursor)
 
                 if not subordinates:
                     return jsonify({'status': 'success', 'data': []}), 200
@@ -1500,8 +2172,7 @@ def get_boss_subordinates():
         except Exception as e:
             return jsonify({'status': 'error', 'message': f'查詢失敗: {str(e)}'}), 500
     except Exception as e:
-        print("Exception while connecting to Main YugabyteDB")
-        print(e)
+        log.warning("Exception while connecting to Main YugabyteDB: %s", e)
         # 使用備用資料庫
         try:
             backup_conn = get_backup_db_connection()
@@ -1509,22 +2180,64 @@ def get_boss_subordinates():
                 boss_id = request.headers.get('X-User-ID')
 
                 # 查詢該主管的所有下屬
-                backup_cursor.execute("""
-                    SELECT account FROM employeeaccount WHERE boss_id = %s
-                """, (boss_id,))
-
-                subordinates = [row[0] for row in backup_cursor.fetchall()]
+                subordinates = get_subordinates(boss_id, backup_cursor)
 
                 if not subordinates:
                     return jsonify({'status': 'success', 'data': []}), 200
 
                 return jsonify({'status': 'success', 'data': subordinates}), 200
         except Exception as e:
-            print("Exception while connecting to Backup YugabyteDB")
-            print(e)
+            log.warning("Exception while connecting to Backup YugabyteDB: %s", e)
             return jsonify({'status': 'error', 'message': '資料庫連線失敗'}), 500
 
 
+@app.route('/replication/status', methods=['GET'])
+def replication_status():
+    """備份資料庫複寫狀態 (延遲、待處理筆數)"""
+    return jsonify(REPLICATION.stats()), 200
+
+
+@app.route('/failover/status', methods=['GET'])
+def failover_status():
+    """主要 / 備份資料庫的 circuit breaker 狀態"""
+    return jsonify(FAILOVER.stats()), 200
+
+
+@app.route('/pool/stats', methods=['GET'])
+def pool_stats():
+    """連線池狀態 (監控用)"""
+    return jsonify({
+        'main': MAIN_POOL.stats(),
+        'backup': BACKUP_POOL.stats(),
+        'token_cache': TOKEN_CACHE.stats(),
+        'statements': STATEMENTS.stats(),
+        'org': ORG.stats()
+    }), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 格式的監控數據"""
+    # gauges are read from their sources at scrape time
+    for name, pool in (('main', MAIN_POOL), ('backup', BACKUP_POOL)):
+        stats = pool.stats()
+        METRICS.set('db_pool_connections', stats['idle'], cluster=name, state='idle')
+        METRICS.set('db_pool_connections', stats['in_use'], cluster=name, state='in_use')
+        METRICS.set('db_pool_timeouts_total', stats['timeouts'], cluster=name)
+    for name, breaker in FAILOVER.stats().items():
+        for state in ('closed', 'open', 'half_open'):
+            METRICS.set('failover_circuit_state', int(breaker['state'] == state),
+                        cluster=name, state=state)
+        METRICS.set('failover_circuit_opens_total', breaker['open_count'], cluster=name)
+    replication = REPLICATION.stats()
+    METRICS.set('replication_lag_entries', replication['lag_entries'])
+    METRICS.set('replication_lag_seconds', replication['lag_seconds'])
+    METRICS.set('replication_dead_letters_total', replication['dead_letters'])
+    if SHARED_METRICS is not None:
+        return Response(SHARED_METRICS.render(), mimetype='text/plain; version=0.0.4')
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+
 # test
 if __name__ == "__main__":
     # run the app on port 5000
@@ -6,6 +6,13 @@ import psycopg2
 import psycopg2.extras
 import time
 import hashlib
+import os
+import sys
+
+# db_pool.py lives in the parent folder (access_control_system/)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_pool import create_pool  # noqa: E402
+from statements import STATEMENTS  # noqa: E402
 
 # read host name from host.json file
 with open('access_control_system/url.json') as f:
@@ -24,19 +31,14 @@ CONFIG = {
     'sslRootCert': ''
 }
 
+# shared connection pool, close() returns the connection to the pool
+POOL = create_pool('main', CONFIG)
+
 
 def authorization(access_token, user_id):  # authirization main function
     # Connect to the database
     try:
-        if CONFIG['sslMode'] != '':
-            conn = psycopg2.connect(host=CONFIG['host'], port=CONFIG['port'], database=CONFIG['dbName'],
-                                    user=CONFIG['dbUser'], password=CONFIG['dbPassword'],
-                                    sslmode=CONFIG['sslMode'], sslrootcert=CONFIG['sslRootCert'],
-                                    connect_timeout=10)
-        else:
-            conn = psycopg2.connect(host=CONFIG['host'], port=CONFIG['port'], database=CONFIG['dbName'],
-                                    user=CONFIG['dbUser'], password=CONFIG['dbPassword'],
-                                    connect_timeout=10)
+        conn = POOL.getconn()
 
     except Exception as e:
         print("Exception while connecting to YugabyteDB")
@@ -49,10 +51,7 @@ def authorization(access_token, user_id):  # authirization main function
     cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
     # Execute a query to check if the access token is valid for the given user ID
-    query = """
-        SELECT * FROM Author WHERE access_token = %s AND user_id = %s
-    """
-    cursor.execute(query, (access_token, user_id))
+    STATEMENTS.execute(cursor, 'author_by_access_token', (access_token, user_id))
 
     # Fetch the result of the query
     result = cursor.fetchone()
@@ -89,15 +88,7 @@ def authorization(access_token, user_id):  # authirization main function
 def update_token(refresh_token, user_id):  # update the token function
     # Connect to the database
     try:
-        if CONFIG['sslMode'] != '':
-            conn = psycopg2.connect(host=CONFIG['host'], port=CONFIG['port'], database=CONFIG['dbName'],
-                                    user=CONFIG['dbUser'], password=CONFIG['dbPassword'],
-                                    sslmode=CONFIG['sslMode'], sslrootcert=CONFIG['sslRootCert'],
-                                    connect_timeout=10)
-        else:
-            conn = psycopg2.connect(host=CONFIG['host'], port=CONFIG['port'], database=CONFIG['dbName'],
-                                    user=CONFIG['dbUser'], password=CONFIG['dbPassword'],
-                                    connect_timeout=10)
+        conn = POOL.getconn()
 
     except Exception as e:
         print("Exception while connecting to YugabyteDB")
@@ -110,10 +101,7 @@ def update_token(refresh_token, user_id):  # update the token function
     cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
 
     # check if the refresh token is valid for the given user ID
-    query = """
-        SELECT * FROM Author WHERE refresh_token = %s AND user_id = %s
-    """
-    cursor.execute(query, (refresh_token, user_id))
+    STATEMENTS.execute(cursor, 'author_by_refresh_token', (refresh_token, user_id))
 
     # Fetch the result of the query
     result = cursor.fetchone()
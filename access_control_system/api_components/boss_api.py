@@ -6,6 +6,12 @@ from flask import Flask, jsonify, request
 from flask_cors import CORS
 from functools import wraps
 from datetime import datetime
+import os
+import sys
+
+# db_pool.py lives in the parent folder (access_control_system/)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_pool import create_pool  # noqa: E402
 
 app = Flask(__name__)
 CORS(app)
@@ -26,14 +32,12 @@ CONFIG = {
 }
 
 
+# shared connection pool, close() returns the connection to the pool
+POOL = create_pool('main', CONFIG)
+
+
 def get_db_connection():
-    return psycopg2.connect(
-        host=CONFIG['host'],
-        port=CONFIG['port'],
-        database=CONFIG['dbName'],
-        user=CONFIG['dbUser'],
-        password=CONFIG['dbPassword'],
-        sslrootcert=CONFIG['sslRootCert'])
+    return POOL.getconn()
 
 
 def verify_boss_access(func):
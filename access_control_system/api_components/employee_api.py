@@ -4,6 +4,13 @@ import hashlib
 import psycopg2
 import psycopg2.extras
 from flask import Flask, request, jsonify
+import os
+import sys
+
+# db_pool.py lives in the parent folder (access_control_system/)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_pool import create_pool  # noqa: E402
+from statements import STATEMENTS  # noqa: E402
 
 app = Flask(__name__)
 
@@ -26,25 +33,14 @@ CONFIG = {
 
 print(f"資料庫連線設定: 主機={HOST}, 埠號={PORT}")
 
+# 共用連線池，close() 會把連線還給 pool
+POOL = create_pool('main', CONFIG)
+
+
 def get_db_connection():
-    """建立與資料庫的連線"""
+    """從連線池取得與資料庫的連線"""
     try:
-        if CONFIG['sslMode'] != '':
-            conn = psycopg2.connect(host=CONFIG['host'], 
-                                    port=CONFIG['port'], 
-                                    database=CONFIG['dbName'],
-                                    user=CONFIG['dbUser'], 
-                                    password=CONFIG['dbPassword'],
-                                    sslmode=CONFIG['sslMode'], 
-                                    sslrootcert=CONFIG['sslRootCert'],
-                                    connect_timeout=10)
-        else:
-            conn = psycopg2.connect(host=CONFIG['host'], 
-                                    port=CONFIG['port'], 
-                                    database=CONFIG['dbName'],
-                                    user=CONFIG['dbUser'], 
-                                    password=CONFIG['dbPassword'],
-                                    connect_timeout=10)
+        conn = POOL.getconn()
         print("成功連接到 YugabyteDB!")
         return conn
     except Exception as e:
@@ -313,14 +309,13 @@ def get_salary():
     try:
         with conn.cursor() as cursor:
             # 獲取基本薪資
-            query = "SELECT salary FROM Salary WHERE user_id = %s"
-            cursor.execute(query, (user_id,))
+            STATEMENTS.execute(cursor, 'salary_by_user', (user_id,))
             result = cursor.fetchone()
             
             if not result:
                 return jsonify({'status': 'error', 'message': '未找到薪資信息'}), 404
                 
-            base_salary = result[0]
+            base_salary = result[1]
             
             return jsonify({
                 'status': 'success',
@@ -1,7 +1,13 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import psycopg2
 import json
+import os
+import sys
+
+# db_pool.py lives in the parent folder (access_control_system/)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_pool import create_pool  # noqa: E402
+from statements import STATEMENTS  # noqa: E402
 
 app = Flask(__name__)
 CORS(app)
@@ -23,14 +29,12 @@ CONFIG = {
 }
 
 
+# shared connection pool, close() returns the connection to the pool
+POOL = create_pool('main', CONFIG)
+
+
 def get_db_connection():
-    return psycopg2.connect(
-        host=CONFIG['host'],
-        port=CONFIG['port'],
-        database=CONFIG['dbName'],
-        user=CONFIG['dbUser'],
-        password=CONFIG['dbPassword'],
-        sslrootcert=CONFIG['sslRootCert'])
+    return POOL.getconn()
 
 
 @app.route('/record/', methods=['GET', 'POST'])
@@ -52,10 +56,7 @@ def record_handler():
             cur = conn.cursor()
 
             # 原本 Record 表的查詢
-            cur.execute(
-                'SELECT user_id, type, time FROM Record WHERE time >= %s AND time <= %s',
-                (ts, te)
-            )
+            STATEMENTS.execute(cur, 'record_range', (ts, te))
             rows = cur.fetchall()
             record_data = [
                 {'user_id': r[0], 'type': r[1], 'time': r[2]}
@@ -1,8 +1,13 @@
 import json
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import psycopg2
 from datetime import datetime
+import os
+import sys
+
+# db_pool.py lives in the parent folder (access_control_system/)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_pool import create_pool  # noqa: E402
 
 # read host name from host.json file
 with open('access_control_system/url.json') as f:
@@ -22,14 +27,12 @@ CONFIG = {
 }
 
 
+# shared connection pool, close() returns the connection to the pool
+POOL = create_pool('main', CONFIG)
+
+
 def get_db_connection():
-    return psycopg2.connect(
-        host=CONFIG['host'],
-        port=CONFIG['port'],
-        database=CONFIG['dbName'],
-        user=CONFIG['dbUser'],
-        password=CONFIG['dbPassword'],
-        sslrootcert=CONFIG['sslRootCert'])
+    return POOL.getconn()
 
 
 # 初始化 Flask app
@@ -0,0 +1,252 @@
+# archive.py
+# cold tier: move old monthly Record / Log partitions to Parquet files and read them back
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+from partitions import PARTITIONED, add_months, month_bounds, month_of
+
+log = logging.getLogger('access_control.archive')
+
+CONFIG = {
+    'archiveDir': 'access_control_system/archive',
+    'archiveMonths': 24,          # partitions older than this many months are archived
+    'compression': 'zstd',
+    'fetchSize': 50000,           # rows per round trip and per Parquet row group
+}
+
+COLUMNS = {
+    'Record': ['user_id', 'type', 'time'],
+    'Log': ['user_id', 'type', 'time', 'duration'],
+}
+
+# Parquet column types (pyarrow type names)
+COLUMN_TYPES = {'user_id': 'string', 'type': 'string', 'time': 'float64', 'duration': 'float64'}
+
+
+def month_key(month):
+    return f"{month[0]}-{month[1]:02d}"
+
+
+def index_path(archive_dir):
+    return os.path.join(archive_dir, 'index.json')
+
+
+def load_index(archive_dir):
+    """{table: {'YYYY-MM': {file, rows, start, end, archived_at}}}"""
+    try:
+        with open(index_path(archive_dir)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_index(archive_dir, index):
+    tmp_file = index_path(archive_dir) + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(index, f, indent=4, sort_keys=True)
+    os.replace(tmp_file, index_path(archive_dir))
+
+
+def month_tables(conn, table):
+    """
+    資料庫裡 <table>_pYYYY_MM 形式的資料表 (不論是否還 attach 在 partitioned table 上)
+    回傳 {(year, month): name}
+    """
+    pattern = f'^{table.lower()}_p([0-9]{{4}})_([0-9]{{2}})$'
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT relname FROM pg_class
+            WHERE relkind = 'r' AND relname ~ %s AND pg_table_is_visible(oid)
+        """, (pattern,))
+        names = [row[0] for row in cursor.fetchall()]
+    conn.commit()
+    tables = {}
+    for name in names:
+        match = re.match(pattern, name)
+        tables[(int(match.group(1)), int(match.group(2)))] = name
+    return tables
+
+
+def write_parquet(conn, table, name, path, fetch_size=CONFIG['fetchSize'],
+                  compression=CONFIG['compression']):
+    """
+    把一個 partition 串流寫成 Parquet：每次讀 fetch_size 筆寫成一個 row group，記憶體用量與月份大小無關
+    (先寫 .tmp，確認筆數後才換成正式檔名)
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = COLUMNS[table]
+    schema = pa.schema([(column, COLUMN_TYPES[column]) for column in columns])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_file = path + '.tmp'
+    rows = 0
+    # sorted by user and time, so the row group statistics let readers skip most groups
+    with conn.cursor(name=f'archive_{name}') as cursor, \
+            pq.ParquetWriter(tmp_file, schema, compression=compression) as writer:
+        cursor.itersize = fetch_size
+        cursor.execute(f"SELECT {', '.join(columns)} FROM {name} ORDER BY user_id, time")
+        while True:
+            batch = cursor.fetchmany(fetch_size)
+            if not batch:
+                break
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(list(values), type=field.type)
+                 for values, field in zip(zip(*batch), schema)], schema=schema))
+            rows += len(batch)
+    conn.commit()
+
+    written = pq.ParquetFile(tmp_file).metadata.num_rows
+    if written != rows:
+        os.remove(tmp_file)
+        raise RuntimeError(f"{name}: wrote {written} of {rows} rows")
+    os.replace(tmp_file, path)
+    return rows
+
+
+def count_rows(conn, name):
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {name}")
+        count = cursor.fetchone()[0]
+    conn.commit()
+    return count
+
+
+def drop_month_table(conn, name):
+    with conn.cursor() as cursor:
+        # dropping a partition also detaches it
+        cursor.execute(f"DROP TABLE IF EXISTS {name}")
+    conn.commit()
+
+
+def archive_partitions(conns, tables=PARTITIONED, months=CONFIG['archiveMonths'],
+                       archive_dir=CONFIG['archiveDir'], keep_partitions=False, now=None):
+    """
+    1. 從第一個 cluster (main) 讀出比 months 個月更舊的 partition 寫成 Parquet，並記錄在 index.json
+    2. 檔案確認後，每個 cluster 的 partition 筆數和封存檔相同才 DROP (keep_partitions 時不刪)；
+       筆數不同 (例如備份資料庫還沒補齊，或封存後又寫入) 的保留下來並回報在 report['mismatched']
+    已經在 index.json 的月份不會重寫，只會補刪還留在其他 cluster 的 partition
+    conns: {'main': conn, 'backup': backup_conn}
+    """
+    cutoff = add_months(month_of(now or time.time()), -months)
+    index = load_index(archive_dir)
+    source = next(iter(conns.values()))
+    report = {}
+    for table in tables:
+        archived = index.setdefault(table, {})
+        candidates = {month: name for month, name in month_tables(source, table).items()
+                      if month < cutoff}
+        for month, name in sorted(candidates.items()):
+            key = month_key(month)
+            if key not in archived:
+                start = time.time()
+                path = os.path.join(archive_dir, table.lower(), f"{name}.parquet")
+                rows = write_parquet(source, table, name, path)
+                low, high = month_bounds(month)
+                archived[key] = {
+                    'file': os.path.relpath(path, archive_dir),
+                    'rows': rows,
+                    'start': low,
+                    'end': high,
+                    'archived_at': time.time(),
+                }
+                save_index(archive_dir, index)
+                log.info("archived %s (%s rows) in %.2fs", name, rows, time.time() - start)
+            report.setdefault(table, []).append(name)
+
+        if keep_partitions:
+            continue
+        for label, conn in conns.items():
+            for month, name in sorted(month_tables(conn, table).items()):
+                entry = archived.get(month_key(month))
+                if entry is None:
+                    continue
+                rows = count_rows(conn, name)
+                if rows != entry['rows']:
+                    log.warning("%s on %s has %s rows, the archive has %s: not dropped",
+                                name, label, rows, entry['rows'])
+                    report.setdefault('mismatched', []).append(f"{label}:{name}")
+                    continue
+                drop_month_table(conn, name)
+                log.info("dropped %s on %s", name, label)
+    return report
+
+
+class ArchiveReader:
+    """
+    /employee/records、/boss/subordinate_record 查詢舊月份時的讀取路徑
+    index.json 依 mtime 重新載入；查詢區間沒有落在已封存月份時不會讀任何檔案
+    每次只讀符合條件的 row group (pyarrow filters)，不會把整個月份留在記憶體裡
+    """
+
+    def __init__(self, archive_dir=CONFIG['archiveDir']):
+        self.archive_dir = archive_dir
+        self._lock = threading.Lock()
+        self._index = {}
+        self._index_mtime = None
+
+    def index(self):
+        try:
+            mtime = os.stat(index_path(self.archive_dir)).st_mtime
+        except FileNotFoundError:
+            return {}
+        if mtime != self._index_mtime:
+            with self._lock:
+                if mtime != self._index_mtime:
+                    self._index = load_index(self.archive_dir)
+                    self._index_mtime = mtime
+        return self._index
+
+    def months(self, table, ts, te):
+        """和 [ts, te] 重疊的已封存月份"""
+        return [entry for entry in self.index().get(table, {}).values()
+                if entry['start'] <= te and entry['end'] > ts]
+
+    def records(self, table, ts, te, user_id=None):
+        """[(user_id, type, time, ...)]，依時間由新到舊"""
+        months = self.months(table, ts, te)
+        if not months:
+            return []
+        import pyarrow.parquet as pq
+
+        filters = [('time', '>=', ts), ('time', '<=', te)]
+        if user_id is not None:
+            filters.append(('user_id', '=', user_id))
+        rows = []
+        for entry in months:
+            path = os.path.join(self.archive_dir, entry['file'])
+            found = pq.read_table(path, columns=COLUMNS[table], filters=filters)
+            rows.extend(zip(*(found.column(c).to_pylist() for c in COLUMNS[table])))
+        rows.sort(key=lambda r: r[2], reverse=True)
+        return rows
+
+
+if __name__ == "__main__":
+    from restore_database import connect
+
+    parser = argparse.ArgumentParser(
+        description="Move old Record / Log partitions to Parquet files")
+    parser.add_argument('--months', type=int, default=CONFIG['archiveMonths'],
+                        help='archive partitions older than this many months')
+    parser.add_argument('--table', choices=PARTITIONED, action='append',
+                        help='default: Record and Log')
+    parser.add_argument('--archive-dir', default=CONFIG['archiveDir'])
+    parser.add_argument('--keep-partitions', action='store_true',
+                        help='only write the files, do not drop the partitions')
+    args = parser.parse_args()
+
+    conns = {'main': connect('main'), 'backup': connect('backup')}
+    try:
+        report = archive_partitions(conns, args.table or PARTITIONED, args.months,
+                                    args.archive_dir, args.keep_partitions)
+    finally:
+        for conn in conns.values():
+            conn.close()
+    for table, names in report.items():
+        print(f"{table}: {', '.join(names)}")
+    if not report:
+        print("nothing to archive")
@@ -0,0 +1,389 @@
+# async_api.py
+# asyncio serving mode (aiohttp + asyncpg) for the hottest endpoints:
+# token check, clock-in and record queries. same URLs and responses as api.py
+import argparse
+import asyncio
+import json
+import logging
+import time
+import asyncpg
+from aiohttp import web
+from archive import ArchiveReader
+from attendance import rollup_insert_query
+from failover import CircuitBreaker
+from structured_logging import REQUEST_ID, new_request_id, setup_logging
+from token_cache import TokenCache, TokenInvalidationFeed
+
+# read host name from url.json file
+with open('access_control_system/url.json') as f:
+    data = json.load(f)
+    HOST = data['host']
+    PORT = data['port']
+
+# read host name from backup_url.json file
+with open('access_control_system/backup_url.json') as f:
+    data = json.load(f)
+    BACKUPHOST = data['host']
+    BACKUPPORT = data['port']
+
+# configurations for database connection
+CONFIG = {
+    'host': HOST,
+    'port': PORT,
+    'dbName': 'yugabyte',
+    'dbUser': 'yugabyte',
+    'dbPassword': 'yugabyte',
+    'sslMode': '',
+    'sslRootCert': '',
+    # asyncpg pools (one per cluster)
+    'poolMinSize': 2,
+    'poolMaxSize': 50,
+    'poolTimeout': 5,                # seconds to wait for a free connection
+    'queryTimeout': 5,               # seconds before a statement is given up on
+    # access token validation cache
+    'tokenCacheSize': 10000,
+    'tokenCacheTTL': 300,
+    # tokens rotated through api.py are polled from Author; the cache is bypassed
+    # when the poll has not succeeded for tokenCacheMaxStaleness seconds
+    'tokenInvalidationInterval': 1,
+    'tokenCacheMaxStaleness': 5,
+    # circuit breaker per cluster
+    'failureThreshold': 3,
+    'circuitResetTimeout': 30,
+    'logLevel': 'INFO',
+    'logFile': '',
+}
+
+TOKEN_EXPIRATION = 3600  # 1 hour expiration time
+
+CLUSTERS = {
+    'main': (HOST, PORT),
+    'backup': (BACKUPHOST, BACKUPPORT),
+}
+
+setup_logging(CONFIG['logLevel'], CONFIG['logFile'])
+log = logging.getLogger('access_control.async_api')
+
+# months moved to Parquet by archive.py
+ARCHIVE = ArchiveReader()
+
+TOKEN_CACHE = TokenCache(max_size=CONFIG['tokenCacheSize'], ttl=CONFIG['tokenCacheTTL'],
+                         max_staleness=CONFIG['tokenCacheMaxStaleness'])
+# polled by poll_token_rotations() on the event loop instead of its own thread
+TOKEN_FEED = TokenInvalidationFeed(TOKEN_CACHE, interval=CONFIG['tokenInvalidationInterval'])
+BREAKERS = {name: CircuitBreaker(name, CONFIG['failureThreshold'], CONFIG['circuitResetTimeout'])
+            for name in CLUSTERS}
+
+AUTH_QUERY = "SELECT created_at FROM Author WHERE access_token = $1 AND user_id = $2"
+# token_cache.ROTATIONS_QUERY with asyncpg placeholders
+ROTATIONS_QUERY = "SELECT user_id, access_token, created_at FROM Author WHERE created_at > $1"
+# also keeps DailyAttendance up to date (attendance.py); returns no row for a duplicate punch
+RECORD_INSERT_QUERY = rollup_insert_query('($1, $2, $3)', 'ON CONFLICT DO NOTHING')
+RECORD_RANGE_QUERY = """
+    SELECT user_id, type, time FROM Record
+    WHERE time >= $1 AND time <= $2
+    ORDER BY time DESC
+"""
+USER_RECORD_RANGE_QUERY = """
+    SELECT user_id, type, time FROM Record
+    WHERE user_id = $1 AND time >= $2 AND time <= $3
+    ORDER BY time DESC
+"""
+ACCOUNTS_QUERY = "SELECT account, boss_id FROM employeeaccount"
+
+
+class ClusterUnavailable(Exception):
+    pass
+
+
+class AsyncPools:
+    """
+    每個 cluster 一個 asyncpg pool，第一次用到時才建立 (備份資料庫暫時連不上也能啟動)
+    asyncpg 會自動快取每條連線的 prepared statement
+    """
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = asyncio.Lock()
+
+    async def get(self, name):
+        pool = self._pools.get(name)
+        if pool is not None:
+            return pool
+        async with self._lock:
+            if name not in self._pools:
+                host, port = CLUSTERS[name]
+                kwargs = {}
+                if CONFIG['sslMode'] != '':
+                    kwargs['ssl'] = CONFIG['sslMode']
+                self._pools[name] = await asyncpg.create_pool(
+                    host=host, port=port, database=CONFIG['dbName'],
+                    user=CONFIG['dbUser'], password=CONFIG['dbPassword'],
+                    min_size=CONFIG['poolMinSize'], max_size=CONFIG['poolMaxSize'],
+                    timeout=CONFIG['poolTimeout'], command_timeout=CONFIG['queryTimeout'],
+                    **kwargs)
+            return self._pools[name]
+
+    async def run(self, name, func):
+        """在 cluster 上執行 func(conn)，並更新該 cluster 的 circuit breaker"""
+        breaker = BREAKERS[name]
+        if not breaker.allow_request():
+            raise ClusterUnavailable(f"{name} YugabyteDB circuit is open")
+        try:
+            pool = await self.get(name)
+            async with pool.acquire(timeout=CONFIG['poolTimeout']) as conn:
+                result = await func(conn)
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError,
+                asyncpg.InterfaceError) as e:
+            breaker.record_failure(e)
+            raise
+        except Exception:
+            # the cluster answered (e.g. a constraint error), so it is healthy
+            breaker.record_success()
+            raise
+        breaker.record_success()
+        return result
+
+    async def run_with_fallback(self, func):
+        """先用主要資料庫，失敗再用備份資料庫；回傳 (結果, 是否用了備份)"""
+        try:
+            return await self.run('main', func), False
+        except Exception as e:
+            log.warning("Exception while querying from Main YugabyteDB: %s", e)
+        return await self.run('backup', func), True
+
+    async def close(self):
+        for pool in self._pools.values():
+            await pool.close()
+
+
+POOLS = AsyncPools()
+
+
+async def authorization(access_token, user_id):
+    token_time = TOKEN_CACHE.get(user_id, access_token)
+    if token_time is None:
+        try:
+            token_time, _ = await POOLS.run_with_fallback(
+                lambda conn: conn.fetchval(AUTH_QUERY, access_token, user_id))
+        except Exception as e:
+            log.warning("Exception while connecting to Backup YugabyteDB: %s", e)
+            return None
+        if token_time is None:
+            return "Invalid"
+        TOKEN_CACHE.put(user_id, access_token, token_time)
+    if time.time() - token_time > TOKEN_EXPIRATION:
+        return "Expired"
+    return "Valid"
+
+
+async def read_json(request):
+    try:
+        return await request.json() if request.can_read_body else {}
+    except ValueError:
+        return None
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def record_dicts(rows):
+    return [{'user_id': r['user_id'], 'type': r['type'], 'time': r['time']} for r in rows]
+
+
+@web.middleware
+async def request_id_middleware(request, handler):
+    REQUEST_ID.set(request.headers.get('X-Request-ID') or new_request_id())
+    response = await handler(request)
+    response.headers['X-Request-ID'] = REQUEST_ID.get()
+    return response
+
+
+async def run_authorization(request):
+    data = await read_json(request) or {}
+    access_token = data.get('access_token') or request.query.get('access_token') \
+        or request.headers.get('Authorization')
+    user_id = data.get('user_id') or request.query.get('user_id') \
+        or request.headers.get('X-User-ID')
+    if not access_token or not user_id:
+        return web.json_response({"result": "Invalid", "message": "未提供認證信息"}, status=401)
+
+    result = await authorization(access_token, user_id)
+    if result is None:
+        return web.json_response({"result": "Error", "message": "資料庫連線失敗"}, status=500)
+    if result != "Valid":
+        return web.json_response({"result": result}, status=401)
+    return web.json_response({"result": "Valid"}, status=200)
+
+
+async def verify_employee_token(request):
+    """驗證成功回傳 None，否則回傳錯誤 response"""
+    access_token = request.headers.get('Authorization')
+    user_id = request.headers.get('X-User-ID')
+    if not access_token or not user_id:
+        return web.json_response({'status': 'error', 'message': '未提供身份認證'}, status=401)
+    result = await authorization(access_token, user_id)
+    if result == "Expired":
+        return web.json_response({'status': 'error', 'message': '認證已過期'}, status=401)
+    if result != "Valid":
+        return web.json_response({'status': 'error', 'message': '無效的認證'}, status=401)
+    return None
+
+
+def failed_write(result):
+    # a key violation is an answer (the punch is already there), not a failed cluster
+    return isinstance(result, BaseException) and \
+        not isinstance(result, asyncpg.UniqueViolationError)
+
+
+def inserted(result):
+    # ON CONFLICT DO NOTHING returns no row when the punch is already there
+    return not isinstance(result, BaseException) and bool(result)
+
+
+async def employee_records(request):
+    error = await verify_employee_token(request)
+    if error is not None:
+        return error
+    data = await read_json(request)
+    if data is None:
+        return web.json_response({'status': 'error', 'message': '請提供 JSON'}, status=400)
+    user_id = data.get('user_id')
+    if request.headers.get('X-User-ID') != user_id:
+        return web.json_response({'status': 'error', 'message': '無權限訪問'}, status=403)
+
+    if request.method == 'GET':
+        start_time = data.get('time_start')
+        end_time = data.get('time_end')
+        if not is_number(start_time) or not is_number(end_time):
+            return web.json_response({'status': 'error', 'message': '缺少必要參數'}, status=400)
+        try:
+            rows, used_backup = await POOLS.run_with_fallback(
+                lambda conn: conn.fetch(USER_RECORD_RANGE_QUERY, user_id,
+                                        float(start_time), float(end_time)))
+            # old months archived to Parquet: read the files off the event loop
+            archived = await asyncio.get_running_loop().run_in_executor(
+                None, ARCHIVE.records, 'Record', float(start_time), float(end_time), user_id)
+        except Exception as e:
+            return web.json_response({'status': 'error', 'message': f'查詢失敗: {e}'}, status=500)
+        data = record_dicts(rows)
+        if archived:
+            seen = {(r['user_id'], r['type'], r['time']) for r in data}
+            data.extend({'user_id': r[0], 'type': r[1], 'time': r[2]}
+                        for r in archived if (r[0], r[1], r[2]) not in seen)
+            data.sort(key=lambda r: r['time'], reverse=True)
+        return web.json_response({
+            'status': 'success',
+            'message': '查詢成功 (使用備份資料庫)' if used_backup else '查詢成功',
+            'data': data
+        }, status=200)
+
+    # POST: clock-in / clock-out
+    record_type = data.get('type')
+    record_time = data.get('time')
+    if not user_id or not record_type or not is_number(record_time):
+        return web.json_response({'status': 'error', 'message': '缺少必要參數'}, status=400)
+    if record_type not in ['i', 'o']:
+        return web.json_response(
+            {'status': 'error', 'message': '打卡類型必須為 i (上班) 或 o (下班)'}, status=400)
+
+    # main and backup are written at the same time instead of one after the other
+    main_result, backup_result = await asyncio.gather(
+        POOLS.run('main', lambda conn: conn.fetch(
+            RECORD_INSERT_QUERY, user_id, record_type, float(record_time))),
+        POOLS.run('backup', lambda conn: conn.fetch(
+            RECORD_INSERT_QUERY, user_id, record_type, float(record_time))),
+        return_exceptions=True)
+    main_failed = failed_write(main_result)
+    backup_failed = failed_write(backup_result)
+    if main_failed and backup_failed:
+        return web.json_response({
+            'status': 'error',
+            'message': f'新增打卡記錄失敗: {main_result}, 備份操作也失敗: {backup_result}'
+        }, status=500)
+    if backup_failed:
+        # consistency_check.py copies the row to the backup cluster later
+        log.warning("Exception while inserting into Backup YugabyteDB: %s", backup_result)
+    if main_failed:
+        log.warning("Exception while inserting into Main YugabyteDB: %s", main_result)
+    # the answer comes from main, backup only counts while main is down
+    if not inserted(backup_result if main_failed else main_result):
+        return web.json_response({'status': 'error', 'message': '打卡記錄已存在'}, status=409)
+    if not main_failed and not backup_failed and not inserted(backup_result):
+        log.warning("Punch (%s, %s, %s) already on Backup YugabyteDB",
+                    user_id, record_type, record_time)
+    return web.json_response({
+        'status': 'success',
+        'message': '打卡記錄已新增 (使用備份數據庫)' if main_failed else '打卡記錄已新增',
+    }, status=201)
+
+
+async def record_query(request):
+    data = await read_json(request)
+    if data is None:
+        return web.json_response({'error': '請提供 JSON 並含 time_start, time_end'}, status=400)
+    ts = data.get('time_start')
+    te = data.get('time_end')
+    if not is_number(ts) or not is_number(te):
+        return web.json_response({'error': 'time_start 與 time_end 必須為數字'}, status=400)
+
+    async def query(conn):
+        rows = await conn.fetch(RECORD_RANGE_QUERY, float(ts), float(te))
+        accounts = await conn.fetch(ACCOUNTS_QUERY)
+        return rows, accounts
+
+    try:
+        (rows, accounts), _ = await POOLS.run_with_fallback(query)
+    except Exception as e:
+        log.warning("Exception while querying from Backup YugabyteDB: %s", e)
+        return web.json_response({'error': str(e)}, status=500)
+    return web.json_response({
+        'status': 'success',
+        'data': record_dicts(rows),
+        'accounts': [{"employee": r['account'], "boss": r['boss_id']} for r in accounts]
+    })
+
+
+async def poll_token_rotations():
+    # TokenInvalidationFeed.poll() without the thread: drop tokens rotated elsewhere
+    while True:
+        started_at = time.time()
+        try:
+            rows, _ = await POOLS.run_with_fallback(
+                lambda conn: conn.fetch(ROTATIONS_QUERY, *TOKEN_FEED.query_params()))
+            TOKEN_FEED.apply(rows, started_at)
+        except Exception as e:
+            TOKEN_FEED.errors += 1
+            log.warning("Token rotation poll failed: %s", e)
+        await asyncio.sleep(TOKEN_FEED.interval)
+
+
+async def start_token_feed(app):
+    app['token_feed'] = asyncio.get_running_loop().create_task(poll_token_rotations())
+
+
+async def close_pools(app):
+    task = app.get('token_feed')
+    if task is not None:
+        task.cancel()
+    await POOLS.close()
+
+
+def create_app():
+    app = web.Application(middlewares=[request_id_middleware])
+    app.router.add_get('/authorization/authorize', run_authorization)
+    app.router.add_route('GET', '/employee/records', employee_records)
+    app.router.add_route('POST', '/employee/records', employee_records)
+    app.router.add_get('/record', record_query)
+    app.on_startup.append(start_token_feed)
+    app.on_cleanup.append(close_pools)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="asyncio API for clock-in / token check / records")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
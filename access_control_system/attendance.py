@@ -0,0 +1,217 @@
+# attendance.py
+# DailyAttendance rollup: one row per employee per local day, updated by every clock-in
+import argparse
+import datetime
+import math
+import time
+
+UTC_OFFSET = 8 * 3600  # attendance days are counted in local time (UTC+8, no DST)
+EPOCH_DAY = datetime.date(1970, 1, 1)
+
+
+def day_sql(column):
+    """Record.time (epoch 秒) -> 當地日期，不受 session 時區影響"""
+    return f"(DATE '1970-01-01' + floor(({column} + {UTC_OFFSET}) / 86400)::int)"
+
+
+def day_of(t):
+    return EPOCH_DAY + datetime.timedelta(days=math.floor((t + UTC_OFFSET) / 86400))
+
+
+def day_start(day):
+    """當地日期 00:00 的 epoch 秒"""
+    return (day - EPOCH_DAY).days * 86400 - UTC_OFFSET
+
+
+# aggregate the punches of a row source per (user_id, day)
+_ROLLUP_SELECT = """
+    SELECT user_id, {day} AS day,
+           MIN(time) FILTER (WHERE type = 'i') AS first_in,
+           MAX(time) FILTER (WHERE type = 'o') AS last_out,
+           COALESCE(GREATEST(MAX(time) FILTER (WHERE type = 'o')
+                             - MIN(time) FILTER (WHERE type = 'i'), 0), 0) AS worked_seconds,
+           COUNT(*) AS punch_count
+    FROM {source}
+    GROUP BY user_id, 2
+""".format(day=day_sql('time'), source='{source}')
+
+
+def rollup_insert_query(values, on_conflict=''):
+    """
+    寫入 Record 並在同一個 statement 更新 DailyAttendance
+    只有真的新增的打卡 (RETURNING) 會算進 rollup，重複補傳不會重複計算
+    回傳新增的 (user_id, type, time)
+    values: '(%s, %s, %s)'、execute_values 的 '%s' 或 asyncpg 的 '($1, $2, $3)'
+    """
+    return """
+        WITH inserted AS (
+            INSERT INTO Record (user_id, type, time)
+            VALUES {values}
+            {on_conflict}
+            RETURNING user_id, type, time
+        ), rollup AS (
+            INSERT INTO DailyAttendance
+                (user_id, day, first_in, last_out, worked_seconds, punch_count)
+            {select}
+            ON CONFLICT (user_id, day) DO UPDATE SET
+                first_in = LEAST(DailyAttendance.first_in, EXCLUDED.first_in),
+                last_out = GREATEST(DailyAttendance.last_out, EXCLUDED.last_out),
+                worked_seconds = COALESCE(GREATEST(
+                    GREATEST(DailyAttendance.last_out, EXCLUDED.last_out)
+                    - LEAST(DailyAttendance.first_in, EXCLUDED.first_in), 0), 0),
+                punch_count = DailyAttendance.punch_count + EXCLUDED.punch_count
+        )
+        SELECT user_id, type, time FROM inserted
+    """.format(values=values, on_conflict=on_conflict,
+               select=_ROLLUP_SELECT.format(source='inserted'))
+
+
+# /employee/records/batch (api.py): pure checks, no database access
+def validate_batch_records(records, allowed_users):
+    """
+    一次檢查所有打卡資料
+    回傳 (rows, statuses)：rows 是可寫入的 (index, user_id, type, time)，
+    statuses 是每一筆的結果 (不合法的先填好)
+    """
+    rows = []
+    statuses = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            statuses.append({'index': index, 'status': 'invalid',
+                            'message': '格式錯誤'})
+            continue
+        user_id = record.get('user_id')
+        record_type = record.get('type')
+        record_time = record.get('time')
+        status = {'index': index, 'user_id': user_id}
+        if not user_id or not record_type or not record_time:
+            status.update({'status': 'invalid', 'message': '缺少必要參數'})
+        elif not isinstance(user_id, str):
+            status.update({'status': 'invalid', 'message': 'user_id 必須為字串'})
+        elif record_type not in ['i', 'o']:
+            status.update({'status': 'invalid',
+                          'message': '打卡類型必須為 i (上班) 或 o (下班)'})
+        elif isinstance(record_time, bool) or not isinstance(record_time, (int, float)):
+            status.update({'status': 'invalid', 'message': 'time 必須為數字'})
+        elif user_id not in allowed_users:
+            status.update({'status': 'forbidden', 'message': '無權限訪問'})
+        else:
+            rows.append((index, user_id, record_type, float(record_time)))
+        statuses.append(status)
+    return rows, statuses
+
+
+def full_day_range(ts, te):
+    """
+    [ts, te] 內完整涵蓋的當地日期 (first_day ~ last_day) 以及它們的起訖 epoch 秒
+    頭尾不完整的那兩天要從 Record 算；沒有完整的一天時 first_day > last_day
+    """
+    first_day = day_of(ts)
+    if day_start(first_day) < ts:
+        first_day += datetime.timedelta(days=1)
+    last_day = day_of(te) - datetime.timedelta(days=1)
+    if first_day > last_day:
+        return first_day, last_day, te, te
+    return first_day, last_day, day_start(first_day), \
+        day_start(last_day + datetime.timedelta(days=1))
+
+
+def query_attendance_rows(cursor, ts, te):
+    """
+    每位員工在 [ts, te] 內最早的上班 (i) 與最晚的下班 (o) 時間與打卡次數
+    完整的日期直接讀 DailyAttendance (每人每天一筆)，只有頭尾不完整的日期掃 Record
+    回傳 [(account, boss_id, first_in, last_out, punch_count)]，沒有打卡的員工 punch_count 為 0
+    """
+    first_day, last_day, full_start, full_end = full_day_range(ts, te)
+    cursor.execute("""
+        WITH days AS (
+            SELECT user_id, MIN(first_in) AS first_in, MAX(last_out) AS last_out,
+                   SUM(punch_count) AS punch_count
+            FROM DailyAttendance
+            WHERE day >= %s AND day <= %s
+            GROUP BY user_id
+        ), edges AS (
+            SELECT user_id,
+                   MIN(time) FILTER (WHERE type = 'i') AS first_in,
+                   MAX(time) FILTER (WHERE type = 'o') AS last_out,
+                   COUNT(*) AS punch_count
+            FROM Record
+            WHERE (time >= %s AND time < %s) OR (time >= %s AND time <= %s)
+            GROUP BY user_id
+        )
+        SELECT e.account, e.boss_id,
+               LEAST(d.first_in, x.first_in),
+               GREATEST(d.last_out, x.last_out),
+               COALESCE(d.punch_count, 0) + COALESCE(x.punch_count, 0)
+        FROM employeeaccount e
+        LEFT JOIN days d ON d.user_id = e.account
+        LEFT JOIN edges x ON x.user_id = e.account
+    """, (first_day, last_day, ts, full_start, full_end, te))
+    return cursor.fetchall()
+
+
+def day_runs(times):
+    """epoch 秒 -> 涵蓋這些時間的連續日期區間 [(since, until)]，給 backfill_attendance 用"""
+    runs = []
+    for day in sorted({day_of(t) for t in times}):
+        if runs and runs[-1][1] == day:
+            runs[-1][1] = day + datetime.timedelta(days=1)
+        else:
+            runs.append([day, day + datetime.timedelta(days=1)])
+    return [tuple(run) for run in runs]
+
+
+def backfill_attendance(conn, since=None, until=None, chunk_days=31):
+    """
+    由 Record 重新計算 [since, until) 這些日期的 DailyAttendance (整天覆蓋)，
+    每 chunk_days 天一個 transaction；沒有指定時涵蓋 Record 的所有資料
+    """
+    with conn.cursor() as cursor:
+        if since is None or until is None:
+            cursor.execute("SELECT MIN(time), MAX(time) FROM Record")
+            low, high = cursor.fetchone()
+            conn.commit()
+            if low is None:
+                return 0
+            since = since or day_of(low)
+            until = until or day_of(high) + datetime.timedelta(days=1)
+        total = 0
+        day = since
+        while day < until:
+            end = min(day + datetime.timedelta(days=chunk_days), until)
+            cursor.execute(
+                "DELETE FROM DailyAttendance WHERE day >= %s AND day < %s", (day, end))
+            cursor.execute("""
+                INSERT INTO DailyAttendance
+                    (user_id, day, first_in, last_out, worked_seconds, punch_count)
+                {}
+            """.format(_ROLLUP_SELECT.format(
+                source='(SELECT user_id, type, time FROM Record '
+                       'WHERE time >= %s AND time < %s) r')),
+                (day_start(day), day_start(end)))
+            total += cursor.rowcount
+            conn.commit()
+            day = end
+    return total
+
+
+if __name__ == "__main__":
+    from restore_database import connect
+
+    parser = argparse.ArgumentParser(description="Rebuild DailyAttendance from Record")
+    parser.add_argument('--target', choices=['main', 'backup', 'both'], default='both')
+    parser.add_argument('--since', type=datetime.date.fromisoformat,
+                        help='first day to rebuild (YYYY-MM-DD), default: oldest record')
+    parser.add_argument('--until', type=datetime.date.fromisoformat,
+                        help='rebuild up to (not including) this day, default: newest record')
+    parser.add_argument('--chunk-days', type=int, default=31)
+    args = parser.parse_args()
+
+    for cluster in (('main', 'backup') if args.target == 'both' else (args.target,)):
+        start = time.time()
+        conn = connect(cluster)
+        try:
+            rows = backfill_attendance(conn, args.since, args.until, args.chunk_days)
+        finally:
+            conn.close()
+        print(f"[{cluster}] {rows} employee-days rebuilt in {time.time() - start:.2f}s")
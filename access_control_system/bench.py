@@ -0,0 +1,83 @@
+# bench.py
+# simple HTTP load generator: compare requests/sec of api.py (dev server) and serve.py
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+_local = threading.local()
+
+
+def session():
+    # one keep-alive connection per client thread
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def one_request(method, url, body, headers):
+    start = time.perf_counter()
+    try:
+        response = session().request(method, url, json=body, headers=headers, timeout=30)
+        ok = response.status_code < 500
+    except requests.RequestException:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def bench(url, method='GET', body=None, headers=None, requests_total=2000, concurrency=50):
+    # warm up pools / caches so the first connections are not measured
+    for _ in range(min(concurrency, 20)):
+        one_request(method, url, body, headers)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: one_request(method, url, body, headers),
+                                    range(requests_total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(r[0] for r in results)
+    errors = sum(1 for r in results if not r[1])
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    summary = {
+        'url': url,
+        'requests': requests_total,
+        'concurrency': concurrency,
+        'errors': errors,
+        'seconds': round(elapsed, 2),
+        'requests_per_sec': round(requests_total / elapsed, 1),
+        'p50_ms': round(percentile(0.50), 2),
+        'p95_ms': round(percentile(0.95), 2),
+        'p99_ms': round(percentile(0.99), 2),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+    }
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure requests/sec of the API")
+    parser.add_argument('--url', action='append',
+                        help='endpoint to test, repeat to compare servers '
+                             '(default: http://localhost:5000/failover/status)')
+    parser.add_argument('--method', default='GET')
+    parser.add_argument('--json', help='JSON request body')
+    parser.add_argument('--header', action='append', default=[],
+                        help='extra header "Name: value" (e.g. Authorization)')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    headers = dict(h.split(': ', 1) for h in args.header)
+    body = json.loads(args.json) if args.json else None
+    for url in args.url or ['http://localhost:5000/failover/status']:
+        result = bench(url, args.method, body, headers, args.requests, args.concurrency)
+        print(f"{url}: {result['requests_per_sec']} req/s, p50 {result['p50_ms']} ms, "
+              f"p95 {result['p95_ms']} ms, p99 {result['p99_ms']} ms, "
+              f"{result['errors']} errors")
+        print(json.dumps(result))
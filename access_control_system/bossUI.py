@@ -329,9 +329,12 @@ def query_employee_records():
     
     # 選擇要查詢的員工
     while True:
-        emp_idx = input("\n請選擇要查詢的員工編號 (輸入 0 返回): ")
+        emp_idx = input("\n請選擇要查詢的員工編號 (輸入 a 查詢全部下屬，輸入 0 返回): ")
         if emp_idx == "0":
             return
+        if emp_idx.lower() == "a":
+            employee_id = None
+            break
         
         try:
             emp_idx = int(emp_idx) - 1
@@ -369,6 +372,10 @@ def query_employee_records():
             "Content-Type": "application/json"
         }
         
+        if employee_id is None:
+            query_team_records(headers, start_time, end_time)
+            return
+
         # 提示訊息顯示人類可讀的時間格式
         print(f"\n正在查詢 {employee_id} 從 {format_timestamp(start_time)} 到 {format_timestamp(end_time)} 的記錄...")
         
@@ -407,6 +414,33 @@ def query_employee_records():
     
     input("\n按 Enter 返回主選單...")
 
+def query_team_records(headers, start_time, end_time):
+    """一次查詢全部下屬的打卡記錄 (/boss/team_records)"""
+    try:
+        print(f"\n正在查詢全部下屬從 {format_timestamp(start_time)} 到 {format_timestamp(end_time)} 的記錄...")
+        response = requests.post(
+            f"{BASE_URL}/boss/team_records",
+            json={"start_time": start_time, "end_time": end_time},
+            headers=headers
+        )
+        if response.status_code == 200:
+            result = response.json()
+            print("\n===== 全部下屬打卡記錄 =====")
+            for employee in result.get("data", []):
+                records = employee["records"]
+                print(f"\n{employee['user_id']} (共 {len(records)} 筆)")
+                if not records:
+                    print("  該時間範圍內沒有打卡記錄。")
+                for i, record in enumerate(records, 1):
+                    record_type = "上班" if record["type"] == "i" else "下班"
+                    print(f"  {i}. {format_timestamp(record['time'])} - {record_type}")
+        else:
+            print(f"\n查詢失敗 (HTTP {response.status_code})")
+    except Exception as e:
+        print(f"\n查詢過程中發生錯誤: {e}")
+
+    input("\n按 Enter 返回主選單...")
+
 def query_employee_salary():
     """查詢員工薪資"""
     if not check_auth():
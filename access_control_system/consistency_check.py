@@ -0,0 +1,237 @@
+# consistency_check.py
+# compare the main and backup clusters with chunked range hashes and repair the drift
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2.extras
+from attendance import backfill_attendance, day_runs
+from restore_database import connect
+
+# table -> primary key, compared columns and how rows are split into chunks
+# ('time', column): fixed-width time ranges, ('hash', column): hash buckets of the key
+CHECK_TABLES = {
+    'Author': {'key': ['user_id'],
+               'columns': ['user_id', 'access_token', 'refresh_token', 'created_at'],
+               'bucket': ('hash', 'user_id')},
+    'Record': {'key': ['user_id', 'time', 'type'],
+               'columns': ['user_id', 'type', 'time'],
+               'bucket': ('time', 'time')},
+    'Log': {'key': ['user_id', 'time', 'type'],
+            'columns': ['user_id', 'type', 'time', 'duration'],
+            'bucket': ('time', 'time')},
+    'Salary': {'key': ['user_id'],
+               'columns': ['user_id', 'salary'],
+               'bucket': ('hash', 'user_id')},
+    'EmployeeAccount': {'key': ['account'],
+                        'columns': ['account', 'password', 'boss_id'],
+                        'bucket': ('hash', 'account')},
+    'BossAccount': {'key': ['account'],
+                    'columns': ['account', 'password'],
+                    'bucket': ('hash', 'account')},
+}
+
+FANOUT = 16  # every mismatching chunk is split into FANOUT smaller chunks
+
+
+class Checker:
+    """
+    1. 兩邊各算每個 chunk 的 count 與 md5(依 primary key 排序的所有 row)
+    2. 只有 hash 不同的 chunk 才切成更小的 chunk 再比一次
+    3. chunk 夠小 (leaf_rows 筆以內) 時才把兩邊的 row 拿出來逐筆比較
+    """
+
+    def __init__(self, conns, time_bucket=86400, hash_buckets=16, leaf_rows=1000,
+                 max_level=4):
+        self.conns = conns  # {'main': conn, 'backup': conn}
+        self.time_bucket = time_bucket
+        self.hash_buckets = hash_buckets
+        self.leaf_rows = leaf_rows
+        self.max_level = max_level
+        self.executor = ThreadPoolExecutor(max_workers=len(conns))
+
+    def bucket_expr(self, spec, level):
+        kind, column = spec['bucket']
+        if kind == 'time':
+            # dividing by 16 keeps every width exactly representable as a float
+            return f"floor({column} / {self.time_bucket / FANOUT ** level!r})::bigint"
+        # hashtext() is int4, shift it to be non-negative before mod
+        return (f"mod(hashtext({column}::text)::bigint + 2147483648, "
+                f"{self.hash_buckets * FANOUT ** level})")
+
+    def bucket_filter(self, spec, level, bucket):
+        kind, column = spec['bucket']
+        condition = f"{self.bucket_expr(spec, level)} = %s"
+        if kind == 'time':
+            # range predicate (one width of slack) lets the time index do the work
+            width = self.time_bucket / FANOUT ** level
+            return (f"{column} >= %s AND {column} < %s AND {condition}",
+                    [(bucket - 1) * width, (bucket + 2) * width, bucket])
+        return condition, [bucket]
+
+    def on_both(self, func, *args):
+        # same query on both clusters at the same time
+        futures = {name: self.executor.submit(func, conn, *args)
+                   for name, conn in self.conns.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    def bucket_hashes(self, conn, table, spec, level, parent):
+        row_text = "concat_ws('|', {})".format(
+            ', '.join(f'{c}::text' for c in spec['columns']))
+        query = """
+            SELECT {} AS bucket, count(*), md5(string_agg({}, ',' ORDER BY {}))
+            FROM {}
+        """.format(self.bucket_expr(spec, level), row_text, ', '.join(spec['key']), table)
+        params = []
+        if parent is not None:
+            condition, params = self.bucket_filter(spec, level - 1, parent)
+            query += f" WHERE {condition}"
+        query += " GROUP BY 1"
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            result = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        conn.commit()
+        return result
+
+    def fetch_rows(self, conn, table, spec, level, bucket):
+        condition, params = self.bucket_filter(spec, level, bucket)
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT {', '.join(spec['columns'])} FROM {table} "
+                           f"WHERE {condition}", params)
+            rows = [dict(zip(spec['columns'], row)) for row in cursor.fetchall()]
+        conn.commit()
+        return {tuple(row[k] for k in spec['key']): row for row in rows}
+
+    def check_table(self, table, source, target):
+        """回傳 (統計, 讓 target 與 source 一致的 repair diff)"""
+        spec = CHECK_TABLES[table]
+        stats = {'chunks_compared': 0, 'chunks_mismatched': 0, 'rows_fetched': 0}
+        diffs = []
+        pending = [(0, None)]  # (level, parent bucket)
+        while pending:
+            level, parent = pending.pop()
+            hashes = self.on_both(self.bucket_hashes, table, spec, level, parent)
+            buckets = set(hashes[source]) | set(hashes[target])
+            stats['chunks_compared'] += len(buckets)
+            for bucket in sorted(buckets):
+                src = hashes[source].get(bucket, (0, None))
+                dst = hashes[target].get(bucket, (0, None))
+                if src == dst:
+                    continue
+                stats['chunks_mismatched'] += 1
+                if max(src[0], dst[0]) > self.leaf_rows and level < self.max_level:
+                    pending.append((level + 1, bucket))
+                    continue
+                rows = self.on_both(self.fetch_rows, table, spec, level, bucket)
+                stats['rows_fetched'] += len(rows[source]) + len(rows[target])
+                diffs.extend(diff_rows(table, spec, rows[source], rows[target]))
+        return stats, diffs
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def diff_rows(table, spec, source_rows, target_rows):
+    diffs = []
+    for key, row in source_rows.items():
+        if target_rows.get(key) != row:
+            diffs.append({'table': table, 'op': 'upsert', 'row': row})
+    for key in target_rows.keys() - source_rows.keys():
+        diffs.append({'table': table, 'op': 'delete',
+                      'key': dict(zip(spec['key'], key))})
+    return diffs
+
+
+def apply_repair(conn, diffs):
+    """
+    在一個 transaction 內把 repair diff 套用到 conn
+    修到 Record 時，再由 Record 重建那些日期的 DailyAttendance
+    """
+    with conn.cursor() as cursor:
+        for table, spec in CHECK_TABLES.items():
+            keys = spec['key']
+            rows = [[d['row'][c] for c in spec['columns']]
+                    for d in diffs if d['table'] == table and d['op'] == 'upsert']
+            if rows:
+                updates = [c for c in spec['columns'] if c not in keys]
+                action = ('DO UPDATE SET ' + ', '.join(f'{c} = EXCLUDED.{c}' for c in updates)
+                          if updates else 'DO NOTHING')
+                psycopg2.extras.execute_values(
+                    cursor,
+                    f"INSERT INTO {table} ({', '.join(spec['columns'])}) VALUES %s "
+                    f"ON CONFLICT ({', '.join(keys)}) {action}",
+                    rows)
+            for d in diffs:
+                if d['table'] == table and d['op'] == 'delete':
+                    cursor.execute(
+                        f"DELETE FROM {table} WHERE "
+                        + ' AND '.join(f'{k} = %s' for k in keys),
+                        [d['key'][k] for k in keys])
+    conn.commit()
+
+    # DailyAttendance is derived from Record and is not compared itself
+    times = [d['row']['time'] if d['op'] == 'upsert' else d['key']['time']
+             for d in diffs if d['table'] == 'Record']
+    for since, until in day_runs(times):
+        backfill_attendance(conn, since, until)
+
+
+def consistency_check(tables=None, target='backup', time_bucket=86400, hash_buckets=16,
+                      leaf_rows=1000, output=None, apply=False, no_delete=False):
+    """
+    比對主要與備份資料庫，產生讓 target 跟另一邊一致的 repair diff
+    output: 把 diff 寫成 NDJSON；apply: 直接套用到 target
+    no_delete: 不刪除 target 多出來的資料 (例如主要資料庫故障時直接寫進備份的紀錄)
+    """
+    source = 'main' if target == 'backup' else 'backup'
+    conns = {'main': connect('main'), 'backup': connect('backup')}
+    checker = Checker(conns, time_bucket, hash_buckets, leaf_rows)
+    all_diffs = []
+    try:
+        for table in tables or CHECK_TABLES:
+            start = time.time()
+            stats, diffs = checker.check_table(table, source, target)
+            if no_delete:
+                diffs = [d for d in diffs if d['op'] != 'delete']
+            all_diffs.extend(diffs)
+            print(f"{table}: {stats['chunks_mismatched']}/{stats['chunks_compared']} chunks differ, "
+                  f"{stats['rows_fetched']} rows fetched, {len(diffs)} repairs "
+                  f"({time.time() - start:.2f}s)")
+
+        if output:
+            with open(output, 'w') as f:
+                for d in all_diffs:
+                    f.write(json.dumps(d) + '\n')
+            print(f"Repair diff written to {output}")
+        if apply and all_diffs:
+            apply_repair(conns[target], all_diffs)
+            print(f">>>> Applied {len(all_diffs)} repairs to {target} YugabyteDB")
+        elif not all_diffs:
+            print(">>>> main and backup YugabyteDB are consistent")
+    finally:
+        checker.close()
+        for conn in conns.values():
+            conn.close()
+    return all_diffs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare and repair main / backup YugabyteDB")
+    parser.add_argument('--table', action='append', choices=list(CHECK_TABLES),
+                        help='only check this table (can be repeated)')
+    parser.add_argument('--target', choices=['backup', 'main'], default='backup',
+                        help='the cluster to repair (the other one is the source of truth)')
+    parser.add_argument('--time-bucket', type=float, default=86400,
+                        help='seconds per top-level chunk of Record / Log')
+    parser.add_argument('--hash-buckets', type=int, default=16,
+                        help='top-level chunks of the keyed tables')
+    parser.add_argument('--leaf-rows', type=int, default=1000,
+                        help='compare row by row once a chunk is this small')
+    parser.add_argument('--output', help='write the repair diff (NDJSON) to this file')
+    parser.add_argument('--apply', action='store_true', help='apply the repair diff')
+    parser.add_argument('--no-delete', action='store_true',
+                        help='never delete rows that only exist on the target')
+    args = parser.parse_args()
+
+    consistency_check(args.table, args.target, args.time_bucket, args.hash_buckets,
+                      args.leaf_rows, args.output, args.apply, args.no_delete)
@@ -1,9 +1,13 @@
-# create the table
+# create the tables (runs pending schema migrations, never drops data unless --reset)
+import argparse
 import json
 import psycopg2
 import psycopg2.extras
 import time
 import hashlib
+from attendance import backfill_attendance
+from migrate import migrate_all
+from schema import SCHEMA_VERSION
 
 RECORD = {}
 
@@ -41,40 +45,18 @@ def get_backup_db_connection():
         password=CONFIG['dbPassword'],
         sslrootcert=CONFIG['sslRootCert'])
 
-# create authorization table
-
-
-def create_authorization_table(conn, backup_conn):
-    # drop the table if it exists
-    drop_tables(conn)
-    drop_tables(backup_conn)
-
-    # Create the authorization table if it doesn't exist
-    create_table_query = """
-        CREATE TABLE IF NOT EXISTS Author (
-            user_id VARCHAR(255),
-            access_token VARCHAR(255) NOT NULL,
-            refresh_token VARCHAR(255) NOT NULL,
-            created_at FLOAT NOT NULL
-        )
-    """
-    create_table(conn, create_table_query)
-    create_table(backup_conn, create_table_query)
-
-    print("Author table created successfully.")
-
-    # Insert sample records into the authorization table
-    insert_query = """
-        INSERT INTO Author (user_id, access_token, refresh_token, created_at)
-        VALUES (%s, %s, %s, %s)
-    """
-    RECORD["authorization"] = []
-    insert_authorization_record(
-        conn, backup_conn, create_sample_authorization_record("Jason"), insert_query)
-    insert_authorization_record(
-        conn, backup_conn, create_sample_authorization_record("Sally"), insert_query)
-    insert_authorization_record(
-        conn, backup_conn, create_sample_authorization_record("John"), insert_query)
+# sample authorization records
+
+
+def seed_authorization_table(conn, backup_conn):
+    RECORD["authorization"] = [
+        create_sample_authorization_record("Jason"),
+        create_sample_authorization_record("Sally"),
+        create_sample_authorization_record("John"),
+    ]
+    insert_sample_rows(conn, backup_conn, 'Author',
+                       ['user_id', 'access_token', 'refresh_token', 'created_at'],
+                       RECORD["authorization"])
 
 
 def create_sample_authorization_record(user_id):
@@ -82,12 +64,6 @@ def create_sample_authorization_record(user_id):
     access_token = hashlib.sha256(str(user_id).encode()).hexdigest()
     refresh_token = hashlib.sha256(str(user_id+"refresh").encode()).hexdigest()
     created_at = time.time()
-    RECORD["authorization"].append({
-        'user_id': user_id,
-        'access_token': access_token,
-        'refresh_token': refresh_token,
-        'created_at': created_at
-    })
     # return a dictionary record
     return {
         'user_id': user_id,
@@ -102,10 +78,17 @@ def drop_tables(yb):
         with yb.cursor() as yb_cursor:
             yb_cursor.execute('DROP TABLE IF EXISTS Author')
             yb_cursor.execute('DROP TABLE IF EXISTS Record')
+            yb_cursor.execute('DROP TABLE IF EXISTS DailyAttendance')
             yb_cursor.execute('DROP TABLE IF EXISTS Log')
+            # left over by an interrupted partitioning migration (schema version 4)
+            yb_cursor.execute('DROP TABLE IF EXISTS record_unpartitioned')
+            yb_cursor.execute('DROP TABLE IF EXISTS log_unpartitioned')
             yb_cursor.execute('DROP TABLE IF EXISTS Salary')
             yb_cursor.execute('DROP TABLE IF EXISTS EmployeeAccount')
             yb_cursor.execute('DROP TABLE IF EXISTS BossAccount')
+            yb_cursor.execute('DROP TABLE IF EXISTS PayrollRun')
+            yb_cursor.execute('DROP TABLE IF EXISTS OrgVersion')
+            yb_cursor.execute('DROP TABLE IF EXISTS schema_migrations')
 
         yb.commit()
     except Exception as e:
@@ -114,60 +97,16 @@ def drop_tables(yb):
         exit(1)
 
 
-def insert_authorization_record(yb, backup_conn, record, insert_query):
-    try:
-        with yb.cursor() as yb_cursor:
-            yb_cursor.execute(insert_query, (record['user_id'], record['access_token'],
-                                             record['refresh_token'], record['created_at']))
-        yb.commit()
-    except Exception as e:
-        print("Exception while inserting record into authorization table")
-        print(e)
-        exit(1)
-    try:
-        with backup_conn.cursor() as yb_cursor:
-            yb_cursor.execute(insert_query, (record['user_id'], record['access_token'],
-                                             record['refresh_token'], record['created_at']))
-        backup_conn.commit()
-    except Exception as e:
-        print("Exception while inserting record into authorization table")
-        print(e)
-        exit(1)
-    print(record)
-
-
-def create_record_table(conn, backup_conn):
-    # Create the record table if it doesn't exist
-    create_table_query = """
-        CREATE TABLE IF NOT EXISTS Record (
-            user_id VARCHAR(255),
-            type VARCHAR(255) NOT NULL,
-            time FLOAT NOT NULL
-        )
-    """
-    create_table(conn, create_table_query)
-    create_table(backup_conn, create_table_query)
-
-    print("Record table created successfully.")
-
-    # Insert sample records into the record table
-    insert_query = """
-        INSERT INTO Record (user_id, type, time)
-        VALUES (%s, %s, %s)
-    """
-    RECORD["record"] = []
-    insert_record_record(
-        conn, backup_conn, create_record_sample_record("Jason", "i"), insert_query)
-    insert_record_record(
-        conn, backup_conn, create_record_sample_record("Jason", "o"), insert_query)
+def seed_record_table(conn, backup_conn):
+    RECORD["record"] = [
+        create_record_sample_record("Jason", "i"),
+        create_record_sample_record("Jason", "o"),
+    ]
+    insert_sample_rows(conn, backup_conn, 'Record',
+                       ['user_id', 'type', 'time'], RECORD["record"])
 
 
 def create_record_sample_record(user_id, type):
-    RECORD["record"].append({
-        'user_id': user_id,
-        'type': type,
-        'time': time.time()
-    })
     return {
         'user_id': user_id,
         'type': type,
@@ -175,64 +114,17 @@ def create_record_sample_record(user_id, type):
     }
 
 
-def insert_record_record(yb, backup_conn, record, insert_query):
-    try:
-        with yb.cursor() as yb_cursor:
-            yb_cursor.execute(insert_query, (record['user_id'], record['type'],
-                                             record['time']))
-        yb.commit()
-    except Exception as e:
-        print("Exception while inserting record into authorization table")
-        print(e)
-        exit(1)
-    try:
-        with backup_conn.cursor() as yb_cursor:
-            yb_cursor.execute(insert_query, (record['user_id'], record['type'],
-                                             record['time']))
-        backup_conn.commit()
-    except Exception as e:
-        print("Exception while inserting record into authorization table")
-        print(e)
-        exit(1)
-    print(record)
-
-
-def create_log_table(conn, backup_conn):
-    # Create the record table if it doesn't exist
-    create_table_query = """
-        CREATE TABLE IF NOT EXISTS Log (
-            user_id VARCHAR(255),
-            type VARCHAR(255) NOT NULL,
-            time FLOAT NOT NULL,
-            duration FLOAT NOT NULL
-        )
-    """
-    create_table(conn, create_table_query)
-    create_table(backup_conn, create_table_query)
-
-    print("Log table created successfully.")
-
-    # Insert sample records into the record table
-    insert_query = """
-        INSERT INTO Log (user_id, type, time, duration)
-        VALUES (%s, %s, %s, %s)
-    """
-    RECORD["log"] = []
-    insert_log_record(
-        conn, backup_conn, create_log_sample_record("Jason", "absent", 3600*8), insert_query)
-    insert_log_record(
-        conn, backup_conn, create_log_sample_record("Jason", "late", 3600), insert_query)
-    insert_log_record(
-        conn, backup_conn, create_log_sample_record("Jason", "overtime", 7200), insert_query)
+def seed_log_table(conn, backup_conn):
+    RECORD["log"] = [
+        create_log_sample_record("Jason", "absent", 3600*8),
+        create_log_sample_record("Jason", "late", 3600),
+        create_log_sample_record("Jason", "overtime", 7200),
+    ]
+    insert_sample_rows(conn, backup_conn, 'Log',
+                       ['user_id', 'type', 'time', 'duration'], RECORD["log"])
 
 
 def create_log_sample_record(user_id, type, duration):
-    RECORD["log"].append({
-        'user_id': user_id,
-        'type': type,
-        'time': time.time(),
-        'duration': duration
-    })
     # return a dictionary record
     return {
         'user_id': user_id,
@@ -242,116 +134,27 @@ def create_log_sample_record(user_id, type, duration):
     }
 
 
-def insert_log_record(yb, backup_conn, record, insert_query):
-    try:
-        with yb.cursor() as yb_cursor:
-            yb_cursor.execute(insert_query, (record['user_id'], record['type'],
-                                             record['time'], record['duration']))
-        yb.commit()
-    except Exception as e:
-        print("Exception while inserting record into authorization table")
-        print(e)
-        exit(1)
-    try:
-        with backup_conn.cursor() as yb_cursor:
-            yb_cursor.execute(insert_query, (record['user_id'], record['type'],
-                                             record['time'], record['duration']))
-        backup_conn.commit()
-    except Exception as e:
-        print("Exception while inserting record into authorization table")
-        print(e)
-        exit(1)
-    print(record)
-
-
-def create_salary_table(conn, backup_conn):
-    # Create the record table if it doesn't exist
-    create_table_query = """
-        CREATE TABLE IF NOT EXISTS Salary (
-            user_id VARCHAR(255),
-            salary FLOAT NOT NULL
-        )
-    """
-    create_table(conn, create_table_query)
-    create_table(backup_conn, create_table_query)
-
-    print("Salary table created successfully.")
-
-    # Insert sample records into the record table
-    insert_query = """
-        INSERT INTO Salary (user_id, salary)
-        VALUES (%s, %s)
-    """
-    RECORD["salary"] = []
-    insert_salary_record(
-        conn, backup_conn, create_salary_sample_record("Jason"), insert_query)
+def seed_salary_table(conn, backup_conn):
+    RECORD["salary"] = [create_salary_sample_record("Jason")]
+    insert_sample_rows(conn, backup_conn, 'Salary',
+                       ['user_id', 'salary'], RECORD["salary"])
 
 
 def create_salary_sample_record(user_id):
-    RECORD["salary"].append({
-        'user_id': user_id,
-        'salary': 10000
-    })
-
     return {
         'user_id': user_id,
         'salary': 10000
     }
 
 
-def insert_salary_record(yb, backup_conn, record, insert_query):
-    try:
-        with yb.cursor() as yb_cursor:
-            yb_cursor.execute(
-                insert_query, (record['user_id'], record['salary']))
-        yb.commit()
-    except Exception as e:
-        print("Exception while inserting record into Log table")
-        print(e)
-        exit(1)
-    try:
-        with backup_conn.cursor() as yb_cursor:
-            yb_cursor.execute(
-                insert_query, (record['user_id'], record['salary']))
-        backup_conn.commit()
-    except Exception as e:
-        print("Exception while inserting record into Log table")
-        print(e)
-        exit(1)
-    print(record)
-
-
-def create_employee_account_table(conn, backup_conn):
-    # Create the record table if it doesn't exist
-    create_table_query = """
-        CREATE TABLE IF NOT EXISTS EmployeeAccount (
-            account VARCHAR(255) NOT NULL,
-            password VARCHAR(255) NOT NULL,
-            boss_id VARCHAR(255) NOT NULL
-        )
-    """
-    create_table(conn, create_table_query)
-    create_table(backup_conn, create_table_query)
-
-    print("EmployeeAccount table created successfully.")
-
-    # Insert sample records into the record table
-    insert_query = """
-        INSERT INTO EmployeeAccount (account, password, boss_id)
-        VALUES (%s, %s, %s)
-    """
-    RECORD["employee_account"] = []
-    insert_employee_account_record(
-        conn, backup_conn, create_employee_account_sample_record("Jason", "Sally"), insert_query)
+def seed_employee_account_table(conn, backup_conn):
+    RECORD["employee_account"] = [
+        create_employee_account_sample_record("Jason", "Sally")]
+    insert_sample_rows(conn, backup_conn, 'EmployeeAccount',
+                       ['account', 'password', 'boss_id'], RECORD["employee_account"])
 
 
 def create_employee_account_sample_record(user_id, boss_id):
-    RECORD["employee_account"].append({
-        'account': user_id,
-        'password': user_id,
-        'boss_id': boss_id
-    })
-
     return {
         'account': user_id,
         'password': user_id,
@@ -359,100 +162,49 @@ def create_employee_account_sample_record(user_id, boss_id):
     }
 
 
-def insert_employee_account_record(yb, backup_conn, record, insert_query):
-    try:
-        with yb.cursor() as yb_cursor:
-            yb_cursor.execute(
-                insert_query, (record['account'], record['password'], record['boss_id']))
-        yb.commit()
-    except Exception as e:
-        print("Exception while inserting record into EmployeeAccount table")
-        print(e)
-        exit(1)
-    try:
-        with backup_conn.cursor() as yb_cursor:
-            yb_cursor.execute(
-                insert_query, (record['account'], record['password'], record['boss_id']))
-        backup_conn.commit()
-    except Exception as e:
-        print("Exception while inserting record into EmployeeAccount table")
-        print(e)
-        exit(1)
-    print(record)
-
-
-def create_boss_account_table(conn, backup_conn):
-    # Create the record table if it doesn't exist
-    create_table_query = """
-        CREATE TABLE IF NOT EXISTS BossAccount (
-            account VARCHAR(255) NOT NULL,
-            password VARCHAR(255) NOT NULL
-        )
-    """
-    create_table(conn, create_table_query)
-    create_table(backup_conn, create_table_query)
-
-    print("BossAccount table created successfully.")
-
-    # Insert sample records into the record table
-    insert_query = """
-        INSERT INTO BossAccount (account, password)
-        VALUES (%s, %s)
-    """
-    RECORD["boss_account"] = []
-    insert_boss_account_record(
-        conn, backup_conn, create_boss_account_sample_record("Sally"), insert_query)
-    insert_boss_account_record(
-        conn, backup_conn, create_boss_account_sample_record("John"), insert_query)
+def seed_boss_account_table(conn, backup_conn):
+    RECORD["boss_account"] = [
+        create_boss_account_sample_record("Sally"),
+        create_boss_account_sample_record("John"),
+    ]
+    insert_sample_rows(conn, backup_conn, 'BossAccount',
+                       ['account', 'password'], RECORD["boss_account"])
 
 
 def create_boss_account_sample_record(user_id):
-    RECORD["boss_account"].append({
-        'account': user_id,
-        'password': user_id
-    })
-
     return {
         'account': user_id,
         'password': user_id
     }
 
 
-def insert_boss_account_record(yb, backup_conn, record, insert_query):
-    try:
-        with yb.cursor() as yb_cursor:
-            yb_cursor.execute(
-                insert_query, (record['account'], record['password']))
-        yb.commit()
-    except Exception as e:
-        print("Exception while inserting record into BossAccount table")
-        print(e)
-        exit(1)
-    try:
-        with backup_conn.cursor() as yb_cursor:
-            yb_cursor.execute(
-                insert_query, (record['account'], record['password']))
-        backup_conn.commit()
-    except Exception as e:
-        print("Exception while inserting record into BossAccount table")
-        print(e)
-        exit(1)
-    print(record)
-
-
-def create_table(yb, create_table_query):
-    try:
-        with yb.cursor() as yb_cursor:
-            yb_cursor.execute(create_table_query)
-        yb.commit()
-    except Exception as e:
-        print("Exception while creating table in YugabyteDB")
-        print(e)
-        exit(1)
+def insert_sample_rows(conn, backup_conn, table, columns, records):
+    # one multi-row insert and one commit per cluster; existing rows are kept
+    insert_query = "INSERT INTO %s (%s) VALUES %%s ON CONFLICT DO NOTHING" % (
+        table, ', '.join(columns))
+    rows = [tuple(record[c] for c in columns) for record in records]
+    for label, yb in (('main', conn), ('backup', backup_conn)):
+        try:
+            with yb.cursor() as yb_cursor:
+                psycopg2.extras.execute_values(yb_cursor, insert_query, rows)
+            yb.commit()
+        except Exception as e:
+            print(f"Exception while inserting sample rows into {table} table ({label})")
+            print(e)
+            exit(1)
+    print(f"{table}: {len(rows)} sample rows")
 
 
 # test
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create / upgrade the database schema")
+    parser.add_argument('--seed', action='store_true',
+                        help='insert the sample rows and write sample_record.json')
+    parser.add_argument('--reset', action='store_true',
+                        help='DROP all tables first (development only, deletes all data)')
+    args = parser.parse_args()
+
     try:
         conn = psycopg2.connect(host=CONFIG['host'], port=CONFIG['port'], database=CONFIG['dbName'],
                                 user=CONFIG['dbUser'], password=CONFIG['dbPassword'],
@@ -471,19 +223,33 @@ if __name__ == "__main__":
         exit(1)
 
     print(">>>> Successfully connected to YugabyteDB!")
-    create_authorization_table(conn, backup_conn)  # finish backup
-    create_record_table(conn, backup_conn)  # finish backup
-    create_log_table(conn, backup_conn)  # finish backup
-    create_salary_table(conn, backup_conn)  # finish backup
-    create_employee_account_table(conn, backup_conn)    # finish backup
-    create_boss_account_table(conn, backup_conn)
-    print("Tables created successfully.")
+    if args.reset:
+        drop_tables(conn)
+        drop_tables(backup_conn)
+        print("All tables dropped.")
+
+    # apply pending migrations on both clusters in parallel
+    migrate_all({'main': conn, 'backup': backup_conn})
+    conn.autocommit = False
+    backup_conn.autocommit = False
+    print(f"Tables are at schema version {SCHEMA_VERSION}.")
+
+    if args.seed:
+        seed_authorization_table(conn, backup_conn)
+        seed_record_table(conn, backup_conn)
+        # sample punches are inserted directly, build their DailyAttendance rows
+        backfill_attendance(conn)
+        backfill_attendance(backup_conn)
+        seed_log_table(conn, backup_conn)
+        seed_salary_table(conn, backup_conn)
+        seed_employee_account_table(conn, backup_conn)
+        seed_boss_account_table(conn, backup_conn)
+        # write the records to a json file
+        with open('access_control_system/sample_record.json', 'w') as f:
+            # clean the file
+            f.truncate(0)
+            # write the records to the file
+            json.dump(RECORD, f, indent=4)
     # Close the connection
     conn.close()
     backup_conn.close()
-    # write the records to a json file
-    with open('access_control_system/sample_record.json', 'w') as f:
-        # clean the file
-        f.truncate(0)
-        # write the records to the file
-        json.dump(RECORD, f, indent=4)
@@ -0,0 +1,294 @@
+# db_pool.py
+# shared, thread-safe connection pool for the main and backup YugabyteDB clusters
+import threading
+import time
+import psycopg2
+
+
+class PoolTimeout(Exception):
+    """在 checkout timeout 內拿不到連線"""
+    pass
+
+
+class PooledConnection:
+    """
+    包裝 psycopg2 connection。
+    呼叫 close() 時不會真的斷線，而是把連線還給 pool，
+    所以原本 conn = get_db_connection() ... conn.close() 的寫法不需要修改。
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._returned = False
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def close(self):
+        # return the connection to the pool instead of closing it
+        if self._returned:
+            return
+        self._returned = True
+        self._pool.putconn(self._raw)
+
+    def cursor(self, *args, **kwargs):
+        if self._returned:
+            raise psycopg2.InterfaceError("connection already returned to pool")
+        cursor = self._raw.cursor(*args, **kwargs)
+        if self._pool.cursor_wrapper is not None:
+            return self._pool.cursor_wrapper(cursor)
+        return cursor
+
+    def __getattr__(self, name):
+        if self._returned:
+            raise psycopg2.InterfaceError("connection already returned to pool")
+        return getattr(self._raw, name)
+
+    def __del__(self):
+        # safety net: handlers that forget to close() still give the connection back
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    執行緒安全的連線池
+    - minconn: 閒置回收時至少保留的連線數
+    - maxconn: 同時借出 + 閒置的連線上限
+    - timeout: 借連線時最多等待幾秒
+    - max_idle: 閒置超過幾秒的連線會被關閉 (保留 minconn 條)
+    - health_check_interval: 閒置超過幾秒的連線在借出前先用 SELECT 1 檢查
+    """
+
+    def __init__(self, name, host, port, database, user, password,
+                 sslmode='', sslrootcert='', minconn=1, maxconn=10, timeout=5,
+                 max_idle=300, health_check_interval=30, connect_timeout=10):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("invalid pool size: minconn=%s maxconn=%s" %
+                             (minconn, maxconn))
+        self.name = name
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self._connect_kwargs = {
+            'host': host,
+            'port': port,
+            'database': database,
+            'user': user,
+            'password': password,
+            'connect_timeout': connect_timeout,
+        }
+        if sslmode != '':
+            self._connect_kwargs['sslmode'] = sslmode
+        if sslrootcert != '':
+            self._connect_kwargs['sslrootcert'] = sslrootcert
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = []       # [(raw connection, last used time)], newest at the end
+        self._in_use = set()  # id() of checked out raw connections
+        self._size = 0        # idle + in use + connections being opened
+        self._closed = False
+        # optional callable wrapping every cursor handed out (e.g. metrics.TimedCursor)
+        self.cursor_wrapper = None
+        # optional callable(error) for a checked out connection that comes back broken
+        # (server gone in the middle of a query), e.g. failover.CircuitBreaker.record_failure
+        self.on_broken = None
+
+        # counters for monitoring
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded': 0,
+            'reaped': 0,
+            'health_check_failures': 0,
+            'wait_time_total': 0.0,
+        }
+
+    def _connect(self):
+        return psycopg2.connect(**self._connect_kwargs)
+
+    def _is_healthy(self, raw, last_used):
+        if raw.closed:
+            return False
+        if time.time() - last_used < self.health_check_interval:
+            return True
+        try:
+            with raw.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            raw.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _close_raw(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _reap_locked(self, now):
+        # close connections idle longer than max_idle, keep at least minconn
+        reaped = []
+        while self._idle and self._size > self.minconn:
+            raw, last_used = self._idle[0]
+            if now - last_used < self.max_idle:
+                break
+            self._idle.pop(0)
+            self._size -= 1
+            self._stats['reaped'] += 1
+            reaped.append(raw)
+        return reaped
+
+    def getconn(self):
+        """借一條連線，回傳 PooledConnection"""
+        start = time.time()
+        deadline = start + self.timeout
+        while True:
+            raw = None
+            last_used = None
+            with self._lock:
+                if self._closed:
+                    raise psycopg2.InterfaceError("pool %s is closed" % self.name)
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            "timed out after %ss waiting for a connection from pool %s"
+                            % (self.timeout, self.name))
+                    self._available.wait(remaining)
+                if self._idle:
+                    raw, last_used = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if raw is None:
+                # open a new connection outside the lock
+                try:
+                    raw = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._available.notify()
+                    raise
+                with self._lock:
+                    self._stats['created'] += 1
+            elif not self._is_healthy(raw, last_used):
+                self._close_raw(raw)
+                with self._lock:
+                    self._size -= 1
+                    self._stats['discarded'] += 1
+                    self._stats['health_check_failures'] += 1
+                    self._available.notify()
+                continue
+
+            with self._lock:
+                self._in_use.add(id(raw))
+                self._stats['checkouts'] += 1
+                self._stats['wait_time_total'] += time.time() - start
+            return PooledConnection(self, raw)
+
+    def putconn(self, raw, discard=False):
+        """把連線還回 pool，壞掉的連線直接丟棄"""
+        broken = None
+        if raw.closed:
+            broken = psycopg2.InterfaceError("connection closed while checked out")
+        elif not discard:
+            try:
+                # never hand out a connection in the middle of a transaction
+                raw.rollback()
+            except Exception as e:
+                discard = True
+                broken = e
+        now = time.time()
+        with self._lock:
+            self._in_use.discard(id(raw))
+            if discard or raw.closed or self._closed:
+                self._size -= 1
+                self._stats['discarded'] += 1
+                to_close = [raw]
+            else:
+                self._idle.append((raw, now))
+                to_close = []
+            to_close.extend(self._reap_locked(now))
+            self._available.notify()
+        for conn in to_close:
+            self._close_raw(conn)
+        if broken is not None and self.on_broken is not None:
+            self.on_broken(broken)
+
+    def probe(self, timeout=3):
+        """開一條新的連線 (不經過 pool) 執行 SELECT 1，用來做健康檢查"""
+        kwargs = dict(self._connect_kwargs, connect_timeout=timeout)
+        raw = psycopg2.connect(**kwargs)
+        try:
+            with raw.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        finally:
+            self._close_raw(raw)
+
+    def warmup(self):
+        """預先建立 minconn 條連線"""
+        conns = []
+        try:
+            for _ in range(self.minconn):
+                conns.append(self.getconn())
+        finally:
+            for conn in conns:
+                conn.close()
+
+    def reap_idle(self):
+        with self._lock:
+            reaped = self._reap_locked(time.time())
+        for raw in reaped:
+            self._close_raw(raw)
+        return len(reaped)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'name': self.name,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'minconn': self.minconn,
+                'maxconn': self.maxconn,
+            })
+        return stats
+
+    def closeall(self):
+        with self._lock:
+            self._closed = True
+            idle = [raw for raw, _ in self._idle]
+            self._size -= len(idle)
+            self._idle = []
+            self._available.notify_all()
+        for raw in idle:
+            self._close_raw(raw)
+
+
+def create_pool(name, config, host=None, port=None):
+    """用各模組的 CONFIG dict 建立 pool"""
+    return ConnectionPool(
+        name,
+        host=host or config['host'],
+        port=port or config['port'],
+        database=config['dbName'],
+        user=config['dbUser'],
+        password=config['dbPassword'],
+        sslmode=config.get('sslMode', ''),
+        sslrootcert=config.get('sslRootCert', ''),
+        minconn=config.get('poolMinSize', 1),
+        maxconn=config.get('poolMaxSize', 10),
+        timeout=config.get('poolTimeout', 5),
+        max_idle=config.get('poolMaxIdle', 300),
+        health_check_interval=config.get('poolHealthCheckInterval', 30))
@@ -1,5 +1,16 @@
+import argparse
+import gzip
+import io
+import os
 import psycopg2
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard  # optional, only needed for --compress zstd
+except ImportError:
+    zstandard = None
 
 # read host name from host.json file
 # backup_url
@@ -18,20 +29,74 @@ CONFIG = {
     'sslRootCert': ''
 }
 
+# dump name -> table name (same keys as the JSON dump)
+DUMP_TABLES = {
+    'author': 'author',
+    'record': 'record',
+    'log': 'log',
+    'salary': 'salary',
+    'employee_account': 'employeeaccount',
+    'boss_account': 'bossaccount',
+}
+
+COMPRESSION_SUFFIX = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+# dump name -> monotonic time column used as the incremental high-water mark,
+# the other (small) tables are dumped in full every time
+WATERMARK_COLUMNS = {
+    'author': 'created_at',
+    'record': 'time',
+    'log': 'time',
+}
+
+# watermarks of the last ndjson dump and the chain it belongs to
+DEFAULT_STATE_FILE = 'access_control_system/dump_state.json'
+
+# the watermark columns hold the client supplied punch time, not the time the row was
+# written: a reader that uploads its buffer late (/employee/records/batch) or a replayed
+# punch lands behind the watermark. every incremental dump re-exports this many seconds
+# before it (restore de-duplicates), rows arriving later than that are only in the next
+# base dump
+DEFAULT_OVERLAP = 24 * 3600
+
+
+def connect():
+    if CONFIG['sslMode'] != '':
+        return psycopg2.connect(host=CONFIG['host'], port=CONFIG['port'], database=CONFIG['dbName'],
+                                user=CONFIG['dbUser'], password=CONFIG['dbPassword'],
+                                sslmode=CONFIG['sslMode'], sslrootcert=CONFIG['sslRootCert'],
+                                connect_timeout=10)
+    return psycopg2.connect(host=CONFIG['host'], port=CONFIG['port'], database=CONFIG['dbName'],
+                            user=CONFIG['dbUser'], password=CONFIG['dbPassword'],
+                            connect_timeout=10)
+
+
+def open_dump_file(path, mode, compression=None):
+    """
+    開啟 NDJSON 檔 (文字模式)，依副檔名或 compression 決定 gzip / zstd
+    mode: 'w' 或 'r'
+    """
+    if compression is None:
+        compression = 'gzip' if path.endswith('.gz') else 'zstd' if path.endswith('.zst') else 'none'
+    if compression == 'gzip':
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd compression requires the 'zstandard' package")
+        raw = open(path, mode + 'b')
+        if mode == 'w':
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
 
 def dump_database(target_file):
     data = {}
     # connect to the database
     try:
-        if CONFIG['sslMode'] != '':
-            conn = psycopg2.connect(host=CONFIG['host'], port=CONFIG['port'], database=CONFIG['dbName'],
-                                    user=CONFIG['dbUser'], password=CONFIG['dbPassword'],
-                                    sslmode=CONFIG['sslMode'], sslrootcert=CONFIG['sslRootCert'],
-                                    connect_timeout=10)
-        else:
-            conn = psycopg2.connect(host=CONFIG['host'], port=CONFIG['port'], database=CONFIG['dbName'],
-                                    user=CONFIG['dbUser'], password=CONFIG['dbPassword'],
-                                    connect_timeout=10)
+        conn = connect()
     except Exception as e:
         print("Exception while connecting to YugabyteDB")
         print(e)
@@ -90,6 +155,162 @@ def dump_database(target_file):
     print(">>>> Successfully dumped database to file: ", target_file)
 
 
+def dump_table(name, table, target_dir, fetch_size, compression, since=None):
+    """
+    用 server-side cursor 把一個資料表串流寫成 NDJSON (一行一筆)，
+    每次只從資料庫拿 fetch_size 筆，記憶體用量與資料量無關
+    since 不是 None 時只匯出 watermark 欄位大於 since 的資料 (incremental)
+    """
+    path = os.path.join(target_dir, name + '.ndjson' + COMPRESSION_SUFFIX[compression])
+    column = WATERMARK_COLUMNS.get(name)
+    query, params = f"SELECT * FROM {table}", None
+    if column is not None and since is not None:
+        query, params = query + f" WHERE {column} > %s", (since,)
+    start = time.time()
+    rows = 0
+    watermark = since
+    conn = connect()
+    try:
+        conn.set_session(readonly=True)
+        with conn.cursor(name=f'dump_{name}') as cur:
+            cur.itersize = fetch_size
+            cur.execute(query, params)
+            columns = None
+            with open_dump_file(path, 'w', compression) as f:
+                while True:
+                    batch = cur.fetchmany(fetch_size)
+                    if not batch:
+                        break
+                    if columns is None:
+                        columns = [desc[0] for desc in cur.description]
+                    f.write(''.join(json.dumps(dict(zip(columns, row))) + '\n'
+                                    for row in batch))
+                    if column is not None:
+                        i = columns.index(column)
+                        top = max(row[i] for row in batch)
+                        watermark = top if watermark is None else max(watermark, top)
+                    rows += len(batch)
+        conn.commit()
+    finally:
+        conn.close()
+    elapsed = time.time() - start
+    print(f"{name}: {rows} rows in {elapsed:.2f}s "
+          f"({rows / elapsed if elapsed > 0 else 0:.0f} rows/sec)")
+    return {'file': os.path.basename(path), 'table': table, 'rows': rows,
+            'seconds': elapsed,
+            'mode': 'incremental' if column is not None and since is not None else 'full',
+            'since': since if column is not None else None,
+            'watermark': watermark}
+
+
+def load_state(state_file):
+    if not os.path.exists(state_file):
+        return None
+    with open(state_file) as f:
+        return json.load(f)
+
+
+def dump_database_stream(target_dir, fetch_size=10000, compression='none', jobs=3,
+                         incremental=False, state_file=DEFAULT_STATE_FILE,
+                         overlap=DEFAULT_OVERLAP):
+    """
+    串流 dump：每個資料表一個 NDJSON 檔 (可選 gzip / zstd)，
+    多個資料表以不同連線平行 dump，最後寫 manifest.json
+    incremental 時依 state_file 記錄的 watermark 只匯出新增的資料 (往前多匯出 overlap 秒)，
+    manifest 的 parent / base 指向前一次與 base dump
+    target_dir 已經有 dump (manifest.json) 時不會覆寫，以免弄壞指向它的 chain
+    """
+    if compression == 'zstd' and zstandard is None:
+        print("zstd compression requires the 'zstandard' package")
+        return None
+    if incremental and overlap <= 0:
+        print("--incremental needs a positive --overlap: the watermarks are client "
+              "supplied punch times, rows uploaded late would be missed")
+        return None
+    if os.path.exists(os.path.join(target_dir, 'manifest.json')):
+        print(f"{target_dir} already holds a dump, choose another --output")
+        return None
+    state = load_state(state_file) if incremental else None
+    if incremental and state is None:
+        print(f"No previous dump recorded in {state_file}, run a full ndjson dump first")
+        return None
+    os.makedirs(target_dir, exist_ok=True)
+    start = time.time()
+
+    since = {}
+    if state is not None:
+        # overlap: 往前多匯出一段，晚上傳的打卡 (time 比 watermark 舊) 才不會被漏掉 (restore 時會去重)
+        since = {name: mark - overlap if mark is not None else None
+                 for name, mark in state['watermarks'].items()}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {name: executor.submit(dump_table, name, table, target_dir,
+                                         fetch_size, compression, since.get(name))
+                   for name, table in DUMP_TABLES.items()}
+        tables = {name: future.result() for name, future in futures.items()}
+
+    manifest = {
+        'format': 'ndjson',
+        'type': 'incremental' if incremental else 'base',
+        'compression': compression,
+        'created_at': start,
+        'parent': state['last_dump'] if incremental else None,
+        'base': state['base'] if incremental else None,
+        'overlap': overlap if incremental else None,
+        'tables': tables,
+    }
+    with open(os.path.join(target_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+    watermarks = {name: tables[name]['watermark'] for name in WATERMARK_COLUMNS}
+    if state is not None:
+        # the overlap starts below the previous watermark: never move it backwards
+        watermarks = {name: max((m for m in (mark, state['watermarks'].get(name))
+                                 if m is not None), default=None)
+                      for name, mark in watermarks.items()}
+    tmp_file = state_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump({'base': state['base'] if incremental else target_dir,
+                   'last_dump': target_dir,
+                   'watermarks': watermarks}, f, indent=4)
+    os.replace(tmp_file, state_file)
+
+    total = sum(t['rows'] for t in tables.values())
+    print(f">>>> Successfully dumped {total} rows to {target_dir} "
+          f"in {time.time() - start:.2f}s")
+    return manifest
+
+
 # run the function
 if __name__ == "__main__":
-    dump_database('access_control_system/dump_database.json')
+    parser = argparse.ArgumentParser(description="Dump the database")
+    parser.add_argument('--format', choices=['json', 'ndjson'], default='json',
+                        help='json: one indented JSON file (default), '
+                             'ndjson: streaming, one file per table')
+    parser.add_argument('--output', help='target file (json) or directory (ndjson)')
+    parser.add_argument('--fetch-size', type=int, default=10000,
+                        help='rows fetched per round trip (ndjson)')
+    parser.add_argument('--compress', choices=['none', 'gzip', 'zstd'], default='none',
+                        help='compress the NDJSON files')
+    parser.add_argument('--jobs', type=int, default=3,
+                        help='tables dumped in parallel (ndjson)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only rows newer than the last ndjson dump (ndjson)')
+    parser.add_argument('--state-file', default=DEFAULT_STATE_FILE,
+                        help='where the per-table watermarks are kept')
+    parser.add_argument('--overlap', type=float, default=DEFAULT_OVERLAP,
+                        help='seconds re-exported before each watermark, must be positive '
+                             '(incremental, default: one day)')
+    args = parser.parse_args()
+    if args.incremental and args.format != 'ndjson':
+        parser.error('--incremental requires --format ndjson')
+
+    if args.format == 'json':
+        dump_database(args.output or 'access_control_system/dump_database.json')
+    else:
+        # every dump gets its own directory, a new base never overwrites an old chain
+        default_output = time.strftime('access_control_system/dump_%Y%m%d_%H%M%S')
+        if not args.incremental:
+            default_output = time.strftime('access_control_system/dump_base_%Y%m%d_%H%M%S')
+        dump_database_stream(args.output or default_output,
+                             args.fetch_size, args.compress, args.jobs,
+                             args.incremental, args.state_file, args.overlap)
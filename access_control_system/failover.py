@@ -0,0 +1,181 @@
+# failover.py
+# circuit breakers and background health probes for the main / backup clusters
+import logging
+import threading
+import time
+import psycopg2
+
+log = logging.getLogger('access_control.failover')
+
+CLOSED = 'closed'        # healthy, requests go to this cluster
+OPEN = 'open'            # unhealthy, requests skip this cluster immediately
+HALF_OPEN = 'half_open'  # reset timeout passed, one trial request is allowed
+
+
+class CircuitOpenError(Exception):
+    """cluster 的 circuit 是 open，直接略過 (不用等連線 timeout)"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    連續失敗 failure_threshold 次後 open，
+    open 超過 reset_timeout 秒後變成 half_open 讓一個 request 試試看，
+    成功就 close (fail-back)，失敗就再 open。
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self.open_count = 0
+        self.last_change = None
+        self.last_error = None
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state_locked()
+
+    def _current_state_locked(self):
+        if self._state == OPEN and time.time() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow_request(self):
+        with self._lock:
+            state = self._current_state_locked()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                log.warning("%s YugabyteDB is healthy again, circuit closed", self.name)
+                self.last_change = time.time()
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """half_open 的試探 request 沒有碰到資料庫就結束 (例如 pool timeout)，讓下一個 request 再試"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self._failures += 1
+            self.last_error = str(error) if error is not None else None
+            state = self._current_state_locked()
+            if state == HALF_OPEN or (state == CLOSED and self._failures >= self.failure_threshold):
+                log.error("%s YugabyteDB is unhealthy, circuit opened", self.name)
+                self._state = OPEN
+                self._opened_at = time.time()
+                self._trial_in_flight = False
+                self.open_count += 1
+                self.last_change = self._opened_at
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._current_state_locked(),
+                'consecutive_failures': self._failures,
+                'open_count': self.open_count,
+                'last_change': self.last_change,
+                'last_error': self.last_error,
+            }
+
+
+class FailoverController:
+    """
+    每個 cluster 一個 CircuitBreaker，背景 thread 每 probe_interval 秒
+    對主要與備份資料庫各做一次 SELECT 1，
+    主要資料庫恢復後 circuit 會自動 close，request 就會回到主要資料庫。
+    - 算失敗的只有連不上 (psycopg2.OperationalError) 與使用中斷線的連線 (pool.on_broken)；
+      SQL 錯誤與 pool timeout (連線都在忙) 不代表 cluster 故障，不會讓 circuit open
+    - fail-back 不會把故障期間寫到備份資料庫的資料補回主要資料庫，
+      請在主要資料庫恢復後執行 consistency_check.py --apply --no-delete
+    """
+
+    def __init__(self, pools, probe_interval=5, probe_timeout=3,
+                 failure_threshold=3, reset_timeout=30):
+        # pools: {'main': ConnectionPool, 'backup': ConnectionPool}
+        self.pools = pools
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.breakers = {name: CircuitBreaker(name, failure_threshold, reset_timeout)
+                         for name in pools}
+        for name, pool in pools.items():
+            # connections lost in the middle of a query count as failures too
+            pool.on_broken = self.breakers[name].record_failure
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """啟動背景健康檢查 (重複呼叫沒有影響)"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='failover-probe', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def getconn(self, name):
+        """從指定 cluster 借連線；circuit open 時立刻丟出 CircuitOpenError"""
+        breaker = self.breakers[name]
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"{name} YugabyteDB circuit is open")
+        try:
+            conn = self.pools[name].getconn()
+        except psycopg2.OperationalError as e:
+            # the cluster refused or dropped the connection
+            breaker.record_failure(e)
+            raise
+        except Exception:
+            # PoolTimeout and friends say nothing about the cluster itself
+            breaker.release_trial()
+            raise
+        if breaker.state != CLOSED:
+            breaker.record_success()
+        return conn
+
+    def is_available(self, name):
+        return self.breakers[name].state != OPEN
+
+    def probe(self, name):
+        try:
+            self.pools[name].probe(self.probe_timeout)
+        except Exception as e:
+            self.breakers[name].record_failure(e)
+            return False
+        self.breakers[name].record_success()
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            for name in self.pools:
+                self.probe(name)
+            self._stop.wait(self.probe_interval)
+
+    def stats(self):
+        return {name: breaker.stats() for name, breaker in self.breakers.items()}
@@ -0,0 +1,296 @@
+# metrics.py
+# in-process counters / histograms, rendered in the Prometheus text format
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class TimedCursor:
+    """包裝 psycopg2 cursor，把 execute / fetch 花的時間算進目前 request 的 DB time"""
+
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def _timed(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._metrics.add_request_time('db', time.perf_counter() - start)
+
+    def execute(self, *args, **kwargs):
+        return self._timed(self._cursor.execute, *args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        return self._timed(self._cursor.executemany, *args, **kwargs)
+
+    def copy_expert(self, *args, **kwargs):
+        return self._timed(self._cursor.copy_expert, *args, **kwargs)
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._timed(self._cursor.fetchmany, *args, **kwargs)
+
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall)
+
+    def __iter__(self):
+        # named cursors fetch from the server while being iterated
+        rows = iter(self._cursor)
+        while True:
+            start = time.perf_counter()
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
+            finally:
+                self._metrics.add_request_time('db', time.perf_counter() - start)
+            yield row
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # e.g. cursor.itersize = ... must reach the real cursor
+        if name in ('_cursor', '_metrics'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cursor, name, value)
+
+
+class Metrics:
+    """
+    執行緒安全的 counter / gauge / histogram
+    另外用 thread local 累計目前 request 的 DB time 與借連線時間，
+    讓 after_request 可以把 request 時間拆成 DB / 借連線 / 程式本身
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._meta = {}        # name -> (type, help), in registration order
+        self._values = {}      # (name, labels) -> counter / gauge value
+        self._histograms = {}  # (name, labels) -> [count per bucket..., sum, count]
+        self._local = threading.local()
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    # per-request timers
+
+    def start_request(self):
+        self._local.timers = {'start': time.perf_counter(), 'db': 0.0, 'acquire': 0.0}
+
+    def add_request_time(self, kind, seconds):
+        timers = getattr(self._local, 'timers', None)
+        if timers is not None:
+            timers[kind] += seconds
+
+    def end_request(self):
+        """回傳 (總時間, DB time, 借連線時間)，沒有 start_request 時回傳 None"""
+        timers = getattr(self._local, 'timers', None)
+        if timers is None:
+            return None
+        self._local.timers = None
+        return time.perf_counter() - timers['start'], timers['db'], timers['acquire']
+
+    def timed_cursor(self, cursor):
+        return TimedCursor(cursor, self)
+
+    @contextmanager
+    def acquire_timer(self, cluster):
+        """計算借連線的時間，並依 cluster 統計成功 / 失敗次數"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.inc('db_acquire_errors_total', cluster=cluster, error=type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.add_request_time('acquire', elapsed)
+            self.observe('db_acquire_seconds', elapsed, cluster=cluster)
+        self.inc('db_connections_total', cluster=cluster)
+
+    def snapshot(self):
+        """目前所有數值 (可 JSON 化)，給其他 worker 合併用"""
+        with self._lock:
+            return {
+                'values': [[name, list(labels), value]
+                           for (name, labels), value in self._values.items()],
+                'histograms': [[name, list(labels), list(h)]
+                               for (name, labels), h in self._histograms.items()],
+            }
+
+    def render(self, snapshots=None):
+        """
+        Prometheus 文字格式；snapshots ({worker: snapshot()}) 不是 None 時
+        輸出每個 worker 的數值並加上 worker label
+        """
+        if snapshots is None:
+            snapshots = {None: self.snapshot()}
+        values, histograms = {}, {}
+        for worker, snapshot in snapshots.items():
+            extra = (('worker', worker),) if worker is not None else ()
+            for name, labels, value in snapshot['values']:
+                values[(name, tuple(map(tuple, labels)) + extra)] = value
+            for name, labels, histogram in snapshot['histograms']:
+                histograms[(name, tuple(map(tuple, labels)) + extra)] = histogram
+        names = list(self._meta)
+        names += sorted(({name for name, _ in values} | {name for name, _ in histograms})
+                        - set(names))
+        lines = []
+        for name in names:
+            kind, help_text = self._meta.get(name, ('untyped', ''))
+            if help_text:
+                lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, histogram):
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} '
+                                 f'{count}')
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} '
+                             f'{histogram[-1]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(histogram[-2])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {histogram[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+class SharedMetrics:
+    """
+    pre-fork 時每個 worker 各有一份 Metrics，scrape 只會打到其中一個 worker：
+    每個 worker 定期把 snapshot 寫到 directory/worker.<slot>.json，
+    /metrics 讀所有還活著的 worker 的檔案，一起輸出 (以 worker label 區分)
+    """
+
+    def __init__(self, metrics, directory, worker, interval=1):
+        self.metrics = metrics
+        self.directory = directory
+        self.worker = str(worker)
+        self.interval = interval
+        self._published_at = 0.0
+
+    def path(self, worker):
+        return os.path.join(self.directory, f'worker.{worker}.json')
+
+    def publish(self, force=False):
+        """寫出這個 worker 的 snapshot (距離上次不到 interval 秒時略過)"""
+        now = time.time()
+        if not force and now - self._published_at < self.interval:
+            return
+        self._published_at = now
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_file = f'{self.path(self.worker)}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'pid': os.getpid(), 'at': now, **self.metrics.snapshot()}, f)
+        os.replace(tmp_file, self.path(self.worker))
+
+    def collect(self):
+        """{worker: snapshot}，已經結束的 worker 留下的檔案不算"""
+        snapshots = {}
+        for name in os.listdir(self.directory):
+            if not (name.startswith('worker.') and name.endswith('.json')):
+                continue
+            worker = name[len('worker.'):-len('.json')]
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if worker != self.worker and not _alive(snapshot['pid']):
+                continue
+            snapshots[worker] = snapshot
+        return snapshots
+
+    def render(self):
+        self.publish(force=True)
+        return self.metrics.render(self.collect())
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+METRICS = Metrics()
+METRICS.describe('http_request_duration_seconds', 'histogram',
+                 'Request latency by route')
+METRICS.describe('http_request_db_seconds', 'histogram',
+                 'Time spent executing queries and fetching rows per request')
+METRICS.describe('http_request_app_seconds', 'histogram',
+                 'Request time outside the database and connection checkout')
+METRICS.describe('db_acquire_seconds', 'histogram',
+                 'Time to check out a pooled connection')
+METRICS.describe('db_connections_total', 'counter',
+                 'Connections checked out per cluster (main = primary, backup = fallback)')
+METRICS.describe('db_acquire_errors_total', 'counter',
+                 'Failed connection checkouts per cluster')
+METRICS.describe('db_pool_connections', 'gauge', 'Pooled connections by state')
+METRICS.describe('db_pool_timeouts_total', 'counter', 'Checkouts that timed out waiting for the pool')
+METRICS.describe('failover_circuit_state', 'gauge', 'Current circuit breaker state per cluster')
+METRICS.describe('failover_circuit_opens_total', 'counter', 'Times a cluster was marked unhealthy')
+METRICS.describe('replication_lag_entries', 'gauge', 'Writes not yet applied to the backup cluster')
+METRICS.describe('replication_lag_seconds', 'gauge', 'Age of the oldest unapplied write')
+METRICS.describe('replication_dead_letters_total', 'counter', 'Writes the backup cluster rejected')
@@ -0,0 +1,156 @@
+# migrate.py
+# idempotent schema migration runner for the main and backup clusters
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+from schema import MIGRATIONS, SCHEMA_VERSION
+
+# read host name from url.json file
+with open('access_control_system/url.json') as f:
+    data = json.load(f)
+    HOST = data['host']
+    PORT = data['port']
+
+# read host name from backup_url.json file
+with open('access_control_system/backup_url.json') as f:
+    data = json.load(f)
+    BACKUPHOST = data['host']
+    BACKUPPORT = data['port']
+
+# configurations for database connection
+CONFIG = {
+    'host': HOST,
+    'port': PORT,
+    'dbName': 'yugabyte',
+    'dbUser': 'yugabyte',
+    'dbPassword': 'yugabyte',
+    'sslMode': '',
+    'sslRootCert': ''
+}
+
+# bookkeeping table: one row per applied migration
+MIGRATION_TABLE_QUERY = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        applied_at FLOAT NOT NULL,
+        duration FLOAT NOT NULL,
+        PRIMARY KEY (version)
+    )
+"""
+
+
+def connect(host, port):
+    return psycopg2.connect(host=host, port=port, database=CONFIG['dbName'],
+                            user=CONFIG['dbUser'], password=CONFIG['dbPassword'],
+                            connect_timeout=10)
+
+
+def get_applied_versions(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(MIGRATION_TABLE_QUERY)
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def describe(statement):
+    # first line of the statement (or of a data step's docstring), for the timing report
+    if callable(statement):
+        statement = statement.__doc__ or statement.__name__
+    return ' '.join(statement.split())[:70]
+
+
+def apply_migration(conn, label, version, name, statements):
+    """
+    執行一個 migration 的所有 DDL，並回傳每個步驟的耗時。
+    DDL 以 autocommit 執行 (每個 statement 各自一個 transaction)，
+    需要多個 statement 一起生效的資料步驟自己開 transaction (例如 schema.add_primary_key)。
+    這裡不保證 index 以 online 方式建立：建立期間是否擋住寫入取決於資料庫版本。
+    """
+    timings = []
+    start = time.time()
+    with conn.cursor() as cursor:
+        for step, statement in enumerate(statements, 1):
+            step_start = time.time()
+            if callable(statement):
+                statement(cursor)
+            else:
+                cursor.execute(statement)
+            elapsed = time.time() - step_start
+            timings.append((step, describe(statement), elapsed))
+            print(f"[{label}] v{version} step {step}/{len(statements)} "
+                  f"{describe(statement)} ... {elapsed:.2f}s")
+        duration = time.time() - start
+        cursor.execute("""
+            INSERT INTO schema_migrations (version, name, applied_at, duration)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (version) DO NOTHING
+        """, (version, name, time.time(), duration))
+    print(f"[{label}] v{version} '{name}' applied in {duration:.2f}s")
+    return timings
+
+
+def migrate(conn, label, target_version=SCHEMA_VERSION):
+    """把一個 cluster 升級到 target_version，回傳 {version: timings}"""
+    conn.autocommit = True
+    applied = get_applied_versions(conn)
+    report = {}
+    for version, name, statements in MIGRATIONS:
+        if version > target_version or version in applied:
+            continue
+        report[version] = apply_migration(
+            conn, label, version, name, statements)
+    if not report:
+        print(f"[{label}] schema is up to date (version {target_version})")
+    return report
+
+
+def migrate_all(connections, target_version=SCHEMA_VERSION):
+    """
+    同時對多個 cluster 執行 migration
+    connections: {'main': conn, 'backup': backup_conn}
+    """
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=len(connections)) as executor:
+        futures = {label: executor.submit(migrate, conn, label, target_version)
+                   for label, conn in connections.items()}
+        reports = {label: future.result()
+                   for label, future in futures.items()}
+    print(f"Schema migration finished in {time.time() - start:.2f}s")
+    return reports
+
+
+def print_status(conn, label):
+    applied = get_applied_versions(conn)
+    for version, name, _ in MIGRATIONS:
+        state = "applied" if version in applied else "pending"
+        print(f"[{label}] v{version} {name}: {state}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Schema migration runner")
+    parser.add_argument('--status', action='store_true',
+                        help='only show applied / pending migrations')
+    parser.add_argument('--target', type=int, default=SCHEMA_VERSION,
+                        help='migrate up to this version (default: latest)')
+    args = parser.parse_args()
+
+    try:
+        conn = connect(HOST, PORT)
+        backup_conn = connect(BACKUPHOST, BACKUPPORT)
+    except Exception as e:
+        print("Exception while connecting to YugabyteDB")
+        print(e)
+        exit(1)
+
+    if args.status:
+        conn.autocommit = True
+        backup_conn.autocommit = True
+        print_status(conn, 'main')
+        print_status(backup_conn, 'backup')
+    else:
+        migrate_all({'main': conn, 'backup': backup_conn}, args.target)
+    conn.close()
+    backup_conn.close()
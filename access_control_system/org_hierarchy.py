@@ -0,0 +1,273 @@
+# org_hierarchy.py
+# in-memory boss -> subordinates index, reloaded in the background when the org chart changes
+import hashlib
+import logging
+import threading
+import time
+
+log = logging.getLogger('access_control.org_hierarchy')
+
+EMPLOYEES_QUERY = "SELECT account, boss_id FROM employeeaccount"
+BOSSES_QUERY = "SELECT account FROM bossaccount"
+# one-row change counter (schema version 7): cheap enough to poll every few seconds
+VERSION_QUERY = "SELECT version FROM OrgVersion WHERE id = 1"
+# run in the same transaction as every employeeaccount / bossaccount change
+BUMP_VERSION_QUERY = "UPDATE OrgVersion SET version = version + 1 WHERE id = 1"
+
+# reporting chains deeper than this are treated as a loop in the data
+MAX_DEPTH = 64
+
+
+class OrgSnapshot:
+    """某個版本的組織圖 (建立後不會再修改，讀取不需要 lock)"""
+
+    def __init__(self, employees, bosses, version, fingerprint):
+        self.boss_of = dict(employees)           # employee -> direct boss
+        self.bosses = frozenset(bosses)
+        self.version = version
+        self.fingerprint = fingerprint
+        self.loaded_at = time.time()
+        reports = {}
+        for account, boss_id in self.boss_of.items():
+            reports.setdefault(boss_id, []).append(account)
+        self.reports = {boss_id: tuple(sorted(accounts)) for boss_id, accounts in reports.items()}
+        # (boss, depth) -> subordinates, filled on first use
+        self._subordinates = {}
+
+    def subordinates(self, boss_id, depth):
+        """depth 層以內的下屬 (depth 0 = 整條匯報鏈)，依層級、帳號排序"""
+        key = (boss_id, depth)
+        cached = self._subordinates.get(key)
+        if cached is not None:
+            return cached
+        result, seen = [], {boss_id}
+        level, frontier = 0, [boss_id]
+        while frontier and level < (depth or MAX_DEPTH):
+            level += 1
+            next_frontier = []
+            for boss in frontier:
+                for account in self.reports.get(boss, ()):
+                    if account not in seen:
+                        seen.add(account)
+                        result.append(account)
+                        next_frontier.append(account)
+            frontier = next_frontier
+        cached = self._subordinates[key] = tuple(result)
+        return cached
+
+
+def fingerprint(employees, bosses):
+    digest = hashlib.md5()
+    for account, boss_id in sorted(employees):
+        digest.update(f"{account}\0{boss_id}\n".encode())
+    digest.update(b'--\n')
+    for account in sorted(bosses):
+        digest.update(f"{account}\n".encode())
+    return digest.hexdigest()
+
+
+class OrgHierarchy:
+    """
+    employeeaccount / bossaccount 的記憶體索引，讓權限與下屬檢查不需要查資料庫
+    - 第一次 start() 時載入，之後每 poll_interval 秒讀 OrgVersion，其他 process 改過組織圖
+      (BUMP_VERSION_QUERY) 就重新讀取；另外每 reload_interval 秒一定重新讀取一次
+      (沒有經過 api.py 的修改)，內容有變才換成新版本
+    - employee_register 直接呼叫 add_employee()，這個 process 立刻看得到
+    - 還沒載入成功前 is_boss() / subordinates() 回傳 None，呼叫端改查資料庫
+    """
+
+    def __init__(self, pools, reload_interval=60, depth=1, poll_interval=2):
+        # pools: {'main': ConnectionPool, 'backup': ConnectionPool}, tried in order
+        self.pools = pools
+        self.reload_interval = reload_interval
+        self.poll_interval = poll_interval
+        self.depth = depth
+        self.reloads = 0
+        self.last_error = None
+        self.db_version = None   # OrgVersion of the last reload
+        self._snapshot = None
+        # changes published by this process: [(seq, employee, boss)], replayed on top of a
+        # reload whose fetch() started before them
+        self._local = []
+        self._local_seq = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    def start(self):
+        """啟動背景載入 / 定期重新載入 (重複呼叫沒有影響)"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='org-hierarchy', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _query(self, func):
+        # func(cursor) on the first cluster that answers
+        error = None
+        for name, pool in self.pools.items():
+            try:
+                conn = pool.getconn()
+            except Exception as e:
+                error = e
+                continue
+            try:
+                with conn.cursor() as cursor:
+                    result = func(cursor)
+                conn.commit()
+                return result
+            except Exception as e:
+                conn.rollback()
+                error = e
+            finally:
+                conn.close()
+        raise error
+
+    def fetch(self):
+        """從第一個可用的 cluster 讀出 (員工, 上司) 與主管帳號"""
+        def read(cursor):
+            cursor.execute(EMPLOYEES_QUERY)
+            employees = cursor.fetchall()
+            cursor.execute(BOSSES_QUERY)
+            return employees, [row[0] for row in cursor.fetchall()]
+        return self._query(read)
+
+    def poll(self):
+        """目前的 OrgVersion，查不到 (例如 migration 7 還沒套用) 時回傳 None"""
+        def read(cursor):
+            cursor.execute(VERSION_QUERY)
+            row = cursor.fetchone()
+            return row[0] if row else None
+        try:
+            return self._query(read)
+        except Exception as e:
+            log.debug("org version poll failed: %s", e)
+            return None
+
+    def reload(self, db_version=None):
+        """
+        重新讀取組織圖，內容沒變時保留原本的版本；回傳目前版本
+        db_version: 讀取前 poll() 到的 OrgVersion
+        """
+        with self._lock:
+            started_seq = self._local_seq
+        try:
+            employees, bosses = self.fetch()
+        except Exception as e:
+            self.last_error = str(e)
+            log.warning("org hierarchy reload failed: %s", e)
+            return self.version
+        self.last_error = None
+        self.reloads += 1
+        if db_version is not None:
+            self.db_version = db_version
+        with self._lock:
+            # add_employee() / add_boss() calls made while fetch() ran may not be in its result
+            employees, bosses = dict(employees), set(bosses)
+            self._local = [change for change in self._local if change[0] > started_seq]
+            for _, employee, boss in self._local:
+                if employee is not None:
+                    employees[employee[0]] = employee[1]
+                if boss is not None:
+                    bosses.add(boss)
+            employees = list(employees.items())
+            digest = fingerprint(employees, bosses)
+            current = self._snapshot
+            if current is None or current.fingerprint != digest:
+                version = current.version + 1 if current is not None else 1
+                self._snapshot = OrgSnapshot(employees, bosses, version, digest)
+                log.info("org hierarchy loaded", extra={
+                    'version': version, 'employees': len(employees), 'bosses': len(bosses)})
+        return self.version
+
+    def _run(self):
+        next_reload = 0
+        while not self._stop.is_set():
+            db_version = self.poll()
+            changed = db_version is not None and db_version != self.db_version
+            if changed or time.time() >= next_reload:
+                self.reload(db_version)
+                next_reload = time.time() + self.reload_interval
+            self._stop.wait(self.poll_interval)
+
+    def _update(self, employee=None, boss=None):
+        # copy-on-write: readers keep using the old snapshot until the new one is swapped in
+        with self._lock:
+            self._local_seq += 1
+            self._local.append((self._local_seq, employee, boss))
+            current = self._snapshot
+            if current is None:
+                return
+            employees = dict(current.boss_of)
+            bosses = set(current.bosses)
+            if employee is not None:
+                employees[employee[0]] = employee[1]
+            if boss is not None:
+                bosses.add(boss)
+            self._snapshot = OrgSnapshot(employees.items(), bosses, current.version + 1,
+                                         fingerprint(employees.items(), bosses))
+
+    def add_employee(self, account, boss_id):
+        """新註冊的員工 (employee_register)"""
+        self._update(employee=(account, boss_id))
+
+    def add_boss(self, account):
+        """資料庫裡有、但索引還沒有的主管 (其他 worker 新增的)"""
+        self._update(boss=account)
+
+    @property
+    def version(self):
+        snapshot = self._snapshot
+        return snapshot.version if snapshot is not None else 0
+
+    def is_boss(self, account):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        return account in snapshot.bosses
+
+    def subordinates(self, boss_id, depth=None):
+        """boss_id 的下屬帳號 list，depth 預設為設定值 (1 = 直屬)；還沒載入時回傳 None"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        return list(snapshot.subordinates(boss_id, self.depth if depth is None else depth))
+
+    def chain(self, account):
+        """account 往上的匯報鏈 [直屬上司, 上司的上司, ...]"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        chain = []
+        boss_id = snapshot.boss_of.get(account)
+        while boss_id is not None and boss_id not in chain and len(chain) < MAX_DEPTH:
+            chain.append(boss_id)
+            boss_id = snapshot.boss_of.get(boss_id)
+        return chain
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'loaded': snapshot is not None,
+            'version': self.version,
+            'employees': len(snapshot.boss_of) if snapshot else 0,
+            'bosses': len(snapshot.bosses) if snapshot else 0,
+            'loaded_at': snapshot.loaded_at if snapshot else None,
+            'db_version': self.db_version,
+            'reloads': self.reloads,
+            'last_error': self.last_error,
+        }
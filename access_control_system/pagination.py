@@ -0,0 +1,92 @@
+# pagination.py
+# keyset pagination helpers for the Record queries
+import base64
+import heapq
+import json
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+STREAM_FETCH_SIZE = 1000  # rows per round trip of a server-side cursor
+
+
+def is_paged_request(data):
+    """request 有 limit / cursor / stream 其中之一時才用分頁，否則維持原本一次回傳全部"""
+    return any(key in data for key in ('limit', 'cursor', 'stream'))
+
+
+def record_key(row):
+    """(user_id, type, time) -> 分頁排序用的 (time, user_id, type)"""
+    return row[2], row[0], row[1]
+
+
+def encode_cursor(row):
+    """(user_id, type, time) -> 不透明的 cursor 字串"""
+    key = [row[2], row[0], row[1]]  # (time, user_id, type)
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        time_, user_id, type_ = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError('cursor 格式錯誤')
+    if not isinstance(time_, (int, float)) or not isinstance(user_id, str) \
+            or not isinstance(type_, str):
+        raise ValueError('cursor 格式錯誤')
+    return time_, user_id, type_
+
+
+def parse_page_args(data):
+    """回傳 (limit, after, stream)，參數錯誤時丟出 ValueError"""
+    limit = data.get('limit', DEFAULT_PAGE_SIZE)
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+        raise ValueError('limit 必須為正整數')
+    limit = min(limit, MAX_PAGE_SIZE)
+    cursor = data.get('cursor')
+    after = decode_cursor(cursor) if cursor else None
+    stream = bool(data.get('stream', False))
+    return limit, after, stream
+
+
+def build_record_query(ts, te, user_id=None, after=None, limit=None):
+    """
+    Record 依 (time, user_id, type) 由新到舊排序
+    after 是上一頁最後一筆的 key，只取比它更舊的資料 (keyset，不用 OFFSET)
+    limit 會多取一筆，用來判斷還有沒有下一頁
+    """
+    conditions = ['time >= %s', 'time <= %s']
+    params = [ts, te]
+    if user_id is not None:
+        conditions.insert(0, 'user_id = %s')
+        params.insert(0, user_id)
+    if after is not None:
+        conditions.append('(time, user_id, type) < (%s, %s, %s)')
+        params.extend(after)
+    query = """
+        SELECT user_id, type, time
+        FROM Record
+        WHERE {}
+        ORDER BY time DESC, user_id DESC, type DESC
+    """.format(' AND '.join(conditions))
+    if limit is not None:
+        query += ' LIMIT %s'
+        params.append(limit + 1)
+    return query, params
+
+
+def merge_archived(rows, archived, after=None):
+    """
+    資料庫的 rows (build_record_query 的順序) 與封存檔 (archive.py) 的 archived 合併
+    只留 after 之後的紀錄，兩邊都有的只留一筆；rows 可以是 cursor，逐筆讀取
+    """
+    if after is not None:
+        archived = [r for r in archived if record_key(r) < tuple(after)]
+    archived = sorted((tuple(r[:3]) for r in archived), key=record_key, reverse=True)
+    current_time, seen = None, set()
+    for row in heapq.merge(rows, archived, key=record_key, reverse=True):
+        key = record_key(row)
+        if key[0] != current_time:
+            current_time, seen = key[0], set()
+        if key not in seen:
+            seen.add(key)
+            yield row
@@ -0,0 +1,357 @@
+# partitions.py
+# monthly range partitions of Record and Log: created ahead of time, old months dropped or detached
+import argparse
+import datetime
+import logging
+import re
+import threading
+import time
+from attendance import day_of, day_start
+
+log = logging.getLogger('access_control.partitions')
+
+CONFIG = {
+    'monthsAhead': 3,                 # months created in advance (current month included)
+    # months kept before the current one, 0 = keep forever
+    'retentionMonths': {'Record': 0, 'Log': 0},
+    'retentionAction': 'detach',      # detach: keep the table for archive / export, drop: delete it
+}
+
+PARTITIONED = ['Record', 'Log']
+
+PARTITION_NAME = re.compile(r'_p(\d{4})_(\d{2})$')
+
+
+def month_of(t):
+    # months follow the attendance day (UTC+8), so a local day never spans two partitions
+    day = day_of(t)
+    return day.year, day.month
+
+
+def add_months(month, n):
+    index = month[0] * 12 + month[1] - 1 + n
+    return index // 12, index % 12 + 1
+
+
+def month_bounds(month):
+    """該月份 [起, 訖) 的 epoch 秒"""
+    return (day_start(datetime.date(month[0], month[1], 1)),
+            day_start(datetime.date(*add_months(month, 1), 1)))
+
+
+def partition_name(table, month):
+    return f"{table.lower()}_p{month[0]}_{month[1]:02d}"
+
+
+def default_partition(table):
+    return f"{table.lower()}_default"
+
+
+def relkind(cursor, name):
+    """'r' 一般資料表、'p' partitioned table，不存在時回傳 None"""
+    cursor.execute("""
+        SELECT relkind FROM pg_class
+        WHERE relname = %s AND pg_table_is_visible(oid)
+    """, (name.lower(),))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def list_partitions(conn, table):
+    """{(year, month): partition name}，不含 default partition"""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+        """, (table.lower(),))
+        names = [row[0] for row in cursor.fetchall()]
+    conn.commit()
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME.search(name)
+        if match:
+            partitions[(int(match.group(1)), int(match.group(2)))] = name
+    return partitions
+
+
+def move_rows(cursor, source, target, low, high):
+    """在資料庫裡把 source 中 [low, high) 的 row 搬到 target (不經過這個 process)"""
+    cursor.execute(f"""
+        INSERT INTO {target} SELECT * FROM {source}
+        WHERE time >= %s AND time < %s
+        ON CONFLICT DO NOTHING
+    """, (low, high))
+    cursor.execute(f"DELETE FROM {source} WHERE time >= %s AND time < %s", (low, high))
+
+
+def default_attached(cursor, table):
+    cursor.execute("""
+        SELECT 1 FROM pg_inherits
+        WHERE inhrelid = to_regclass(%s) AND inhparent = %s::regclass
+    """, (default_partition(table), table.lower()))
+    return cursor.fetchone() is not None
+
+
+def create_partition(conn, table, month):
+    """
+    建立一個月份的 partition
+    default partition 裡已經有這個月份的資料時 PostgreSQL 不允許建立，
+    所以在同一個 transaction 裡 DETACH default partition、建立新的 partition、
+    在資料庫裡把那些 row 搬過去，再把 default partition ATTACH 回去
+    """
+    name = partition_name(table, month)
+    low, high = month_bounds(month)
+    default = default_partition(table)
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {default} WHERE time >= %s AND time < %s",
+                           (low, high))
+            stray = cursor.fetchone()[0]
+            if stray:
+                log.warning("moving rows out of the default partition",
+                            extra={'table': table, 'partition': name, 'rows': stray})
+                cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {default}")
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table}
+                FOR VALUES FROM (%s) TO (%s)
+            """, (low, high))
+            if stray:
+                move_rows(cursor, default, name, low, high)
+                cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = autocommit
+    return name
+
+
+def reattach_default(conn, table):
+    """
+    DDL 沒有包在 transaction 裡生效 (中途失敗) 時 default partition 可能還是 detach 的狀態：
+    把已經有 partition 的月份的 row 搬過去後 ATTACH 回去，row 一直都留在資料庫裡
+    """
+    with conn.cursor() as cursor:
+        if relkind(cursor, default_partition(table)) != 'r' or default_attached(cursor, table):
+            conn.commit()
+            return False
+        for month, name in sorted(list_partitions(conn, table).items()):
+            move_rows(cursor, default_partition(table), name, *month_bounds(month))
+        cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {default_partition(table)} DEFAULT")
+    conn.commit()
+    log.warning("default partition re-attached", extra={'table': table})
+    return True
+
+
+def ensure_partitions(conn, table, months_ahead=CONFIG['monthsAhead'], since=None, now=None):
+    """建立 since (預設本月) 到本月 + months_ahead 之間缺少的 partition，回傳新建的名稱"""
+    current = month_of(now or time.time())
+    month = month_of(since) if since is not None else current
+    last = add_months(current, months_ahead - 1)
+    reattach_default(conn, table)
+    existing = list_partitions(conn, table)
+    created = []
+    while month <= last:
+        if month not in existing:
+            created.append(create_partition(conn, table, month))
+        month = add_months(month, 1)
+    return created
+
+
+def apply_retention(conn, table, keep_months, action=CONFIG['retentionAction'], now=None):
+    """
+    保留本月以及之前 keep_months 個月，更舊的 partition 整個 DROP 或 DETACH
+    (DETACH 後資料表還在，只是不再被查詢掃到)；keep_months <= 0 不做任何事
+    """
+    if keep_months <= 0:
+        return []
+    cutoff = add_months(month_of(now or time.time()), -keep_months)
+    removed = []
+    with conn.cursor() as cursor:
+        for month, name in sorted(list_partitions(conn, table).items()):
+            if month >= cutoff:
+                break
+            if action == 'drop':
+                cursor.execute(f"DROP TABLE {name}")
+            else:
+                cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+            conn.commit()
+            removed.append(name)
+    return removed
+
+
+def maintain(conn, months_ahead=CONFIG['monthsAhead'], retention=None,
+             action=CONFIG['retentionAction']):
+    """對所有 partitioned table 建立未來的 partition 並套用 retention"""
+    retention = CONFIG['retentionMonths'] if retention is None else retention
+    report = {}
+    for table in PARTITIONED:
+        with conn.cursor() as cursor:
+            partitioned = relkind(cursor, table) == 'p'
+        conn.commit()
+        if not partitioned:
+            # schema version 4 not applied yet
+            continue
+        report[table] = {
+            'created': ensure_partitions(conn, table, months_ahead),
+            'detached' if action == 'detach' else 'dropped':
+                apply_retention(conn, table, retention.get(table, 0), action),
+        }
+    return report
+
+
+def convert_to_partitioned(conn, table):
+    """
+    migration 4：把 table 換成 partitioned table (migrate.py 以 autocommit 執行)
+    1. 原本的 table 改名為 <table>_unpartitioned (primary key 與 time index 一起改名)
+    2. 建立 partitioned table、default partition 與資料所在月份到未來的 partition
+    3. 逐月複製資料 (ON CONFLICT DO NOTHING，中斷後重跑會接續) 後建立 index、刪除舊表
+    """
+    from schema import INDEXES, PARTITIONED_TABLES
+
+    legacy = f"{table.lower()}_unpartitioned"
+    time_index = f"{table.lower()}_time_idx"
+    with conn.cursor() as cursor:
+        if relkind(cursor, table) == 'r':
+            cursor.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        if relkind(cursor, legacy) == 'r':
+            # the new table needs these names
+            cursor.execute("""
+                SELECT 1 FROM pg_constraint
+                WHERE conname = %s AND conrelid = %s::regclass
+            """, (f"{table.lower()}_pkey", legacy))
+            if cursor.fetchone():
+                cursor.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT "
+                               f"{table.lower()}_pkey TO {legacy}_pkey")
+            cursor.execute("""
+                SELECT 1 FROM pg_index
+                WHERE indexrelid = to_regclass(%s) AND indrelid = %s::regclass
+            """, (time_index, legacy))
+            if cursor.fetchone():
+                cursor.execute(f"ALTER INDEX {time_index} RENAME TO {legacy}_time_idx")
+
+        cursor.execute(PARTITIONED_TABLES[table])
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {default_partition(table)} "
+                       f"PARTITION OF {table} DEFAULT")
+
+        since = None
+        if relkind(cursor, legacy) == 'r':
+            cursor.execute(f"SELECT MIN(time), MAX(time) FROM {legacy}")
+            since, until = cursor.fetchone()
+        ensure_partitions(conn, table, since=since)
+
+        if since is not None:
+            month = month_of(since)
+            while month <= month_of(until):
+                low, high = month_bounds(month)
+                cursor.execute(f"""
+                    INSERT INTO {table} SELECT * FROM {legacy}
+                    WHERE time >= %s AND time < %s
+                    ON CONFLICT DO NOTHING
+                """, (low, high))
+                log.info("copied %s rows of %s into %s", cursor.rowcount, table,
+                         partition_name(table, month))
+                month = add_months(month, 1)
+
+        cursor.execute(INDEXES[time_index])
+        cursor.execute(f"DROP TABLE IF EXISTS {legacy}")
+
+
+class PartitionMaintainer:
+    """
+    背景 thread 每 interval 秒對每個 cluster 執行一次 maintain()，
+    讓 partition 一直提前 months_ahead 個月存在 (api.py 只在一個 worker 啟動)
+    """
+
+    def __init__(self, pools, interval=3600, months_ahead=CONFIG['monthsAhead'],
+                 retention=None, action=CONFIG['retentionAction']):
+        # pools: {'main': ConnectionPool, 'backup': ConnectionPool}
+        self.pools = pools
+        self.interval = interval
+        self.months_ahead = months_ahead
+        self.retention = retention
+        self.action = action
+        self.last_run = None
+        self.last_report = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """啟動背景維護 (重複呼叫沒有影響)"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='partition-maintainer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_once(self):
+        for name, pool in self.pools.items():
+            try:
+                conn = pool.getconn()
+            except Exception as e:
+                log.warning("partition maintenance skipped: %s", e, extra={'cluster': name})
+                continue
+            try:
+                report = maintain(conn, self.months_ahead, self.retention, self.action)
+                self.last_report[name] = report
+                for table, changes in report.items():
+                    if any(changes.values()):
+                        log.info("partitions changed", extra={
+                            'cluster': name, 'table': table, **changes})
+            except Exception as e:
+                conn.rollback()
+                log.error("partition maintenance failed: %s", e, extra={'cluster': name})
+            finally:
+                conn.close()
+        self.last_run = time.time()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+    def stats(self):
+        return {'last_run': self.last_run, 'last_report': self.last_report}
+
+
+if __name__ == "__main__":
+    from restore_database import connect
+
+    parser = argparse.ArgumentParser(description="Create future partitions and apply retention")
+    parser.add_argument('--target', choices=['main', 'backup', 'both'], default='both')
+    parser.add_argument('--ahead', type=int, default=CONFIG['monthsAhead'],
+                        help='months to create in advance, current month included')
+    parser.add_argument('--keep-months', type=int,
+                        help='months kept before the current one for Record and Log '
+                             '(default: CONFIG retentionMonths, 0 = keep forever)')
+    parser.add_argument('--action', choices=['detach', 'drop'],
+                        default=CONFIG['retentionAction'])
+    args = parser.parse_args()
+
+    retention = None
+    if args.keep_months is not None:
+        retention = {table: args.keep_months for table in PARTITIONED}
+    for cluster in (('main', 'backup') if args.target == 'both' else (args.target,)):
+        conn = connect(cluster)
+        try:
+            report = maintain(conn, args.ahead, retention, args.action)
+        finally:
+            conn.close()
+        for table, changes in report.items():
+            for change, names in changes.items():
+                print(f"[{cluster}] {table} {change}: {', '.join(names) or '-'}")
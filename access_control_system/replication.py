@@ -0,0 +1,234 @@
+# replication.py
+# durable, ordered background replication of mirrored writes to the backup cluster
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+import psycopg2
+import psycopg2.extras
+
+log = logging.getLogger('access_control.replication')
+
+# errors that will never succeed on retry: the entry is moved to the dead letter file
+PERMANENT_ERRORS = (psycopg2.IntegrityError, psycopg2.DataError,
+                    psycopg2.ProgrammingError)
+
+
+def op(sql, params):
+    """一般的 cursor.execute(sql, params)"""
+    return {'kind': 'execute', 'sql': sql, 'params': list(params)}
+
+
+def values_op(sql, rows):
+    """psycopg2.extras.execute_values(cursor, sql, rows)，用於 multi-row insert"""
+    return {'kind': 'values', 'sql': sql, 'params': [list(r) for r in rows]}
+
+
+class ReplicationQueue:
+    """
+    備份資料庫的非同步複寫佇列
+    - enqueue() 先把寫入動作 append 到本機的 write-ahead log (一行一個 JSON)，
+      回傳後 request 就不用再等備份資料庫
+    - 背景 worker 依序把 log 分批套用到備份資料庫，失敗會 retry (exponential backoff)
+    - 已套用到哪一筆記錄在 checkpoint 檔，程式重啟後會從中斷的地方繼續
+    """
+
+    def __init__(self, pool, wal_path, batch_size=100, fsync=True,
+                 retry_interval=1, max_retry_interval=30, compact_size=1024 * 1024):
+        self.pool = pool
+        self.wal_path = wal_path
+        self.checkpoint_path = wal_path + '.checkpoint'
+        self.dead_letter_path = wal_path + '.dead'
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.compact_size = compact_size
+
+        self._lock = threading.Lock()
+        self._has_pending = threading.Condition(self._lock)
+        self._pending = deque()  # entries not yet applied, in order
+        self._thread = None
+        self._stopping = False
+        self._wal = None
+
+        self._last_seq = 0
+        self._applied_seq = 0
+        self._applied_at = None
+        self._applied_count = 0
+        self._failed_count = 0
+        self._dead_count = 0
+        self._last_error = None
+        self._load()
+
+    def _load(self):
+        # resume from the checkpoint: everything after it is still pending
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                self._applied_seq = json.load(f)['applied_seq']
+        self._last_seq = self._applied_seq
+        if os.path.exists(self.wal_path):
+            good = 0  # byte offset just after the last complete entry
+            with open(self.wal_path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # torn write at the end of the file
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    good += len(line)
+                    self._last_seq = max(self._last_seq, entry['seq'])
+                    if entry['seq'] > self._applied_seq:
+                        self._pending.append(entry)
+            if good < os.path.getsize(self.wal_path):
+                # cut the torn tail off, otherwise the next entry is appended to it
+                log.warning("Replication log %s truncated at byte %s", self.wal_path, good)
+                with open(self.wal_path, 'r+b') as f:
+                    f.truncate(good)
+        self._wal = open(self.wal_path, 'a')
+
+    def start(self):
+        """啟動背景 worker (重複呼叫沒有影響)"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run, name='replication-worker', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        with self._lock:
+            self._stopping = True
+            self._has_pending.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def enqueue(self, ops):
+        """把一組要在備份資料庫執行的 op (同一個 transaction) 放進佇列"""
+        with self._lock:
+            self._last_seq += 1
+            entry = {'seq': self._last_seq, 'ts': time.time(), 'ops': ops}
+            self._wal.write(json.dumps(entry) + '\n')
+            self._wal.flush()
+            if self.fsync:
+                os.fsync(self._wal.fileno())
+            self._pending.append(entry)
+            self._has_pending.notify()
+        self.start()
+        return entry['seq']
+
+    def stats(self):
+        with self._lock:
+            oldest = self._pending[0]['ts'] if self._pending else None
+            return {
+                'pending': len(self._pending),
+                'last_seq': self._last_seq,
+                'applied_seq': self._applied_seq,
+                'applied': self._applied_count,
+                'failed_attempts': self._failed_count,
+                'dead_letters': self._dead_count,
+                # how far the backup is behind the primary
+                'lag_entries': self._last_seq - self._applied_seq,
+                'lag_seconds': time.time() - oldest if oldest else 0.0,
+                'last_applied_at': self._applied_at,
+                'last_error': self._last_error,
+                'running': self._thread is not None and self._thread.is_alive(),
+            }
+
+    def _run(self):
+        delay = self.retry_interval
+        while True:
+            with self._lock:
+                while not self._pending and not self._stopping:
+                    self._has_pending.wait()
+                if self._stopping and not self._pending:
+                    return
+                batch = [self._pending[i]
+                         for i in range(min(self.batch_size, len(self._pending)))]
+            try:
+                self._apply(batch)
+                delay = self.retry_interval
+            except Exception as e:
+                with self._lock:
+                    self._failed_count += 1
+                    self._last_error = str(e)
+                log.warning("Replication to Backup YugabyteDB failed, retry in %ss: %s", delay, e)
+                if self._wait(delay):
+                    return
+                delay = min(delay * 2, self.max_retry_interval)
+
+    def _wait(self, seconds):
+        # sleep, but wake up early on stop(); True means stopping
+        with self._lock:
+            if not self._stopping:
+                self._has_pending.wait(seconds)
+            return self._stopping
+
+    def _apply(self, batch):
+        conn = self.pool.getconn()
+        try:
+            try:
+                with conn.cursor() as cursor:
+                    for entry in batch:
+                        self._execute(cursor, entry)
+                conn.commit()
+            except PERMANENT_ERRORS:
+                conn.rollback()
+                self._apply_one_by_one(conn, batch)
+                return
+        finally:
+            conn.close()
+        self._mark_applied(batch)
+
+    def _apply_one_by_one(self, conn, batch):
+        # a bad entry must not block the queue: isolate it and park it in the dead letter file.
+        # the checkpoint moves after every entry, so a transient error half way through
+        # only retries the entries that were not committed yet
+        for entry in batch:
+            try:
+                with conn.cursor() as cursor:
+                    self._execute(cursor, entry)
+                conn.commit()
+            except PERMANENT_ERRORS as e:
+                conn.rollback()
+                self._dead_letter(entry, e)
+            self._mark_applied([entry])
+
+    def _execute(self, cursor, entry):
+        for o in entry['ops']:
+            if o['kind'] == 'values':
+                psycopg2.extras.execute_values(
+                    cursor, o['sql'], o['params'], page_size=len(o['params']) or 1)
+            else:
+                cursor.execute(o['sql'], o['params'])
+
+    def _dead_letter(self, entry, error):
+        with open(self.dead_letter_path, 'a') as f:
+            f.write(json.dumps({'entry': entry, 'error': str(error)}) + '\n')
+        with self._lock:
+            self._dead_count += 1
+        log.error("Replication entry %s skipped: %s", entry['seq'], error)
+
+    def _mark_applied(self, batch):
+        last = batch[-1]['seq']
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'applied_seq': last}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+        with self._lock:
+            for _ in batch:
+                self._pending.popleft()
+            self._applied_seq = last
+            self._applied_count += len(batch)
+            self._applied_at = time.time()
+            # everything is applied: start a new, empty log
+            if not self._pending and self._wal.tell() > self.compact_size:
+                self._wal.close()
+                self._wal = open(self.wal_path, 'w')
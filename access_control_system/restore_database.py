@@ -0,0 +1,283 @@
+# restore a dump made by dump_database.py into the main and backup clusters with COPY
+import argparse
+import csv
+import datetime
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+from attendance import backfill_attendance, day_of
+from dump_database import DUMP_TABLES, open_dump_file
+from schema import INDEXES
+
+# read host name from host.json file
+with open('access_control_system/url.json') as f:
+    data = json.load(f)
+    HOST = data['host']
+    PORT = data['port']
+
+# read host name from backup_url.json file
+with open('access_control_system/backup_url.json') as f:
+    data = json.load(f)
+    BACKUPHOST = data['host']
+    BACKUPPORT = data['port']
+
+CONFIG = {
+    'dbName': 'yugabyte',
+    'dbUser': 'yugabyte',
+    'dbPassword': 'yugabyte',
+    'sslMode': '',
+    'sslRootCert': ''
+}
+
+CLUSTERS = {
+    'main': (HOST, PORT),
+    'backup': (BACKUPHOST, BACKUPPORT),
+}
+
+
+def connect(cluster):
+    host, port = CLUSTERS[cluster]
+    if CONFIG['sslMode'] != '':
+        return psycopg2.connect(host=host, port=port, database=CONFIG['dbName'],
+                                user=CONFIG['dbUser'], password=CONFIG['dbPassword'],
+                                sslmode=CONFIG['sslMode'], sslrootcert=CONFIG['sslRootCert'],
+                                connect_timeout=10)
+    return psycopg2.connect(host=host, port=port, database=CONFIG['dbName'],
+                            user=CONFIG['dbUser'], password=CONFIG['dbPassword'],
+                            connect_timeout=10)
+
+
+# table -> primary key columns, used to de-duplicate incremental dumps
+CONFLICT_KEYS = {
+    'author': ['user_id'],
+    'record': ['user_id', 'time', 'type'],
+    'log': ['user_id', 'time', 'type'],
+    'salary': ['user_id'],
+    'employeeaccount': ['account'],
+    'bossaccount': ['account'],
+}
+
+
+def resolve_chain(path):
+    """
+    NDJSON dump 資料夾 -> [(資料夾, manifest)]，由 base dump 排到 path
+    (incremental dump 的 manifest 以 parent 指向前一次 dump)
+    """
+    chain = []
+    while path is not None:
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        chain.append((path, manifest))
+        path = manifest.get('parent')
+    chain.reverse()
+    return chain
+
+
+def open_dump(path):
+    """
+    回傳 {dump name: [(是否為 incremental, 產生 row (dict) 的函式)]}，依套用順序排列
+    path 可以是 dump_database.py 的 JSON 檔，或 --format ndjson 的資料夾
+    """
+    if os.path.isdir(path):
+        def ndjson_reader(file):
+            def read():
+                with open_dump_file(file, 'r') as f:
+                    for line in f:
+                        if line.strip():
+                            yield json.loads(line)
+            return read
+        readers = {}
+        for directory, manifest in resolve_chain(path):
+            incremental = manifest.get('type') == 'incremental'
+            for name, table in manifest['tables'].items():
+                readers.setdefault(name, []).append(
+                    (incremental, ndjson_reader(os.path.join(directory, table['file']))))
+        return readers
+
+    # legacy JSON dump: the whole file has to be parsed at once
+    with open(path) as f:
+        dump = json.load(f)
+    return {name: [(False, lambda rows=rows: iter(rows))] for name, rows in dump.items()}
+
+
+def copy_rows(conn, table, columns, rows):
+    """一批 row 轉成 CSV，用一個 COPY FROM STDIN 寫入"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([row[c] for c in columns])
+    buf.seek(0)
+    with conn.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+    conn.commit()
+
+
+def upsert_rows(conn, table, columns, rows):
+    """
+    incremental dump 的資料可能已經存在 (overlap、Author 重新登入)：
+    先 COPY 到 temp table，再 INSERT ... ON CONFLICT 合併
+    Record / Log 重複就略過，其他資料表以 dump 內容為準
+    """
+    keys = CONFLICT_KEYS[table]
+    updates = [c for c in columns if c not in keys]
+    if table in ('record', 'log') or not updates:
+        action = 'DO NOTHING'
+    else:
+        action = 'DO UPDATE SET ' + ', '.join(f'{c} = EXCLUDED.{c}' for c in updates)
+    stage = f'restore_{table}'
+    with conn.cursor() as cursor:
+        cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {stage} "
+                       f"(LIKE {table}) ON COMMIT DELETE ROWS")
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([row[c] for c in columns])
+    buf.seek(0)
+    with conn.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {stage} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+        cursor.execute(f"""
+            INSERT INTO {table} ({', '.join(columns)})
+            SELECT {', '.join(columns)} FROM {stage}
+            ON CONFLICT ({', '.join(keys)}) {action}
+        """)
+    conn.commit()
+
+
+def load_table(cluster, name, readers, batch_size, truncate):
+    """回傳 (載入的筆數, Record 的時間範圍 (low, high)；其他資料表為 None)"""
+    table = DUMP_TABLES[name]
+    start = time.time()
+    rows = 0
+    span = None
+    conn = connect(cluster)
+    try:
+        if truncate:
+            with conn.cursor() as cursor:
+                cursor.execute(f"TRUNCATE {table}")
+            conn.commit()
+        # base dump first, then every incremental dump in order
+        for incremental, reader in readers:
+            write = upsert_rows if incremental else copy_rows
+            columns = None
+            batch = []
+            for row in reader():
+                if columns is None:
+                    columns = list(row.keys())
+                batch.append(row)
+                if table == 'record':
+                    span = (row['time'], row['time']) if span is None else \
+                        (min(span[0], row['time']), max(span[1], row['time']))
+                if len(batch) >= batch_size:
+                    write(conn, table, columns, batch)
+                    rows += len(batch)
+                    batch = []
+            if batch:
+                write(conn, table, columns, batch)
+                rows += len(batch)
+    finally:
+        conn.close()
+    elapsed = time.time() - start
+    print(f"[{cluster}] {name}: {rows} rows in {elapsed:.2f}s "
+          f"({rows / elapsed if elapsed > 0 else 0:.0f} rows/sec)")
+    return rows, span
+
+
+def rebuild_attendance(cluster, span, truncate):
+    """
+    COPY 寫入的 Record 不會經過打卡時的 rollup：載入後由 Record 重建那些日期的 DailyAttendance
+    truncate 時 Record 已經清空過，舊的 DailyAttendance 也一起清掉
+    """
+    start = time.time()
+    conn = connect(cluster)
+    try:
+        if truncate:
+            with conn.cursor() as cursor:
+                cursor.execute("TRUNCATE DailyAttendance")
+            conn.commit()
+        rows = 0
+        if span is not None:
+            rows = backfill_attendance(conn, day_of(span[0]),
+                                       day_of(span[1]) + datetime.timedelta(days=1))
+    finally:
+        conn.close()
+    print(f"[{cluster}] DailyAttendance: {rows} employee-days rebuilt "
+          f"in {time.time() - start:.2f}s")
+
+
+def drop_indexes(cluster):
+    conn = connect(cluster)
+    try:
+        with conn.cursor() as cursor:
+            for index in INDEXES:
+                cursor.execute(f"DROP INDEX IF EXISTS {index}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def create_indexes(cluster):
+    start = time.time()
+    conn = connect(cluster)
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            for statement in INDEXES.values():
+                cursor.execute(statement)
+    finally:
+        conn.close()
+    print(f"[{cluster}] indexes rebuilt in {time.time() - start:.2f}s")
+
+
+def restore_database(path, clusters=('main', 'backup'), batch_size=50000, jobs=4,
+                     defer_indexes=False, truncate=False):
+    """
+    把 dump 載入各 cluster：每個 (cluster, 資料表) 一個工作，最多 jobs 個平行，
+    每 batch_size 筆一個 COPY；defer_indexes 時先刪除次要索引，載入後再建立
+    path 是 incremental dump 時會從 base dump 開始依序套用整條 chain
+    載入 Record 之後重建那些日期的 DailyAttendance
+    """
+    readers = open_dump(path)
+    start = time.time()
+    if defer_indexes:
+        for cluster in clusters:
+            drop_indexes(cluster)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {(cluster, name): executor.submit(load_table, cluster, name, chain,
+                                                    batch_size, truncate)
+                   for cluster in clusters for name, chain in readers.items()}
+        results = {key: future.result() for key, future in futures.items()}
+        total = sum(rows for rows, _ in results.values())
+
+    if defer_indexes:
+        with ThreadPoolExecutor(max_workers=len(clusters)) as executor:
+            list(executor.map(create_indexes, clusters))
+    for cluster in clusters:
+        if (cluster, 'record') in results:
+            rebuild_attendance(cluster, results[cluster, 'record'][1], truncate)
+    print(f">>>> Successfully restored {total} rows from {path} "
+          f"in {time.time() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Restore a dump_database.py dump")
+    parser.add_argument('--input', default='access_control_system/dump_database.json',
+                        help='JSON dump file or NDJSON dump directory (incremental: the newest one)')
+    parser.add_argument('--target', choices=['main', 'backup', 'both'], default='both')
+    parser.add_argument('--batch-size', type=int, default=50000,
+                        help='rows per COPY statement')
+    parser.add_argument('--jobs', type=int, default=4, help='tables loaded in parallel')
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help='drop secondary indexes before loading and rebuild them after')
+    parser.add_argument('--truncate', action='store_true',
+                        help='empty each table before loading it')
+    args = parser.parse_args()
+
+    clusters = ('main', 'backup') if args.target == 'both' else (args.target,)
+    restore_database(args.input, clusters, args.batch_size, args.jobs,
+                     args.defer_indexes, args.truncate)
@@ -1,50 +1,27 @@
 import requests
 import time
-from datetime import datetime, timedelta
 
 
-def get_base_salary(user_id):
-    response = requests.post(f'http://localhost:5000/salary/find', json={
-        "user_id": user_id})
-    if response.status_code == 200:
-        data = response.json()
-        return data.get('salary')
-    else:
-        print(f"查詢 {user_id} 基本薪資失敗 (狀態碼 {response.status_code})")
-        exit(1)
-
-
-def get_logs(start_time, end_time):
-    response = requests.post('http://localhost:5000/salary/logs', json={
+def run_payroll(start_time, end_time):
+    # 一次套用時間區間內所有異常紀錄的薪資調整 (伺服器端單一 transaction)
+    response = requests.post('http://localhost:5000/salary/payroll', json={
         "start_time": start_time,
         "end_time": end_time
     })
-    logs = response.json()
-    if not logs:
-        print("沒有發現異常紀錄，無需更新")
-    return logs
-
-
-def update_salary(user_id, type, duration):
-    base_salary = get_base_salary(user_id)
-    if type == 'late':
-        base_salary = base_salary - (10 * duration/60)
-    elif type == 'absent':
-        base_salary = base_salary - 300
-    elif type == 'overtime':
-        base_salary = base_salary + (10*1.5*duration/60)
-    time.sleep(1)  # 模擬延遲，避免過於頻繁的請求
-    response = requests.post('http://localhost:5000/salary/update', json={
-        "user_id": user_id,
-        "salary": base_salary
-    })
-    if response.status_code == 200:
-        print(f"薪資更新成功，使用者 {user_id} 的新薪資為 {base_salary}")
-        return response.json()
-    else:
+    if response.status_code != 200:
         print(f"薪資更新失敗 (狀態碼 {response.status_code})，內容：{response.text}")
         exit(1)
 
+    summary = response.json()
+    if summary['status'] == 'already_applied':
+        print("此時間區間已處理過，無需更新")
+    elif not summary['users']:
+        print("沒有發現異常紀錄，無需更新")
+    else:
+        for user in summary['data']:
+            print(f"薪資更新成功，使用者 {user['user_id']} 的新薪資為 {user['salary']}")
+    return summary
+
 
 if __name__ == '__main__':
     print("==== 薪資更新系統 ====")
@@ -53,18 +30,14 @@ if __name__ == '__main__':
     end_time = time.time()
     while True:
         try:
-            logs = get_logs(start_time, end_time)
-            """[
-                {
-                    "duration": 3600.0,
-                    "time": 1747117662.1759262,
-                    "type": "late",
-                    "user_id": "Jason"
-                }]"""
-            for log in logs:
-                res = update_salary(
-                    log['user_id'], log['type'], log['duration'])
-                print(res)
+            res = run_payroll(start_time, end_time)
+            """{
+                "status": "applied",
+                "users": 1,
+                "total_adjustment": -600.0,
+                "data": [{"user_id": "Jason", "adjustment": -600.0, "salary": 9400.0}]
+            }"""
+            print(res)
             # 每10分鐘執行一次
             start_time = end_time
             end_time = end_time + 600
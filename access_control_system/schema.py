@@ -0,0 +1,242 @@
+# schema.py
+# versioned table and index definitions for YugabyteDB
+#
+# Sharding notes:
+# - tables looked up by user / account use HASH sharding on that column, so point
+#   lookups (Author, Salary, accounts) and per-user range scans (Record, Log) go to
+#   exactly one tablet.
+# - Record and Log keep time as an ASC range column inside each user's hash bucket,
+#   so "user_id = ? AND time BETWEEN ? AND ?" is a single index seek.
+# - cross-user time range scans (/record, /salary/logs) use range-sharded secondary
+#   indexes on time, which also cover the selected columns.
+# - since version 4 Record and Log are range partitioned by month on time
+#   (partitions.py), so a time range only touches the months it covers and old
+#   months are removed with a DROP / DETACH instead of a DELETE.
+
+# table name -> CREATE TABLE statement, in creation order
+TABLES = {
+    'Author': """
+        CREATE TABLE IF NOT EXISTS Author (
+            user_id VARCHAR(255) NOT NULL,
+            access_token VARCHAR(255) NOT NULL,
+            refresh_token VARCHAR(255) NOT NULL,
+            created_at FLOAT NOT NULL,
+            PRIMARY KEY (user_id HASH)
+        )
+    """,
+    'Record': """
+        CREATE TABLE IF NOT EXISTS Record (
+            user_id VARCHAR(255) NOT NULL,
+            type VARCHAR(255) NOT NULL,
+            time FLOAT NOT NULL,
+            PRIMARY KEY ((user_id) HASH, time ASC, type ASC)
+        )
+    """,
+    'Log': """
+        CREATE TABLE IF NOT EXISTS Log (
+            user_id VARCHAR(255) NOT NULL,
+            type VARCHAR(255) NOT NULL,
+            time FLOAT NOT NULL,
+            duration FLOAT NOT NULL,
+            PRIMARY KEY ((user_id) HASH, time ASC, type ASC)
+        )
+    """,
+    'Salary': """
+        CREATE TABLE IF NOT EXISTS Salary (
+            user_id VARCHAR(255) NOT NULL,
+            salary FLOAT NOT NULL,
+            PRIMARY KEY (user_id HASH)
+        )
+    """,
+    'EmployeeAccount': """
+        CREATE TABLE IF NOT EXISTS EmployeeAccount (
+            account VARCHAR(255) NOT NULL,
+            password VARCHAR(255) NOT NULL,
+            boss_id VARCHAR(255) NOT NULL,
+            PRIMARY KEY (account HASH)
+        )
+    """,
+    'BossAccount': """
+        CREATE TABLE IF NOT EXISTS BossAccount (
+            account VARCHAR(255) NOT NULL,
+            password VARCHAR(255) NOT NULL,
+            PRIMARY KEY (account HASH)
+        )
+    """,
+}
+
+# index name -> CREATE INDEX statement
+INDEXES = {
+    # /record GET: all punches in a time range
+    'record_time_idx': """
+        CREATE INDEX IF NOT EXISTS record_time_idx
+        ON Record (time ASC) INCLUDE (user_id, type)
+    """,
+    # /salary/logs: all anomaly logs in a time range
+    'log_time_idx': """
+        CREATE INDEX IF NOT EXISTS log_time_idx
+        ON Log (time ASC) INCLUDE (user_id, type, duration)
+    """,
+    # get_subordinates(): employees of one boss
+    'employeeaccount_boss_idx': """
+        CREATE INDEX IF NOT EXISTS employeeaccount_boss_idx
+        ON EmployeeAccount (boss_id HASH) INCLUDE (account)
+    """,
+}
+
+
+# Record / Log as monthly range partitioned tables (same columns and primary key,
+# the partition key time is part of it). partitions are named <table>_pYYYY_MM,
+# rows outside every month land in <table>_default
+PARTITIONED_TABLES = {
+    'Record': """
+        CREATE TABLE IF NOT EXISTS Record (
+            user_id VARCHAR(255) NOT NULL,
+            type VARCHAR(255) NOT NULL,
+            time FLOAT NOT NULL,
+            PRIMARY KEY ((user_id) HASH, time ASC, type ASC)
+        ) PARTITION BY RANGE (time)
+    """,
+    'Log': """
+        CREATE TABLE IF NOT EXISTS Log (
+            user_id VARCHAR(255) NOT NULL,
+            type VARCHAR(255) NOT NULL,
+            time FLOAT NOT NULL,
+            duration FLOAT NOT NULL,
+            PRIMARY KEY ((user_id) HASH, time ASC, type ASC)
+        ) PARTITION BY RANGE (time)
+    """,
+}
+
+
+def partition_table(table):
+    """data migration step: convert one table in place (see partitions.convert_to_partitioned)"""
+    def step(cursor):
+        from partitions import convert_to_partitioned
+        convert_to_partitioned(cursor.connection, table)
+    step.__doc__ = f"partition {table} by month (copy existing rows)"
+    return step
+
+
+# primary keys of the tables created before version 1 (CREATE TABLE IF NOT EXISTS
+# kept those as heap tables without a key): table -> (key spec, key columns, row kept
+# when a key is duplicated). Record and Log got theirs from the version 4 rewrite
+PRIMARY_KEYS = {
+    'Author': ('user_id HASH', 'user_id', 'created_at DESC'),
+    'Salary': ('user_id HASH', 'user_id', 'salary DESC'),
+    'EmployeeAccount': ('account HASH', 'account', 'boss_id'),
+    'BossAccount': ('account HASH', 'account', 'password'),
+}
+
+
+def add_primary_key(table):
+    """data migration step: deduplicate one table and add its primary key"""
+    spec, columns, keep = PRIMARY_KEYS[table]
+
+    def step(cursor):
+        cursor.execute("""
+            SELECT 1 FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'p'
+        """, (table.lower(),))
+        if cursor.fetchone():
+            return
+        # one transaction: the duplicates only ever leave the table together with
+        # the row that replaces them
+        conn = cursor.connection
+        conn.autocommit = False
+        try:
+            cursor.execute(f"""
+                CREATE TEMP TABLE {table}_dedup ON COMMIT DROP AS
+                SELECT DISTINCT ON ({columns}) * FROM {table}
+                WHERE ({columns}) IN (
+                    SELECT {columns} FROM {table} GROUP BY {columns} HAVING COUNT(*) > 1)
+                ORDER BY {columns}, {keep}
+            """)
+            cursor.execute(f"DELETE FROM {table} WHERE ({columns}) IN "
+                           f"(SELECT {columns} FROM {table}_dedup)")
+            cursor.execute(f"INSERT INTO {table} SELECT * FROM {table}_dedup")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.autocommit = True
+        # rewrites the table (secondary indexes are rebuilt with it)
+        cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY ({spec})")
+    step.__doc__ = f"add primary key to {table} (deduplicate first)"
+    return step
+
+
+# ordered schema migrations: (version, name, [DDL statements])
+# a step may also be a function(cursor) for data migrations.
+# every step must be idempotent (IF NOT EXISTS ...) so a half-applied
+# migration can simply be re-run. never edit an applied migration, add a new one.
+MIGRATIONS = [
+    (1, 'baseline tables and indexes',
+     list(TABLES.values()) + list(INDEXES.values())),
+    # one row per payroll window already applied to Salary (makes /salary/payroll idempotent)
+    (2, 'payroll runs', [
+        """
+        CREATE TABLE IF NOT EXISTS PayrollRun (
+            window_start FLOAT NOT NULL,
+            window_end FLOAT NOT NULL,
+            applied_at FLOAT NOT NULL,
+            users INT NOT NULL,
+            total_adjustment FLOAT NOT NULL,
+            PRIMARY KEY ((window_start, window_end) HASH)
+        )
+        """,
+    ]),
+    # one row per employee per local day, maintained by every clock-in (see attendance.py)
+    # run attendance.py once after this migration to backfill the existing records
+    (3, 'daily attendance rollup', [
+        """
+        CREATE TABLE IF NOT EXISTS DailyAttendance (
+            user_id VARCHAR(255) NOT NULL,
+            day DATE NOT NULL,
+            first_in FLOAT,
+            last_out FLOAT,
+            worked_seconds FLOAT NOT NULL DEFAULT 0,
+            punch_count INT NOT NULL DEFAULT 0,
+            PRIMARY KEY ((user_id) HASH, day ASC)
+        )
+        """,
+        # anomaly checks and reports: every employee for a range of days
+        """
+        CREATE INDEX IF NOT EXISTS dailyattendance_day_idx
+        ON DailyAttendance (day ASC)
+        INCLUDE (user_id, first_in, last_out, worked_seconds, punch_count)
+        """,
+    ]),
+    # rewrites both tables: run it in a quiet period, the copy is done month by month
+    (4, 'monthly partitions for Record and Log', [
+        partition_table('Record'),
+        partition_table('Log'),
+    ]),
+    # token rotations since a point in time (token_cache.TokenInvalidationFeed, every second)
+    (5, 'author created_at index', [
+        """
+        CREATE INDEX IF NOT EXISTS author_created_at_idx
+        ON Author (created_at ASC) INCLUDE (user_id, access_token)
+        """,
+    ]),
+    # version 1 left tables that already existed without their keys and indexes;
+    # adding a key rewrites the table and blocks writes to it, run in a quiet period
+    (6, 'primary keys for tables created before version 1',
+     [add_primary_key(table) for table in PRIMARY_KEYS]
+     + list(INDEXES.values())),
+    # bumped with every employeeaccount / bossaccount change, polled by every api.py
+    # worker (org_hierarchy.py) so the in-memory org chart follows other processes
+    (7, 'org chart version', [
+        """
+        CREATE TABLE IF NOT EXISTS OrgVersion (
+            id INT NOT NULL,
+            version BIGINT NOT NULL,
+            PRIMARY KEY (id)
+        )
+        """,
+        "INSERT INTO OrgVersion (id, version) VALUES (1, 0) ON CONFLICT DO NOTHING",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
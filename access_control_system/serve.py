@@ -0,0 +1,110 @@
+# serve.py
+# production entry point for api.py: waitress on Windows, pre-forked gunicorn workers elsewhere
+import argparse
+import os
+import sys
+
+# keep the lock files of the claimed worker slot open for the life of the worker
+_SLOT_LOCKS = []
+
+
+def claim_worker_slot(wal_path):
+    """
+    每個 worker 用 flock 佔一個編號 (0, 1, 2 ...)，決定自己的 replication log，
+    worker 重啟後會拿回空出來的編號並繼續套用它的 log
+    """
+    import fcntl
+    slot = 0
+    while True:
+        lock = open(f'{wal_path}.{slot}.lock', 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            slot += 1
+            continue
+        _SLOT_LOCKS.append(lock)
+        return slot
+
+
+def run_waitress(api, args):
+    from waitress import serve
+    if args.workers > 1:
+        print("waitress runs a single process, use --threads to scale (ignoring --workers)")
+    print(f"Serving on http://{args.host}:{args.port} with waitress ({args.threads} threads)")
+    serve(api.app, host=args.host, port=args.port, threads=args.threads,
+          connection_limit=args.connection_limit)
+
+
+def run_gunicorn(api, args):
+    from gunicorn.app.base import BaseApplication
+    from structured_logging import restart_after_fork
+
+    def post_fork(server, worker):
+        # connections, background threads and the WAL file must not be shared
+        # between processes: give every worker its own
+        restart_after_fork()
+        slot = claim_worker_slot(api.CONFIG['replicationLog'])
+        api.init_worker(slot)
+        worker.log.info("worker %s uses replication log %s", worker.pid,
+                        api.replication_log_path(slot))
+
+    def worker_exit(server, worker):
+        api.REPLICATION.stop(timeout=5)
+        api.FAILOVER.stop()
+        api.TOKEN_FEED.stop()
+        api.ORG.stop()
+        if api.PARTITIONS is not None:
+            api.PARTITIONS.stop()
+
+    class Application(BaseApplication):
+        def load_config(self):
+            options = {
+                'bind': f'{args.host}:{args.port}',
+                'workers': args.workers,
+                'threads': args.threads,
+                'worker_class': 'gthread',
+                # api.py (config files, statements, ...) is loaded once in the master
+                'preload_app': True,
+                'timeout': 60,
+                'post_fork': post_fork,
+                'worker_exit': worker_exit,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return api.app
+
+    Application().run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve api.py with a production WSGI server")
+    parser.add_argument('--server', choices=['auto', 'waitress', 'gunicorn'], default='auto',
+                        help='auto: waitress on Windows, gunicorn elsewhere')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=min(os.cpu_count() or 1, 4),
+                        help='worker processes (gunicorn only)')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='request threads per worker')
+    parser.add_argument('--connection-limit', type=int, default=1000,
+                        help='open client connections (waitress only)')
+    args = parser.parse_args()
+
+    server = args.server
+    if server == 'auto':
+        server = 'waitress' if os.name == 'nt' else 'gunicorn'
+    if server == 'gunicorn' and os.name == 'nt':
+        print("gunicorn does not run on Windows, use --server waitress")
+        sys.exit(1)
+
+    # loads url.json / CONFIG once, before any worker is started; pools, the replication
+    # log and background threads are only created per worker (post_fork / first request)
+    import api
+
+    if server == 'waitress':
+        run_waitress(api, args)
+    else:
+        run_gunicorn(api, args)
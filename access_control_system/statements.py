@@ -0,0 +1,110 @@
+# statements.py
+# server-side prepared statements for the hottest queries
+import threading
+import time
+import weakref
+
+
+class StatementRegistry:
+    """
+    每條連線第一次用到某個 statement 時送一次 PREPARE，
+    之後只送 EXECUTE name(...)，server 不用每次重新 parse / plan。
+    哪些 statement 已在哪條連線 PREPARE 過，記在以 psycopg2 connection 為 key 的
+    WeakKeyDictionary，連線被 pool 關掉後記錄會自動消失。
+    """
+
+    def __init__(self):
+        self._statements = {}  # name -> (PREPARE statement, number of parameters)
+        self._prepared = weakref.WeakKeyDictionary()  # raw connection -> {names}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def register(self, name, sql, types):
+        """sql 使用 $1, $2 ... 參數，types 是對應的 SQL 型別"""
+        self._statements[name] = (
+            f"PREPARE {name} ({', '.join(types)}) AS {sql}", len(types))
+        self._stats[name] = {'calls': 0, 'prepares': 0, 'errors': 0,
+                             'total_time': 0.0, 'max_time': 0.0}
+
+    def execute(self, cursor, name, params):
+        """在 cursor 上執行已註冊的 statement，之後照常 fetchone() / fetchall()"""
+        prepare, nparams = self._statements[name]
+        conn = cursor.connection
+        with self._lock:
+            prepared = self._prepared.setdefault(conn, set())
+        start = time.time()
+        try:
+            if name not in prepared:
+                cursor.execute(prepare)
+                prepared.add(name)
+                with self._lock:
+                    self._stats[name]['prepares'] += 1
+            cursor.execute(
+                f"EXECUTE {name} ({', '.join(['%s'] * nparams)})" if nparams
+                else f"EXECUTE {name}", params)
+        except Exception:
+            with self._lock:
+                self._stats[name]['errors'] += 1
+            raise
+        elapsed = time.time() - start
+        with self._lock:
+            stats = self._stats[name]
+            stats['calls'] += 1
+            stats['total_time'] += elapsed
+            stats['max_time'] = max(stats['max_time'], elapsed)
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(s, avg_time=s['total_time'] / s['calls'] if s['calls'] else 0.0)
+                    for name, s in self._stats.items()}
+
+
+STATEMENTS = StatementRegistry()
+
+# token checks, every authorized request runs one of these
+STATEMENTS.register(
+    'author_by_access_token',
+    "SELECT * FROM Author WHERE access_token = $1 AND user_id = $2",
+    ['varchar', 'varchar'])
+STATEMENTS.register(
+    'author_by_refresh_token',
+    "SELECT * FROM Author WHERE refresh_token = $1 AND user_id = $2",
+    ['varchar', 'varchar'])
+# /record GET
+STATEMENTS.register(
+    'record_range',
+    "SELECT user_id, type, time FROM Record WHERE time >= $1 AND time <= $2 ORDER BY time DESC",
+    ['float8', 'float8'])
+# /employee/records, /boss/subordinate_record
+STATEMENTS.register(
+    'user_record_range',
+    "SELECT user_id, type, time FROM Record "
+    "WHERE user_id = $1 AND time >= $2 AND time <= $3 ORDER BY time DESC",
+    ['varchar', 'float8', 'float8'])
+# salary lookups
+STATEMENTS.register(
+    'salary_by_user',
+    "SELECT user_id, salary FROM Salary WHERE user_id = $1",
+    ['varchar'])
+# /boss/team_records: all subordinates of a boss (list of accounts) in one join
+STATEMENTS.register(
+    'team_record_range',
+    "SELECT e.account, r.type, r.time FROM employeeaccount e "
+    "LEFT JOIN Record r ON r.user_id = e.account AND r.time >= $2 AND r.time <= $3 "
+    "WHERE e.account = ANY($1) ORDER BY e.account, r.time DESC",
+    ['varchar[]', 'float8', 'float8'])
+STATEMENTS.register(
+    'team_daily_range',
+    "SELECT e.account, d.day, d.first_in, d.last_out, d.worked_seconds, d.punch_count "
+    "FROM employeeaccount e "
+    "LEFT JOIN DailyAttendance d ON d.user_id = e.account AND d.day >= $2 AND d.day <= $3 "
+    "WHERE e.account = ANY($1) ORDER BY e.account, d.day",
+    ['varchar[]', 'date', 'date'])
+STATEMENTS.register(
+    'team_employee_totals',
+    "SELECT e.account, COUNT(d.day), MIN(d.first_in), MAX(d.last_out), "
+    "COALESCE(SUM(d.worked_seconds), 0), COALESCE(SUM(d.punch_count), 0) "
+    "FROM employeeaccount e "
+    "LEFT JOIN DailyAttendance d ON d.user_id = e.account AND d.day >= $2 AND d.day <= $3 "
+    "WHERE e.account = ANY($1) GROUP BY e.account ORDER BY e.account",
+    ['varchar[]', 'date', 'date'])
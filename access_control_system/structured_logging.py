@@ -0,0 +1,113 @@
+# structured_logging.py
+# JSON-lines logging written by a background thread, with per-request correlation ids
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import uuid
+
+# id of the request being handled, added to every log line written while handling it
+REQUEST_ID = contextvars.ContextVar('request_id', default=None)
+
+_LISTENER = None
+
+# LogRecord attributes that are not user supplied extra=... fields
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'request_id'}
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = REQUEST_ID.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """一行一個 JSON：時間、等級、logger、訊息、request_id 以及 extra 欄位"""
+
+    def format(self, record):
+        entry = {
+            'ts': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        request_id = getattr(record, 'request_id', None)
+        if request_id is not None:
+            entry['request_id'] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # resolve the message and traceback on the calling thread (args / exc_info
+        # may not survive), the JSON encoding and the I/O happen on the listener thread
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level='INFO', log_file=''):
+    """
+    root logger 改成只把 log 放進 queue (不會卡住 request thread)，
+    由背景 QueueListener 寫到 stdout (以及 log_file，若有設定)
+    重複呼叫沒有影響
+    """
+    global _LISTENER
+    if _LISTENER is not None:
+        return _LISTENER
+
+    formatter = JsonFormatter()
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=50 * 1024 * 1024, backupCount=5, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(-1)
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _LISTENER = logging.handlers.QueueListener(log_queue, *handlers,
+                                               respect_handler_level=True)
+    _LISTENER.start()
+    # flush what is still queued when the process exits
+    atexit.register(_LISTENER.stop)
+    return _LISTENER
+
+
+def restart_after_fork():
+    """fork 出來的子 process 沒有 listener thread，重新啟動一個 (serve.py 的 worker 使用)"""
+    global _LISTENER
+    if _LISTENER is None:
+        return
+    _LISTENER = logging.handlers.QueueListener(_LISTENER.queue, *_LISTENER.handlers,
+                                               respect_handler_level=True)
+    _LISTENER.start()
+    atexit.register(_LISTENER.stop)
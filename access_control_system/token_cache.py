@@ -0,0 +1,177 @@
+# token_cache.py
+# in-process cache for access token validation: (user_id, access_token) -> created_at
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    """
+    有上限的 TTL + LRU cache
+    - max_size: 最多保存幾筆，超過時淘汰最久沒用到的
+    - ttl: 每筆最多信任幾秒，過了就重新查資料庫
+    token 更新 (refreshToken / login) 時要呼叫 invalidate_user()，
+    再用 put() 寫入新的 token (write-through)。
+    - max_staleness: 設定時，超過這麼多秒沒有 mark_synced() (其他 process 的 token 異動
+      沒有同步進來) 就不使用 cache，每次都查資料庫 (見 TokenInvalidationFeed)
+    """
+
+    def __init__(self, max_size=10000, ttl=300, max_staleness=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_staleness = max_staleness
+        self.synced_at = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (user_id, token) -> (created_at, cached_at)
+        self._tokens_by_user = {}      # user_id -> set of cached tokens
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, user_id, access_token):
+        """回傳 token 的 created_at，cache 沒有時回傳 None"""
+        key = (user_id, access_token)
+        now = time.time()
+        if self.max_staleness is not None and (
+                self.synced_at is None or now - self.synced_at > self.max_staleness):
+            # tokens rotated by other processes may not have reached this cache
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            created_at, cached_at = entry
+            if now - cached_at > self.ttl:
+                self._remove_locked(key)
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return created_at
+
+    def put(self, user_id, access_token, created_at):
+        key = (user_id, access_token)
+        with self._lock:
+            self._entries[key] = (created_at, time.time())
+            self._entries.move_to_end(key)
+            self._tokens_by_user.setdefault(user_id, set()).add(access_token)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove_locked(oldest)
+
+    def invalidate_user(self, user_id):
+        """刪掉該使用者所有已快取的 token"""
+        with self._lock:
+            for token in self._tokens_by_user.pop(user_id, set()):
+                self._entries.pop((user_id, token), None)
+
+    def invalidate_stale(self, rotations):
+        """
+        rotations: [(user_id, 目前有效的 access_token), ...]
+        移除這些使用者其他 (已被換掉) 的 token，目前的 token 保留
+        """
+        with self._lock:
+            for user_id, access_token in rotations:
+                for token in list(self._tokens_by_user.get(user_id, ())):
+                    if token != access_token:
+                        self._remove_locked((user_id, token))
+
+    def mark_synced(self, at=None):
+        self.synced_at = at or time.time()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'synced_at': self.synced_at,
+                'hits': self._hits,
+                'misses': self._misses,
+            }
+
+    def _remove_locked(self, key):
+        self._entries.pop(key, None)
+        user_id, token = key
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+
+# every token change (refresh, login) sets Author.created_at to the current time
+ROTATIONS_QUERY = "SELECT user_id, access_token, created_at FROM Author WHERE created_at > %s"
+
+
+class TokenInvalidationFeed:
+    """
+    每個 process (gunicorn worker、async_api.py) 各有一份 TokenCache，
+    換 token 時 invalidate_user() 只清得到自己那一份。
+    這裡每 interval 秒查一次 created_at 變新的 Author，把其他 process 換掉的舊 token 移除；
+    查詢成功才 mark_synced()，所以資料庫查不到時 cache 會在 max_staleness 秒後停用。
+    skew: 容許各台主機時鐘的誤差 (created_at 由寫入的 process 產生)
+    """
+
+    def __init__(self, cache, interval=1, skew=30):
+        self.cache = cache
+        self.interval = interval
+        self.skew = skew
+        self.since = time.time()
+        self.errors = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def query_params(self):
+        return (self.since - self.skew,)
+
+    def apply(self, rows, started_at):
+        """rows: ROTATIONS_QUERY 的結果；started_at: 送出查詢前的時間"""
+        self.cache.invalidate_stale([(row[0], row[1]) for row in rows])
+        for row in rows:
+            self.since = max(self.since, row[2])
+        self.cache.mark_synced(started_at)
+
+    def poll(self, getconn):
+        started_at = time.time()
+        conn = getconn()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(ROTATIONS_QUERY, self.query_params())
+                rows = cursor.fetchall()
+            conn.commit()
+        finally:
+            conn.close()
+        self.apply(rows, started_at)
+
+    def start(self, getconn):
+        """背景 thread 每 interval 秒 poll 一次 (重複呼叫沒有影響)"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(getconn,), name='token-invalidation', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, getconn):
+        while not self._stop.is_set():
+            try:
+                self.poll(getconn)
+            except Exception:
+                self.errors += 1
+            self._stop.wait(self.interval)
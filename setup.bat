@@ -1,7 +1,7 @@
 chcp 65001
 python ./access_control_system/setup.py
-python ./access_control_system/create_database.py
-start cmd /k "python ./access_control_system/api.py"
+python ./access_control_system/create_database.py --seed
+start cmd /k "python ./access_control_system/serve.py --threads 16"
 start cmd /k "timeout 5&&python ./access_control_system/access_control_system.py"
 start cmd /k "timeout 5&&python ./access_control_system/salary.py"
 pause
\ No newline at end of file
@@ -0,0 +1,6 @@
+# the modules under access_control_system import each other as top-level scripts
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                                'access_control_system'))
@@ -0,0 +1,93 @@
+import pytest
+import api
+
+
+class Worker:
+    # stands in for the background workers started by the first request
+    def start(self, *args):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(api, '_WORKER_READY', True)
+    for name in ('REPLICATION', 'FAILOVER', 'TOKEN_FEED', 'ORG'):
+        monkeypatch.setattr(api, name, Worker())
+    monkeypatch.setattr(api, 'PARTITIONS', None)
+    monkeypatch.setattr(api, 'SHARED_METRICS', None)
+    return api.app.test_client()
+
+
+def test_record_logs_falls_back_to_backup(client, monkeypatch):
+    def main_down():
+        raise api.psycopg2.OperationalError('main is down')
+
+    backup = FakeConnection()
+    written = []
+    monkeypatch.setattr(api, 'get_db_connection', main_down)
+    monkeypatch.setattr(api, 'get_backup_db_connection', lambda: backup)
+    monkeypatch.setattr(api, 'insert_batch_logs', lambda conn, rows: written.append((conn, rows)))
+
+    logs = [{'user_id': 'amy', 'type': 'late', 'time': 100.0, 'duration': 5}]
+    response = client.post('/record/logs', json={'logs': logs})
+    assert response.status_code == 201
+    assert response.get_json() == {'status': 'success', 'inserted': 1}
+    assert written == [(backup, [('amy', 'late', 100.0, 5)])]
+    assert backup.closed
+
+
+def test_record_logs_rejects_bad_entries(client):
+    response = client.post('/record/logs', json={'logs': [{'user_id': 'amy'}]})
+    assert response.status_code == 400
+
+
+class PayrollCursor:
+    def __init__(self, overlaps):
+        self.overlaps = overlaps
+        self.queries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        self.queries.append(query)
+
+    def fetchone(self):
+        return (0.0,)  # the window was claimed
+
+    def fetchall(self):
+        return self.overlaps
+
+
+class PayrollConnection(FakeConnection):
+    def __init__(self, overlaps):
+        super().__init__()
+        self.cur = PayrollCursor(overlaps)
+        self.rolled_back = False
+
+    def cursor(self):
+        return self.cur
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def test_payroll_rejects_overlapping_window(client, monkeypatch):
+    conn = PayrollConnection([(50.0, 150.0)])
+    monkeypatch.setattr(api, 'get_db_connection', lambda: conn)
+    response = client.post('/salary/payroll', json={'start_time': 100, 'end_time': 200})
+    assert response.status_code == 409
+    assert response.get_json()['overlaps'] == [{'start_time': 50.0, 'end_time': 150.0}]
+    assert conn.rolled_back
+    assert api.PAYROLL_ADJUSTMENT_QUERY not in conn.cur.queries
@@ -0,0 +1,37 @@
+import datetime
+from attendance import day_runs, day_start, full_day_range, validate_batch_records
+
+
+def test_validate_batch_records():
+    records = [
+        {'user_id': 'amy', 'type': 'i', 'time': 100},
+        'not a record',
+        {'user_id': 'amy', 'type': 'x', 'time': 100},
+        {'user_id': 'amy', 'type': 'o', 'time': True},
+        {'user_id': 'bob', 'type': 'o', 'time': 200.5},
+        {'user_id': 'amy', 'type': 'o'},
+        {'user_id': 7, 'type': 'o', 'time': 1},
+    ]
+    rows, statuses = validate_batch_records(records, {'amy'})
+    assert rows == [(0, 'amy', 'i', 100.0)]
+    assert [s.get('status') for s in statuses] == [
+        None, 'invalid', 'invalid', 'invalid', 'forbidden', 'invalid', 'invalid']
+    assert [s['index'] for s in statuses] == list(range(len(records)))
+
+
+def test_day_runs_groups_consecutive_local_days():
+    # 16:00 UTC is already the next day in UTC+8
+    day = 86400
+    times = [0, 16 * 3600, 3 * day, day + 100]
+    assert day_runs(times) == [
+        (datetime.date(1970, 1, 1), datetime.date(1970, 1, 3)),
+        (datetime.date(1970, 1, 4), datetime.date(1970, 1, 5)),
+    ]
+    assert day_runs([]) == []
+
+
+def test_full_day_range_skips_partial_days():
+    first_day, last_day, full_start, full_end = full_day_range(
+        day_start(datetime.date(2025, 6, 1)) + 60, day_start(datetime.date(2025, 6, 4)) + 60)
+    assert (first_day, last_day) == (datetime.date(2025, 6, 2), datetime.date(2025, 6, 3))
+    assert (full_start, full_end) == (day_start(first_day), day_start(datetime.date(2025, 6, 4)))
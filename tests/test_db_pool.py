@@ -0,0 +1,70 @@
+import time
+import pytest
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.fail_rollback = False
+
+    def rollback(self):
+        if self.fail_rollback:
+            raise RuntimeError('server closed the connection')
+
+    def close(self):
+        self.closed = 1
+
+    def cursor(self):
+        raise AssertionError('health check not expected')
+
+
+def make_pool(**kwargs):
+    pool = ConnectionPool('test', 'localhost', 5433, 'yugabyte', 'yugabyte', '', **kwargs)
+    pool._connect = FakeConnection
+    return pool
+
+
+def test_checkout_timeout():
+    pool = make_pool(maxconn=1, timeout=0.05)
+    conn = pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()['timeouts'] == 1
+    conn.close()
+    pool.getconn().close()
+
+
+def test_idle_connections_are_reaped_down_to_minconn():
+    pool = make_pool(minconn=1, maxconn=3, max_idle=60)
+    conns = [pool.getconn() for _ in range(3)]
+    raws = [conn.raw for conn in conns]
+    for conn in conns:
+        conn.close()
+    assert pool.stats()['idle'] == 3
+
+    # pretend every idle connection was last used long ago
+    pool._idle = [(raw, time.time() - 120) for raw, _ in pool._idle]
+    assert pool.reap_idle() == 2
+    stats = pool.stats()
+    assert (stats['size'], stats['idle'], stats['reaped']) == (1, 1, 2)
+    assert sum(raw.closed for raw in raws) == 2
+
+
+def test_broken_connection_is_discarded():
+    pool = make_pool(maxconn=2)
+    broken = []
+    pool.on_broken = broken.append
+
+    conn = pool.getconn()
+    raw = conn.raw
+    raw.closed = 2  # server went away while checked out
+    conn.close()
+    conn = pool.getconn()
+    assert conn.raw is not raw
+    conn.raw.fail_rollback = True
+    conn.close()
+
+    stats = pool.stats()
+    assert (stats['size'], stats['idle'], stats['discarded']) == (0, 0, 2)
+    assert len(broken) == 2
@@ -0,0 +1,52 @@
+import psycopg2
+import pytest
+from db_pool import PoolTimeout
+from failover import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, FailoverController
+
+
+def test_opens_after_threshold_and_closes_on_success():
+    breaker = CircuitBreaker('main', failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.stats()['open_count'] == 1
+
+
+def test_half_open_allows_one_trial():
+    breaker = CircuitBreaker('main', failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.release_trial()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.stats()['open_count'] == 2
+
+
+class FailingPool:
+    def __init__(self, error):
+        self.error = error
+
+    def getconn(self):
+        raise self.error
+
+
+def test_connect_errors_count_as_failures():
+    controller = FailoverController(
+        {'main': FailingPool(psycopg2.OperationalError('refused'))}, failure_threshold=1)
+    with pytest.raises(psycopg2.OperationalError):
+        controller.getconn('main')
+    assert controller.breakers['main'].stats()['state'] == OPEN
+
+
+def test_pool_timeout_leaves_breaker_alone():
+    controller = FailoverController(
+        {'main': FailingPool(PoolTimeout('busy'))}, failure_threshold=1)
+    with pytest.raises(PoolTimeout):
+        controller.getconn('main')
+    assert controller.breakers['main'].stats()['state'] == CLOSED
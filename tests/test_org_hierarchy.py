@@ -0,0 +1,40 @@
+from org_hierarchy import OrgHierarchy, OrgSnapshot, fingerprint
+
+EMPLOYEES = [('amy', 'boss'), ('bob', 'boss'), ('carl', 'amy'), ('dora', 'carl')]
+BOSSES = ['boss', 'amy']
+
+
+def snapshot(employees=EMPLOYEES, bosses=BOSSES):
+    return OrgSnapshot(employees, bosses, 1, fingerprint(employees, bosses))
+
+
+def test_direct_reports():
+    assert snapshot().subordinates('boss', 1) == ('amy', 'bob')
+    assert snapshot().subordinates('bob', 1) == ()
+
+
+def test_depth_limits_levels():
+    assert snapshot().subordinates('boss', 2) == ('amy', 'bob', 'carl')
+    assert snapshot().subordinates('boss', 0) == ('amy', 'bob', 'carl', 'dora')
+
+
+def test_reporting_loop_terminates():
+    looped = snapshot([('a', 'b'), ('b', 'a')], ['a', 'b'])
+    assert looped.subordinates('a', 0) == ('b',)
+
+
+def test_fingerprint_ignores_order():
+    assert fingerprint(EMPLOYEES, BOSSES) == fingerprint(EMPLOYEES[::-1], BOSSES[::-1])
+
+
+def test_reload_keeps_adds_made_during_fetch():
+    org = OrgHierarchy({})
+
+    def fetch():
+        # registered by this process while the rows were being read
+        org.add_employee('eve', 'boss')
+        return list(EMPLOYEES), list(BOSSES)
+
+    org.fetch = fetch
+    org.reload()
+    assert 'eve' in org.subordinates('boss')
@@ -0,0 +1,43 @@
+import pytest
+from pagination import (MAX_PAGE_SIZE, decode_cursor, encode_cursor, merge_archived,
+                        parse_page_args)
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(('amy', 'i', 1748134004.419717))
+    assert decode_cursor(cursor) == (1748134004.419717, 'amy', 'i')
+
+
+@pytest.mark.parametrize('cursor', ['not base64!', encode_cursor(('amy', 'i', 'noon')),
+                                    'WzEsMl0='])  # [1, 2]
+def test_bad_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_page_args():
+    limit, after, stream = parse_page_args({'limit': MAX_PAGE_SIZE + 1,
+                                            'cursor': encode_cursor(('amy', 'o', 5.0))})
+    assert limit == MAX_PAGE_SIZE
+    assert after == (5.0, 'amy', 'o')
+    assert stream is False
+
+
+@pytest.mark.parametrize('limit', [0, -1, True, '10'])
+def test_bad_limit(limit):
+    with pytest.raises(ValueError):
+        parse_page_args({'limit': limit})
+
+
+def test_merge_archived_keeps_keyset_order():
+    rows = [('amy', 'o', 300.0), ('bob', 'i', 200.0)]
+    archived = [('amy', 'i', 100.0, 'extra'), ('bob', 'i', 200.0), ('amy', 'o', 250.0)]
+    merged = list(merge_archived(iter(rows), archived))
+    assert merged == [('amy', 'o', 300.0), ('amy', 'o', 250.0), ('bob', 'i', 200.0),
+                      ('amy', 'i', 100.0)]
+
+
+def test_merge_archived_skips_rows_before_cursor():
+    archived = [('amy', 'o', 250.0), ('amy', 'i', 100.0)]
+    after = decode_cursor(encode_cursor(('amy', 'o', 250.0)))
+    assert list(merge_archived([], archived, after)) == [('amy', 'i', 100.0)]
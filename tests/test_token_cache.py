@@ -0,0 +1,71 @@
+import time
+from token_cache import TokenCache, TokenInvalidationFeed
+
+
+def test_put_get_and_lru_eviction():
+    cache = TokenCache(max_size=2, ttl=60)
+    cache.put('a', 't1', 1.0)
+    cache.put('b', 't2', 2.0)
+    assert cache.get('a', 't1') == 1.0  # a is now the most recently used
+    cache.put('c', 't3', 3.0)
+    assert cache.get('b', 't2') is None
+    assert cache.get('a', 't1') == 1.0
+    assert cache.get('c', 't3') == 3.0
+
+
+def test_ttl_expires_entries():
+    cache = TokenCache(ttl=0.01)
+    cache.put('a', 't1', 1.0)
+    time.sleep(0.02)
+    assert cache.get('a', 't1') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_invalidate_user():
+    cache = TokenCache()
+    cache.put('a', 't1', 1.0)
+    cache.put('a', 't2', 2.0)
+    cache.put('b', 't3', 3.0)
+    cache.invalidate_user('a')
+    assert cache.get('a', 't1') is None
+    assert cache.get('a', 't2') is None
+    assert cache.get('b', 't3') == 3.0
+
+
+def test_invalidate_stale_keeps_current_token():
+    cache = TokenCache()
+    cache.put('a', 'old', 1.0)
+    cache.put('a', 'new', 2.0)
+    cache.invalidate_stale([('a', 'new'), ('unknown', 'x')])
+    assert cache.get('a', 'old') is None
+    assert cache.get('a', 'new') == 2.0
+
+
+def test_max_staleness_bypasses_cache_until_synced():
+    cache = TokenCache(max_staleness=5)
+    cache.put('a', 't1', 1.0)
+    assert cache.get('a', 't1') is None
+    cache.mark_synced()
+    assert cache.get('a', 't1') == 1.0
+    cache.mark_synced(time.time() - 10)
+    assert cache.get('a', 't1') is None
+
+
+def test_feed_apply_invalidates_and_advances():
+    cache = TokenCache(max_staleness=5)
+    feed = TokenInvalidationFeed(cache, skew=30)
+    cache.put('a', 'old', 1.0)
+    newest = feed.since + 100
+    started_at = time.time()
+    feed.apply([('a', 'new', newest)], started_at)
+    assert cache.synced_at == started_at
+    assert cache.get('a', 'old') is None
+    assert feed.since == newest
+    assert feed.query_params() == (newest - 30,)
+
+
+def test_feed_since_never_moves_back():
+    feed = TokenInvalidationFeed(TokenCache())
+    since = feed.since
+    feed.apply([('a', 't', since - 1000)], time.time())
+    assert feed.since == since